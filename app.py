@@ -1,16 +1,78 @@
-from flask import Flask, request, jsonify, abort
-from flask_migrate import Migrate
-from models.db import db, setup_db
+from flask import (Flask, Blueprint, request, jsonify, abort, Response,
+                   stream_with_context, current_app, url_for)
+from flask.cli import with_appcontext
+from flask_migrate import Migrate, stamp
+import click
+import os
+from models.db import db, setup_db, database_path
 from models.publication import Publication
 from models.feedback import Feedback
 from models.role import Role
-from models.errors import PublicationValidationError, WorkflowError, AuthError
-from auth import requires_auth, encode_jwt, randomString, get_hash
+from models.events import event_broker
+from models.search import (search_available, search_feedbacks,
+                           search_publications)
+from models.stats import get_stats
+from models.history import HistoryEntry
+from models.changes import get_changes
+from models.errors import (PublicationValidationError, RoleValidationError,
+                           WorkflowError, AuthError)
+from auth import (requires_auth, randomString, get_hash, token_cache,
+                  issued_tokens, issue_tokens, refresh_access_token)
+from cache import response_cache
+from serializers import PublicationSerializer, serialize_roles, json_response
+from jobs import Job, job_queue
+from metrics import metrics, start_request, finish_request
 from collections.abc import Iterable
+import json
+import csv
+import io
+from datetime import datetime, timedelta
+from sqlalchemy import text, or_
+from sqlalchemy.orm import load_only, joinedload, selectinload
+from sqlalchemy.exc import OperationalError, IntegrityError
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+
+api = Blueprint('api', __name__)
+migrate = Migrate()
+migrations_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'migrations')
+
+# default and maximum page size of paginated list endpoints
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# number of publications inserted per transaction by bulk imports
+BULK_BATCH_SIZE = 500
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson')
+# rows fetched per round trip and approximate size of streamed chunks
+EXPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_SIZE = 64 * 1024
+EXPORT_MIMETYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+# seconds between keepalive comments of idle event streams
+# and milliseconds a client waits before reconnecting
+EVENTS_KEEPALIVE = int(os.environ.get('EVENTS_KEEPALIVE', 15))
+EVENTS_RETRY = 3000
+# default number of search results
+SEARCH_LIMIT = 20
+# invocation ids and DOIs resolved by one POST /publications/resolve
+# and publications resumed by one POST /publications/resume
+MAX_RESOLVE_SIZE = 500
+MAX_RESUME_SIZE = 500
+# publications changed per transaction by batch publish/export jobs
+JOB_CHUNK_SIZE = 100
+# days the history is kept by flask prune-history
+HISTORY_RETENTION_DAYS = int(os.environ.get('HISTORY_RETENTION_DAYS', 365))
+
+
+@api.before_app_request
+def before_request():
+    start_request()
+
+
+@api.after_app_request
+def after_request(response):
+    return finish_request(response)
 
-app = Flask(__name__)
-setup_db(app)
-migrate = Migrate(app, db)
 
 def check_request(request):
     ### checks, if request entails json-body ###
@@ -18,43 +80,536 @@ def check_request(request):
         abort(400, 'No JSON-Body')
 
 
-@app.route('/roles/<string:pid>/token', methods=["GET"])
-def get_token(pid):
-    person = Role.query.filter_by(identifier=get_hash(pid)).first()
-    if person is None:
+def get_int_arg(name, minimum=None):
+    ### reads an optional integer query parameter, aborts if malformed ###
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        abort(400, 'Parameter {} is not an integer'.format(name))
+    if minimum is not None and value < minimum:
+        abort(400, 'Parameter {} is too small'.format(name))
+    return value
+
+
+def get_date_arg(name):
+    ###
+    # reads an optional date query parameter,
+    # accepts ISO dates (2020-08-29) and the output format (29.08.2020)
+    ###
+    value = request.args.get(name)
+    if value is None:
+        return None
+    for date_format in ('%Y-%m-%d', '%d.%m.%Y'):
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            pass
+    abort(400, 'Parameter {} is not a valid date'.format(name))
+
+
+def get_fields_arg(allowed):
+    ### reads the optional comma separated fields projection ###
+    value = request.args.get('fields')
+    if value is None:
+        return None
+    fields = [f.strip() for f in value.split(',') if f.strip() != '']
+    if len(fields) == 0 or any(f not in allowed for f in fields):
+        abort(400, 'Parameter fields is invalid')
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    return fields
+
+
+def get_feedback_with_relations(fid):
+    ###
+    # loads a feedback together with its publication and author,
+    # which are needed for the ownership check and the response
+    ###
+    return Feedback.query.options(
+        joinedload(Feedback.publication),
+        joinedload(Feedback.author).joinedload(Role.memberships)
+    ).get(fid)
+
+
+def get_embed_arg(allowed):
+    ### reads the optional comma separated list of relations to embed ###
+    value = request.args.get('embed')
+    if value is None:
+        return []
+    embed = [e.strip() for e in value.split(',') if e.strip() != '']
+    if any(e not in allowed for e in embed):
+        abort(400, 'Parameter embed is invalid')
+    return embed
+
+
+def publication_from_json(data):
+    ###
+    # creates a new publication from its JSON representation in a request
+    # raises a PublicationValidationError if required fields are missing
+    # or the invocationId is not a string
+    ###
+    if not isinstance(data, dict):
+        raise PublicationValidationError('Item is not a JSON object', 400)
+    new_datasetId = data.get("datasetId")
+    new_invocationId = data.get('invocationId')
+    new_displayName = data.get('datasetDisplayName')
+    new_doi = data.get('datasetGlobalId')
+
+    missing = []
+
+    if new_datasetId is None:
+        missing.append("datasetId")
+    if new_invocationId is None:
+        missing.append("invocationId")
+    if new_displayName is None:
+        missing.append("datasetDisplayName")
+    if new_doi is None:
+        missing.append("datasetGlobalId")
+
+    if len(missing) > 0:
+        raise PublicationValidationError(
+            'The following field{} missing: {}'.format(
+                ' is' if len(missing) == 1 else 's are',
+                ", ".join(missing)),
+            400)
+    if not isinstance(new_invocationId, str):
+        raise PublicationValidationError('invocationId is not a string', 400)
+
+    return Publication(doi=new_doi,
+                       invocId=new_invocationId,
+                       databaseId=new_datasetId,
+                       displayName=new_displayName)
+
+
+def read_bulk_items():
+    ###
+    # yields the items of a JSON array body or of an NDJSON body
+    # (one JSON object per line), NDJSON is read line by line
+    ###
+    if request.mimetype in NDJSON_MIMETYPES:
+        for line in request.stream:
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            try:
+                yield json.loads(line.decode('utf-8'))
+            except ValueError:
+                yield line
+    else:
+        items = request.get_json(silent=True)
+        if not isinstance(items, list):
+            abort(400, 'No JSON-Array')
+        for item in items:
+            yield item
+
+
+def insert_publication_batch(batch):
+    ###
+    # inserts a batch of (result, publication) pairs in one transaction
+    # and fills in the results, publications whose invocation id
+    # already exists are rejected with 409
+    ###
+    pending = []
+    invocation_ids = [pub.preInvocId for result, pub in batch]
+    existing = set(row[0] for row in db.session.query(
+        Publication.preInvocId).filter(
+            Publication.preInvocId.in_(invocation_ids)))
+    for result, pub in batch:
+        if pub.preInvocId in existing:
+            result.update({'success': False,
+                           'error': 409,
+                           'message':
+                               'Publication with invocationId {} '
+                               'already exists'.format(pub.preInvocId)})
+            continue
+        existing.add(pub.preInvocId)
+        pub.refresh_status()
+        pending.append((result, pub))
+
+    insert_batch(pending)
+
+
+def insert_batch(pending):
+    ###
+    # inserts a batch of (result, model) pairs in one transaction
+    # and sets success and the created id in the results,
+    # if the transaction fails, the models are inserted one by one
+    # to find the failing ones
+    ###
+    try:
+        db.session.add_all([model for result, model in pending])
+        db.session.flush()
+        created = [model.id for result, model in pending]
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        for result, model in pending:
+            try:
+                model.insert()
+                result.update({'success': True, 'created': model.id})
+            except Exception as e:
+                db.session.rollback()
+                result.update({'success': False,
+                               'error': 422,
+                               'message': 'request not processable: '
+                                          '{}'.format(e)})
+        return
+    for (result, model), mid in zip(pending, created):
+        result.update({'success': True, 'created': mid})
+
+
+def role_from_json(data):
+    ###
+    # creates a new user with all its roles from the JSON of a request
+    # returns the user and the identifier to hand out to the user
+    # raises a RoleValidationError if the name is missing
+    ###
+    if not isinstance(data, dict):
+        raise RoleValidationError('Item is not a JSON object', 400)
+    new_name = data.get('name')
+    new_email = data.get('email')
+    if new_email is None:
+        new_email = ''
+    new_roles = data.get('roles')
+
+    if new_name is None:
+        raise RoleValidationError('The following field is missing: name',
+                                  400)
+    person = Role(new_name, new_email)
+    identifier = randomString(24)
+    person.identifier = get_hash(identifier)
+    if new_roles is not None and isinstance(new_roles, Iterable):
+        if isinstance(new_roles, str):
+            new_roles = [new_roles]
+        if not all(isinstance(role, str) for role in new_roles):
+            raise RoleValidationError('Roles are not a list of strings', 400)
+        person.add_roles(new_roles)
+    return person, identifier
+
+
+def insert_role_batch(batch):
+    ###
+    # inserts a batch of (result, user, identifier) in one transaction
+    # and adds the user and its identifier to the successful results,
+    # the users are formatted after the insert, which gave them their ids
+    ###
+    insert_batch([(result, person) for result, person, identifier in batch])
+    for result, person, identifier in batch:
+        if result['success']:
+            result['person'] = person.format()
+            result['identifier'] = identifier
+
+
+def get_bool_arg(name):
+    ### reads an optional boolean query parameter (true/false) ###
+    value = request.args.get(name)
+    if value is None:
+        return None
+    if value.lower() in ('true', '1'):
+        return True
+    if value.lower() in ('false', '0'):
+        return False
+    abort(400, 'Parameter {} is not a boolean'.format(name))
+
+
+def conditional_response(etag, build):
+    ###
+    # answers a read with 304 Not Modified, if the client already has the
+    # representation with this strong ETag, otherwise with the cached or
+    # freshly serialized JSON body
+    # @INPUTS
+    #    etag: ETag derived from the version of the publication
+    #    build: function returning the ETag of the data it has loaded
+    #           and the response dict
+    ###
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    body = response_cache.get(etag)
+    if body is None:
+        ### the data may have changed since the version was read ###
+        etag, payload = build()
+        body = json_response(payload).get_data()
+        response_cache.put(etag, body)
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response
+
+
+def publication_response(pid, version):
+    ### the cached representation of GET /publications/<pid> ###
+    def build():
+        publication = Publication.query.get(pid)
+        if publication is None:
+            abort(404)
+        response = {'success': True,
+                    'publication': publication.format()
+                    }
+        return ('publication-{}-{}'.format(pid, publication.version),
+                response)
+
+    return conditional_response('publication-{}-{}'.format(pid, version),
+                                build)
+
+
+def stream_export(records, columns, export_format):
+    ###
+    # streams an iterable of flat dicts as NDJSON or CSV,
+    # collecting the rows into chunks of about EXPORT_CHUNK_SIZE bytes
+    ###
+    def generate():
+        buffer = io.StringIO()
+        if export_format == 'csv':
+            writer = csv.DictWriter(buffer, fieldnames=columns,
+                                    extrasaction='ignore')
+            writer.writeheader()
+            write = writer.writerow
+        else:
+            def write(record):
+                buffer.write(json.dumps(record))
+                buffer.write('\n')
+        for record in records:
+            write(record)
+            if buffer.tell() >= EXPORT_CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    return Response(stream_with_context(generate()),
+                    mimetype=EXPORT_MIMETYPES[export_format])
+
+
+def stream_events(publication_id=None):
+    ###
+    # streams the workflow events as server-sent events,
+    # a client reconnecting with Last-Event-ID gets the events it missed
+    # @INPUTS
+    #    publication_id: only stream the events of this publication
+    ###
+    last_event_id = request.headers.get('Last-Event-ID')
+    if last_event_id is not None:
+        try:
+            last_event_id = int(last_event_id)
+        except ValueError:
+            abort(400, 'Header Last-Event-ID is invalid')
+    subscriber = event_broker.subscribe(publication_id, last_event_id)
+
+    def generate():
+        yield 'retry: {}\n\n'.format(EVENTS_RETRY)
+        ### a client that does not keep up is disconnected and resumes ###
+        while not subscriber.overflowed:
+            event = subscriber.get(EVENTS_KEEPALIVE)
+            if event is None:
+                yield ': keepalive\n\n'
+                continue
+            yield 'id: {}\nevent: {}\ndata: {}\n\n'.format(
+                event['id'], event['event'], json.dumps(event))
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.call_on_close(lambda: event_broker.unsubscribe(subscriber))
+    return response
+
+
+# check and change of the workflow transitions of batch jobs
+TRANSITIONS = {
+    'publish': (Publication.check_publishable, Publication.set_published),
+    'export': (Publication.check_exportable, Publication.set_exported)
+}
+
+
+def read_publication_ids():
+    ### reads the JSON array of publication ids of a batch request ###
+    check_request(request)
+    ids = request.json
+    if (not isinstance(ids, list) or len(ids) == 0 or
+            any(type(pid) is not int for pid in ids)):
+        abort(400, 'Expected a JSON array of publication ids')
+    ### duplicates are processed once ###
+    return list(dict.fromkeys(ids))
+
+
+def read_invocation_id(item):
+    ### returns the non-empty invocationId of a JSON object or None ###
+    invoc_id = item.get('invocationId') if isinstance(item, dict) else None
+    if not isinstance(invoc_id, str) or invoc_id == '':
+        return None
+    return invoc_id
+
+
+def run_transition(job, app, ids, transition):
+    ###
+    # applies a workflow transition to the publications in chunked
+    # transactions and adds one result per publication to the job,
+    # publications violating the workflow get the WorkflowError
+    ###
+    check, change = TRANSITIONS[transition]
+    with app.app_context():
+        for start in range(0, len(ids), JOB_CHUNK_SIZE):
+            chunk = ids[start:start + JOB_CHUNK_SIZE]
+            pubs = {pub.id: pub for pub in Publication.query.filter(
+                Publication.id.in_(chunk))}
+            results = []
+            for pid in chunk:
+                pub = pubs.get(pid)
+                if pub is None:
+                    results.append({'id': pid,
+                                    'success': False,
+                                    'error': 404,
+                                    'message': 'resource not found'})
+                    continue
+                try:
+                    check(pub)
+                except WorkflowError as e:
+                    results.append({'id': pid,
+                                    'success': False,
+                                    'error': e.status_code,
+                                    'message': e.error})
+                    continue
+                change(pub)
+                results.append({'id': pid,
+                                'success': True,
+                                'publication': pub.format()})
+            try:
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                for result in results:
+                    if result['success']:
+                        del result['publication']
+                        result.update({'success': False,
+                                       'error': 422,
+                                       'message': 'request not processable: '
+                                                  '{}'.format(e)})
+            job.add_results(results)
+
+
+def enqueue_transition(transition):
+    ###
+    # starts a job applying the transition to the posted publication ids
+    # and answers with 202 and the location of the job
+    ###
+    ids = read_publication_ids()
+    job = job_queue.submit(Job(transition, len(ids)), run_transition,
+                           current_app._get_current_object(), ids,
+                           transition)
+    response = jsonify({'success': True, 'job': job.format()})
+    response.status_code = 202
+    response.headers['Location'] = url_for('api.get_job', job_id=job.id)
+    return response
+
+
+def read_batch_items(is_valid):
+    ### reads the non-empty JSON array of a feedback batch request ###
+    items = request.get_json(silent=True)
+    if (not isinstance(items, list) or len(items) == 0 or
+            not all(is_valid(item) for item in items)):
+        abort(400, 'Expected a JSON array')
+    return items
+
+
+def get_feedbacks_for_batch(pid, ids):
+    ###
+    # loads the feedbacks of a batch request with their authors in one
+    # query and checks, that all of them belong to the publication
+    ###
+    feedbacks = Feedback.query.options(
+        joinedload(Feedback.author).joinedload(Role.memberships)
+    ).filter(Feedback.id.in_(ids)).all()
+    if len(feedbacks) != len(set(ids)):
         abort(404)
-    payload = {}
-    payload["roles"] = person.get_roles()
-    payload["name"] = person.name
-    payload["email"] = person.email
-    payload["id"] = person.id
-    response = {
-        'success': True,
-        'token': encode_jwt(payload)
-    }
+    if any(fb.publication_id != pid for fb in feedbacks):
+        abort(409)
+    by_id = {fb.id: fb for fb in feedbacks}
+    return {fid: by_id[fid] for fid in dict.fromkeys(ids)}
+
+
+def commit_batch():
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        abort(422, e)
+
+
+def filter_publications(query):
+    ###
+    # applies the status, databaseId, doi and date range filters
+    # of the query string to a publication query
+    ###
+    status = request.args.get('status')
+    if status is not None:
+        query = query.filter(Publication.status == status)
+    database_id = get_int_arg('databaseId')
+    if database_id is not None:
+        query = query.filter(Publication.databaseId == database_id)
+    doi = request.args.get('doi')
+    if doi is not None:
+        query = query.filter(Publication.doi == doi)
+    for name, column in (('published', Publication.published),
+                         ('exported', Publication.exported)):
+        date_from = get_date_arg('{}From'.format(name))
+        if date_from is not None:
+            query = query.filter(column >= date_from)
+        date_to = get_date_arg('{}To'.format(name))
+        if date_to is not None:
+            query = query.filter(column < date_to + timedelta(days=1))
+    return query
+
+
+@api.route('/roles/<string:pid>/token', methods=["GET"])
+def get_token(pid):
+    identifier = get_hash(pid)
+    ### a token issued before is reused while it lives long enough ###
+    issued = issued_tokens.get(identifier)
+    if issued is None:
+        person = Role.query.options(joinedload(Role.memberships)).filter_by(
+            identifier=identifier).first()
+        if person is None:
+            abort(404)
+        payload = {}
+        payload["roles"] = person.get_roles()
+        payload["name"] = person.name
+        payload["email"] = person.email
+        payload["id"] = person.id
+        issued = issue_tokens(payload)
+        issued_tokens.put(identifier, issued)
+    response = {'success': True}
+    response.update(issued)
+    return jsonify(response)
+
+
+@api.route('/auth/refresh', methods=['POST'])
+def refresh_token():
+    ### renews the access token without looking up the person ###
+    check_request(request)
+    if not isinstance(request.json, dict):
+        abort(400, 'Body must be an object')
+    token = request.json.get('refreshToken')
+    if not isinstance(token, str):
+        abort(400)
+    response = {'success': True}
+    response.update(refresh_access_token(token))
     return jsonify(response)
 
 
-@app.route('/roles', methods=['POST'])
+@api.route('/roles', methods=['POST'])
 @requires_auth('add:user')
 def add_user(payload):
     check_request(request)
-    new_name = request.json.get('name')
-    new_email = request.json.get('email')
-    if new_email is None:
-        new_email = ''
-    new_roles = request.json.get('roles')
-
-    if new_name is None:
+    try:
+        person, identifier = role_from_json(request.json)
+    except RoleValidationError:
         abort(400)
     try:
-        person = Role(new_name, new_email)
-        identifier = randomString(24)
-        person.identifier = get_hash(identifier)
+        ### the user and all roles in one transaction ###
         person.insert()
-        if new_roles is not None and isinstance(new_roles, Iterable):
-            for role in new_roles:
-                person.add_role(role)
     except Exception as e:
         abort(422, e)
     response = {
@@ -65,59 +620,252 @@ def add_user(payload):
     return jsonify(response)
 
 
-@app.route('/publications')
+@api.route('/roles', methods=['GET'])
+@requires_auth('get:roles')
+def get_users(payload):
+    ###
+    # lists the users, optionally only those with a role (?role=Curator),
+    # paginated by id like GET /publications if after or limit is given
+    ###
+    after = get_int_arg('after', 0)
+    limit = get_int_arg('limit', 1)
+    role = request.args.get('role')
+
+    if role is not None:
+        query = Role.with_role(role)
+    else:
+        query = Role.query
+    query = query.with_entities(Role.id, Role.name)
+
+    paginate = after is not None or limit is not None
+    if paginate:
+        limit = min(limit or PAGE_SIZE, MAX_PAGE_SIZE)
+        if after is not None:
+            query = query.filter(Role.id > after)
+        rows = query.order_by(Role.id).limit(limit + 1).all()
+        has_next = len(rows) > limit
+        rows = rows[:limit]
+    else:
+        rows = query.order_by(Role.id).all()
+
+    response = {'success': True}
+    if paginate:
+        response['next'] = rows[-1][0] if has_next else None
+    return json_response(response, {'persons': serialize_roles(rows)})
+
+
+@api.route('/roles/bulk', methods=['POST'])
+@requires_auth('add:user')
+def add_users_bulk(payload):
+    ###
+    # adds many users from a JSON array or an NDJSON body,
+    # inserting them in batched transactions
+    # returns one result per user with the identifier to hand out
+    ###
+    results = []
+    batch = []
+    for index, item in enumerate(read_bulk_items()):
+        result = {'index': index}
+        results.append(result)
+        try:
+            person, identifier = role_from_json(item)
+        except RoleValidationError as e:
+            result.update({'success': False,
+                           'error': e.status_code,
+                           'message': e.error})
+            continue
+        batch.append((result, person, identifier))
+        if len(batch) >= BULK_BATCH_SIZE:
+            insert_role_batch(batch)
+            batch = []
+    if len(batch) > 0:
+        insert_role_batch(batch)
+
+    created = len([r for r in results if r['success']])
+    response = {
+        'success': True,
+        'created': created,
+        'failed': len(results) - created,
+        'results': results
+    }
+    return jsonify(response)
+
+
+@api.route('/auth/cache', methods=['GET'])
+@requires_auth('get:authcache')
+def get_auth_cache_stats(payload):
+    response = {
+        'success': True,
+        'cache': token_cache.stats()
+    }
+    return jsonify(response)
+
+
+@api.route('/publications')
 @requires_auth('get:publications')
 def get_all_publications(payload):
-    publications = Publication.query.all()
-    response = {'success': True,
-                'publications': [p.format() for p in publications]
-                }
-    return jsonify(response)
+    fields = get_fields_arg(Publication.json_fields)
+    after = get_int_arg('after', 0)
+    limit = get_int_arg('limit', 1)
+
+    ### only the serialized columns, no Publication instances ###
+    serializer = PublicationSerializer(fields)
+    query = filter_publications(Publication.query).with_entities(
+        *serializer.columns())
+
+    paginate = after is not None or limit is not None
+    if paginate:
+        ### keyset pagination: ids are strictly increasing ###
+        limit = min(limit or PAGE_SIZE, MAX_PAGE_SIZE)
+        if after is not None:
+            query = query.filter(Publication.id > after)
+        rows = query.order_by(Publication.id).limit(limit + 1).all()
+        has_next = len(rows) > limit
+        rows = rows[:limit]
+    else:
+        rows = query.all()
+
+    response = {'success': True}
+    if paginate:
+        response['next'] = rows[-1][0] if has_next else None
+    return json_response(response, {'publications': serializer.array(rows)})
+
+
+@api.route('/publications/export.<string:export_format>', methods=['GET'])
+@requires_auth('get:publications')
+def export_publications(payload, export_format):
+    ###
+    # streams all publications matching the filters of GET /publications
+    # ordered by id, reading them from the database in batches
+    ###
+    if export_format not in EXPORT_MIMETYPES:
+        abort(404)
+    fields = get_fields_arg(Publication.json_fields)
+    if fields is None:
+        fields = list(Publication.json_fields)
+    query = filter_publications(Publication.query).options(
+        load_only(*Publication.load_attributes(fields))
+    ).order_by(Publication.id).yield_per(EXPORT_BATCH_SIZE)
+    records = (p.format(fields) for p in query)
+    return stream_export(records, fields, export_format)
 
 
-@app.route('/publications/<int:pub_id>', methods=["GET"])
+@api.route('/feedbacks/export.<string:export_format>', methods=['GET'])
+@requires_auth('get:publications')
+def export_feedbacks(payload, export_format):
+    ###
+    # streams the feedbacks of all publications matching the filters
+    # of GET /publications, optionally only open or done feedbacks
+    ###
+    if export_format not in EXPORT_MIMETYPES:
+        abort(404)
+    query = filter_publications(Feedback.query.join(Feedback.publication))
+    done = get_bool_arg('done')
+    if done is True:
+        query = query.filter(Feedback.done == db.true())
+    elif done is False:
+        query = query.filter(db.or_(Feedback.done.is_(None),
+                                    Feedback.done == db.false()))
+    query = query.options(
+        joinedload(Feedback.author).selectinload(Role.memberships)
+    ).order_by(
+        Feedback.id).yield_per(EXPORT_BATCH_SIZE)
+    columns = ['id', 'publicationId', 'text', 'done', 'author']
+    if export_format == 'csv':
+        records = ({'id': f.id,
+                    'publicationId': f.publication_id,
+                    'text': f.feedback,
+                    'done': f.done,
+                    'author': f.author.name if f.author else ''}
+                   for f in query)
+    else:
+        records = (f.format(embed_publication=False) for f in query)
+    return stream_export(records, columns, export_format)
+
+
+@api.route('/publications/<int:pub_id>', methods=["GET"])
 @requires_auth('get:publication')
 def get_publication(payload, pub_id):
-    publication = Publication.query.get(pub_id)
-    if publication is None:
+    version = Publication.get_version(pub_id)
+    if version is None:
+        abort(404)
+    return publication_response(pub_id, version)
+
+
+@api.route('/publications/by-invocation/<string:invoc_id>', methods=['GET'])
+@requires_auth('get:publication')
+def get_publication_by_invocation(payload, invoc_id):
+    ### id and version in one lookup of the unique invocation id indexes ###
+    row = Publication.with_invocation_id(invoc_id).with_entities(
+        Publication.id, Publication.version).first()
+    if row is None:
+        abort(404)
+    return publication_response(row.id, row.version)
+
+
+@api.route('/publications/by-doi/<path:doi>', methods=['GET'])
+@requires_auth('get:publication')
+def get_publications_by_doi(payload, doi):
+    ### all publications (dataset versions) of the DOI, oldest first ###
+    publications = Publication.query.filter(Publication.doi == doi).order_by(
+        Publication.id).all()
+    if len(publications) == 0:
         abort(404)
     response = {'success': True,
-                'publication': publication.format()
+                'publications': [p.format() for p in publications]
                 }
     return jsonify(response)
 
 
-@app.route('/publications', methods=["POST"])
-@requires_auth('post:publication')
-def new_publication(payload):
+@api.route('/publications/resolve', methods=['POST'])
+@requires_auth('get:publication')
+def resolve_publications(payload):
+    ###
+    # resolves lists of invocation ids (of the workflow or the resumed
+    # workflow) and DOIs with one query
+    # returns the publication of every invocation id (null if unknown)
+    # and the publications of every DOI (empty if unknown)
+    ###
     check_request(request)
-    new_datasetId = request.json.get("datasetId")
-    new_invocationId = request.json.get('invocationId')
-    new_displayName = request.json.get('datasetDisplayName')
-    new_doi = request.json.get('datasetGlobalId')
-
-    missing = []
-
-    if new_datasetId is None:
-        missing.append("datasetId")
-    if new_invocationId is None:
-        missing.append("invocationId")
-    if new_displayName is None:
-        missing.append("datasetDisplayName")
-    if new_doi is None:
-        missing.append("datasetGlobalId")
+    if not isinstance(request.json, dict):
+        abort(400, 'Body must be an object')
+    invocation_ids = request.json.get('invocationIds', [])
+    dois = request.json.get('dois', [])
+    for values in (invocation_ids, dois):
+        if (not isinstance(values, list) or
+                any(not isinstance(v, str) for v in values)):
+            abort(400, 'invocationIds and dois must be lists of strings')
+    if len(invocation_ids) + len(dois) > MAX_RESOLVE_SIZE:
+        abort(400, 'At most {} ids can be resolved at once'.format(
+            MAX_RESOLVE_SIZE))
+
+    by_invocation = {invoc_id: None for invoc_id in invocation_ids}
+    by_doi = {doi: [] for doi in dois}
+    if len(by_invocation) + len(by_doi) > 0:
+        publications = Publication.query.filter(or_(
+            Publication.preInvocId.in_(list(by_invocation)),
+            Publication.postInvocId.in_(list(by_invocation)),
+            Publication.doi.in_(list(by_doi))
+        )).order_by(Publication.id).all()
+        for pub in publications:
+            for invoc_id in (pub.preInvocId, pub.postInvocId):
+                if invoc_id in by_invocation:
+                    by_invocation[invoc_id] = pub.format()
+            if pub.doi in by_doi:
+                by_doi[pub.doi].append(pub.format())
+    response = {
+        'success': True,
+        'invocationIds': by_invocation,
+        'dois': by_doi
+    }
+    return jsonify(response)
 
-    if len(missing) > 0:
-        raise PublicationValidationError(
-            'The following field{} missing: {}'.format(
-                ' is' if len(missing) == 1 else 's are',
-                ", ".join(missing)),
-            400)
 
-    pub = Publication(doi=new_doi,
-                      invocId=new_invocationId,
-                      databaseId=new_datasetId,
-                      displayName=new_displayName)
+@api.route('/publications', methods=["POST"])
+@requires_auth('post:publication')
+def new_publication(payload):
+    check_request(request)
+    pub = publication_from_json(request.json)
     try:
         pub.insert()
     except Exception as e:
@@ -132,7 +880,42 @@ def new_publication(payload):
     return jsonify(response)
 
 
-@app.route('/publications/<int:pub_id>', methods=["DELETE"])
+@api.route('/publications/bulk', methods=["POST"])
+@requires_auth('post:publication')
+def new_publications_bulk(payload):
+    ###
+    # imports many publications from a JSON array or an NDJSON body,
+    # inserting them in batched transactions
+    # returns one result per item, in the order of the items
+    ###
+    results = []
+    batch = []
+    for index, item in enumerate(read_bulk_items()):
+        result = {'index': index}
+        results.append(result)
+        try:
+            batch.append((result, publication_from_json(item)))
+        except PublicationValidationError as e:
+            result.update({'success': False,
+                           'error': e.status_code,
+                           'message': e.error})
+        if len(batch) >= BULK_BATCH_SIZE:
+            insert_publication_batch(batch)
+            batch = []
+    if len(batch) > 0:
+        insert_publication_batch(batch)
+
+    created = len([r for r in results if r['success']])
+    response = {
+        'success': True,
+        'created': created,
+        'failed': len(results) - created,
+        'results': results
+    }
+    return jsonify(response)
+
+
+@api.route('/publications/<int:pub_id>', methods=["DELETE"])
 @requires_auth('delete:publication')
 def delete_publication(payload, pub_id):
     publication = Publication.query.get(pub_id)
@@ -148,21 +931,38 @@ def delete_publication(payload, pub_id):
     return jsonify(response)
 
 
-@app.route('/publications/<int:pid>/feedbacks', methods=['GET'])
+@api.route('/publications/<int:pid>/feedbacks', methods=['GET'])
 @requires_auth('get:feedback')
 def get_feedbacks_of_publication(payload, pid):
-    pub = Publication.query.get(pid)
-    if pub is None:
+    version = Publication.get_version(pid)
+    if version is None:
         abort(404)
-    response = {
-        'success': True,
-        'publication': pub.format(),
-        'feedbacks': [f.format() for f in pub.feedbacks]
-    }
-    return jsonify(response)
+    ### the publication is only embedded in every feedback on request ###
+    embed_publication = 'publication' in get_embed_arg(('publication',))
+    variant = 'embedded' if embed_publication else 'compact'
+
+    def etag(version):
+        return 'feedbacks-{}-{}-{}'.format(pid, version, variant)
+
+    def build():
+        ### feedbacks and their authors in one additional query ###
+        pub = Publication.query.options(
+            selectinload(Publication.feedbacks).joinedload(
+                Feedback.author).joinedload(Role.memberships)
+        ).get(pid)
+        if pub is None:
+            abort(404)
+        response = {
+            'success': True,
+            'publication': pub.format(),
+            'feedbacks': [f.format(embed_publication) for f in pub.feedbacks]
+        }
+        return etag(pub.version), response
 
+    return conditional_response(etag(version), build)
 
-@app.route('/publications/<int:pid>/feedbacks', methods=['POST'])
+
+@api.route('/publications/<int:pid>/feedbacks', methods=['POST'])
 @requires_auth('post:feedback')
 def add_feedback_to_publication(payload, pid):
     pub = Publication.query.get(pid)
@@ -176,7 +976,7 @@ def add_feedback_to_publication(payload, pid):
     fb = Feedback(pid, feedback_text, author_id)
     pub.feedbacks.append(fb)
     try:
-        pub.update()
+        fb.insert()
     except Exception as e:
         abort(422, e)
 
@@ -187,26 +987,37 @@ def add_feedback_to_publication(payload, pid):
     return jsonify(response)
 
 
-@app.route('/publications/<int:pid>/feedbacks/<int:fid>', methods=['GET'])
+@api.route('/publications/<int:pid>/feedbacks/<int:fid>', methods=['GET'])
 @requires_auth('get:feedback')
 def get_feedback(payload, pid, fid):
-    fb = Feedback.query.get(fid)
-    if fb is None:
+    ### ownership and version of the publication in one query ###
+    row = db.session.query(Feedback.publication_id, Publication.version).join(
+        Publication, Feedback.publication_id == Publication.id
+    ).filter(Feedback.id == fid).first()
+    if row is None:
         abort(404)
-    if fb.publication.id != pid:
+    if row.publication_id != pid:
         abort(409)
 
-    response = {
-        'success': True,
-        'feedback': fb.format()
-    }
-    return jsonify(response)
+    def build():
+        fb = get_feedback_with_relations(fid)
+        if fb is None:
+            abort(404)
+        response = {
+            'success': True,
+            'feedback': fb.format()
+        }
+        return ('feedback-{}-{}'.format(fid, fb.publication.version),
+                response)
 
+    return conditional_response(
+        'feedback-{}-{}'.format(fid, row.version), build)
 
-@app.route('/publications/<int:pid>/feedbacks/<int:fid>', methods=['PATCH'])
+
+@api.route('/publications/<int:pid>/feedbacks/<int:fid>', methods=['PATCH'])
 @requires_auth('patch:feedback')
 def change_feedback(payload, pid, fid):
-    fb = Feedback.query.get(fid)
+    fb = get_feedback_with_relations(fid)
     if fb is None:
         abort(404)
     if fb.publication.id != pid:
@@ -217,12 +1028,14 @@ def change_feedback(payload, pid, fid):
 
     if new_text is None and done is None:
         abort(400)
+    if done is not None and not isinstance(done, bool):
+        abort(400, 'done is not a boolean')
 
     if new_text is not None:
         fb.feedback = new_text
 
     if done is not None:
-        fb.done = done
+        fb.set_done(done)
     try:
         fb.update()
     except Exception as e:
@@ -236,11 +1049,11 @@ def change_feedback(payload, pid, fid):
     return jsonify(response)
 
 
-@app.route('/publications/<int:pid>/feedbacks/<int:fid>/done',
+@api.route('/publications/<int:pid>/feedbacks/<int:fid>/done',
            methods=['PATCH'])
 @requires_auth('complete:feedback')
 def mark_feedback_as_done(payload, pid, fid):
-    fb = Feedback.query.get(fid)
+    fb = get_feedback_with_relations(fid)
     if fb is None:
         abort(404)
     if fb.publication.id != pid:
@@ -250,8 +1063,10 @@ def mark_feedback_as_done(payload, pid, fid):
 
     if done is None:
         abort(400)
+    elif not isinstance(done, bool):
+        abort(400, 'done is not a boolean')
     else:
-        fb.done = done
+        fb.set_done(done)
 
     try:
         fb.update()
@@ -266,10 +1081,10 @@ def mark_feedback_as_done(payload, pid, fid):
     return jsonify(response)
 
 
-@app.route('/publications/<int:pid>/feedbacks/<int:fid>', methods=['DELETE'])
+@api.route('/publications/<int:pid>/feedbacks/<int:fid>', methods=['DELETE'])
 @requires_auth('delete:feedback')
 def delete_feedback(payload, pid, fid):
-    fb = Feedback.query.get(fid)
+    fb = get_feedback_with_relations(fid)
     if fb is None:
         abort(404)
     if fb.publication.id != pid:
@@ -286,67 +1101,332 @@ def delete_feedback(payload, pid, fid):
     return jsonify(response)
 
 
-@app.route('/publications/<int:pid>/publish', methods=['PATCH'])
+@api.route('/publications/<int:pid>/feedbacks/batch', methods=['POST'])
+@requires_auth('post:feedback')
+def add_feedbacks_to_publication(payload, pid):
+    ### adds many feedbacks in one transaction ###
+    pub = Publication.query.get(pid)
+    if pub is None:
+        abort(404)
+    items = read_batch_items(
+        lambda item: isinstance(item, dict) and
+        isinstance(item.get('text'), str) and item['text'] != '')
+    feedbacks = pub.add_feedbacks([item['text'] for item in items],
+                                  payload['id'])
+    ### serialized before the commit expires them ###
+    response = {
+        'success': True,
+        'created': [fb.id for fb in feedbacks],
+        'publication': pub.format(),
+        'feedbacks': [fb.format(False) for fb in feedbacks]
+    }
+    commit_batch()
+    return jsonify(response)
+
+
+@api.route('/publications/<int:pid>/feedbacks/batch', methods=['PATCH'])
+@requires_auth('complete:feedback')
+def mark_feedbacks_as_done(payload, pid):
+    ### marks many feedbacks as done or open in one transaction ###
+    pub = Publication.query.get(pid)
+    if pub is None:
+        abort(404)
+    items = read_batch_items(
+        lambda item: isinstance(item, dict) and
+        type(item.get('id')) is int and isinstance(item.get('done'), bool))
+    feedbacks = get_feedbacks_for_batch(pid, [item['id'] for item in items])
+    pub.set_feedbacks_done([(feedbacks[item['id']], item['done'])
+                            for item in items])
+    response = {
+        'success': True,
+        'changed': list(feedbacks),
+        'publication': pub.format(),
+        'feedbacks': [fb.format(False) for fb in feedbacks.values()]
+    }
+    commit_batch()
+    return jsonify(response)
+
+
+@api.route('/publications/<int:pid>/feedbacks/batch', methods=['DELETE'])
+@requires_auth('delete:feedback')
+def delete_feedbacks(payload, pid):
+    ### deletes many feedbacks in one transaction ###
+    pub = Publication.query.get(pid)
+    if pub is None:
+        abort(404)
+    ids = read_batch_items(lambda item: type(item) is int)
+    feedbacks = get_feedbacks_for_batch(pid, ids)
+    pub.delete_feedbacks(list(feedbacks.values()))
+    response = {
+        'success': True,
+        'deleted': list(feedbacks),
+        'publication': pub.format()
+    }
+    commit_batch()
+    return jsonify(response)
+
+
+@api.route('/publications/<int:pid>/publish', methods=['PATCH'])
 @requires_auth('publish:publication')
 def publish_publication(payload, pid):
     pub = Publication.query.get(pid)
     if pub is None:
         abort(404)
-    pub.actualize_status()
-    if pub.status == 'exported':
-        raise WorkflowError('Publication is already exported', 409)
-    elif pub.status == 'published':
-        raise WorkflowError('Publication is already published', 409)
-    elif pub.status == 'feedbacks to to':
-        raise WorkflowError('There are feedbacks to do before publication',
-                            409)
-    elif pub.status == 'finished':
+    pub.check_publishable()
+    try:
+        pub.publish()
+    except Exception as e:
+        abort(422, e)
+    response = {
+        'success': True,
+        'publication': pub.format()
+    }
+    return jsonify(response)
+
+
+@api.route('/publications/<int:pid>/resume', methods=['POST'])
+@requires_auth('publish:publication')
+def resume_publication(payload, pid):
+    ###
+    # callback of the resumed workflow: records its invocation id and
+    # publishes the publication in one transaction,
+    # a repeated callback with the same invocation id changes nothing
+    ###
+    check_request(request)
+    invoc_id = read_invocation_id(request.json)
+    if invoc_id is None:
+        abort(400, 'invocationId is missing')
+    pub = Publication.query.get(pid)
+    if pub is None:
+        abort(404)
+    if pub.check_resumable(invoc_id):
+        used = Publication.with_invocation_id(invoc_id).filter(
+            Publication.id != pid).first()
+        if used is not None:
+            raise WorkflowError('invocationId is already used', 409)
         try:
-            pub.publish()
+            pub.resume(invoc_id)
+        except IntegrityError:
+            ### a concurrent callback has used the invocation id ###
+            db.session.rollback()
+            raise WorkflowError('invocationId is already used', 409)
         except Exception as e:
+            db.session.rollback()
             abort(422, e)
-        response = {
-            'success': True,
-            'publication': pub.format()
-        }
-    else:
-        raise WorkflowError(
-            'Publication is in unknown status: {}'.format(pub.status),
-            409
-        )
+    response = {
+        'success': True,
+        'publication': pub.format()
+    }
     return jsonify(response)
 
 
-@app.route('/publications/<int:pid>/export', methods=['PATCH'])
+@api.route('/publications/resume', methods=['POST'])
+@requires_auth('publish:publication')
+def resume_publications(payload):
+    ###
+    # resumes many publications from a JSON array of {id, invocationId}
+    # in one transaction, returns one result per item,
+    # items violating the workflow are skipped with their error
+    ###
+    check_request(request)
+    items = request.json
+    if (not isinstance(items, list) or len(items) == 0 or
+            any(not isinstance(item, dict) or
+                type(item.get('id')) is not int or
+                read_invocation_id(item) is None for item in items)):
+        abort(400, 'Expected a JSON array of ids and invocationIds')
+    if len(items) > MAX_RESUME_SIZE:
+        abort(400, 'At most {} publications can be resumed at once'.format(
+            MAX_RESUME_SIZE))
+
+    ###
+    # the publications and the used invocation ids in two queries,
+    # an invocation id is used by the workflow or the resumed workflow
+    ###
+    ids = [item['id'] for item in items]
+    invocation_ids = [item['invocationId'] for item in items]
+    pubs = {pub.id: pub for pub in Publication.query.filter(
+        Publication.id.in_(ids))}
+    used = {}
+    for pre_id, post_id, used_by in db.session.query(
+            Publication.preInvocId, Publication.postInvocId,
+            Publication.id).filter(or_(
+                Publication.preInvocId.in_(invocation_ids),
+                Publication.postInvocId.in_(invocation_ids))):
+        used[pre_id] = used_by
+        if post_id is not None:
+            used[post_id] = used_by
+
+    results = []
+    for item in items:
+        pid, invoc_id = item['id'], item['invocationId']
+        result = {'id': pid, 'invocationId': invoc_id}
+        results.append(result)
+        pub = pubs.get(pid)
+        if pub is None:
+            result.update({'success': False,
+                           'error': 404,
+                           'message': 'resource not found'})
+            continue
+        try:
+            resumable = pub.check_resumable(invoc_id)
+            if resumable and used.get(invoc_id, pid) != pid:
+                raise WorkflowError('invocationId is already used', 409)
+        except WorkflowError as e:
+            result.update({'success': False,
+                           'error': e.status_code,
+                           'message': e.error})
+            continue
+        if resumable:
+            pub.set_resumed(invoc_id)
+            used[invoc_id] = pid
+        result.update({'success': True, 'publication': pub.format()})
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        raise WorkflowError('invocationId is already used', 409)
+    except Exception as e:
+        db.session.rollback()
+        abort(422, e)
+    resumed = len([r for r in results if r['success']])
+    response = {
+        'success': True,
+        'resumed': resumed,
+        'failed': len(results) - resumed,
+        'results': results
+    }
+    return jsonify(response)
+
+
+@api.route('/publications/<int:pid>/export', methods=['PATCH'])
 @requires_auth('export:publication')
 def export_publication(payload, pid):
     pub = Publication.query.get(pid)
     if pub is None:
         abort(404)
+    pub.check_exportable()
+    try:
+        pub.export()
+    except Exception as e:
+        abort(422, e)
+    response = {
+        'success': True,
+        'publication': pub.format()
+    }
+    return jsonify(response)
 
-    pub.actualize_status()
 
-    if pub.status != 'published':
-        raise WorkflowError('Only published publication can be exported', 409)
-    else:
-        try:
-            pub.export()
-        except Exception as e:
-            abort(422, e)
-        response = {
-            'success': True,
-            'publication': pub.format()
-        }
+@api.route('/publications/publish', methods=['POST'])
+@requires_auth('publish:publication')
+def publish_publications(payload):
+    return enqueue_transition('publish')
+
+
+@api.route('/publications/export', methods=['POST'])
+@requires_auth('export:publication')
+def export_publications_batch(payload):
+    return enqueue_transition('export')
+
+
+@api.route('/jobs/<string:job_id>', methods=['GET'])
+@requires_auth('get:jobs')
+def get_job(payload, job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        abort(404)
+    return jsonify({'success': True, 'job': job.format()})
+
+
+@api.route('/metrics', methods=['GET'])
+@requires_auth('get:metrics')
+def get_metrics(payload):
+    ### request metrics and cache counters in Prometheus text format ###
+    tokens = token_cache.stats()
+    responses = response_cache.stats()
+    gauges = (
+        ('token_cache_hits_total', 'counter', 'Token cache hits',
+         tokens['hits']),
+        ('token_cache_misses_total', 'counter', 'Token cache misses',
+         tokens['misses']),
+        ('response_cache_hits_total', 'counter', 'Response cache hits',
+         responses['hits']),
+        ('response_cache_misses_total', 'counter', 'Response cache misses',
+         responses['misses']),
+        ('event_subscribers', 'gauge', 'Connected event stream clients',
+         event_broker.stats()['subscribers'])
+    )
+    return Response(metrics.render(gauges),
+                    content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@api.route('/changes', methods=['GET'])
+@requires_auth('get:changes')
+def get_changes_since(payload):
+    ###
+    # returns the publications and feedbacks written after the change
+    # sequence number since, and tombstones of the deleted ones,
+    # the next call continues with since=next
+    ###
+    since = get_int_arg('since', 0) or 0
+    limit = min(get_int_arg('limit', 1) or PAGE_SIZE, MAX_PAGE_SIZE)
+    changes, more, cursor = get_changes(since, limit)
+    response = {
+        'success': True,
+        'changes': changes,
+        'more': more,
+        'next': cursor
+    }
+    return jsonify(response)
+
+
+@api.route('/stats', methods=['GET'])
+@requires_auth('get:stats')
+def get_statistics(payload):
+    response = get_stats()
+    response['success'] = True
     return jsonify(response)
 
 
-@app.route('/publications/<int:pid>/giveok', methods=['PATCH'])
+@api.route('/search', methods=['GET'])
+@requires_auth('get:feedback')
+def search(payload):
+    ###
+    # full text search over the feedback texts and publication names,
+    # q is an FTS5 query, e.g. license, licen* or "add a license"
+    ###
+    q = request.args.get('q', '').strip()
+    if q == '':
+        abort(400, 'Parameter q is missing')
+    search_type = request.args.get('type')
+    if search_type not in (None, 'feedbacks', 'publications'):
+        abort(400, 'Parameter type is invalid')
+    done = get_bool_arg('done')
+    status = request.args.get('status')
+    limit = min(get_int_arg('limit', 1) or SEARCH_LIMIT, MAX_PAGE_SIZE)
+    if not search_available():
+        abort(501)
+
+    response = {'success': True, 'query': q}
+    try:
+        if search_type in (None, 'feedbacks'):
+            response['feedbacks'] = search_feedbacks(q, done, status, limit)
+        if search_type in (None, 'publications'):
+            response['publications'] = search_publications(q, status, limit)
+    except OperationalError:
+        ### syntax errors of the FTS5 query ###
+        db.session.rollback()
+        abort(400, 'Parameter q is invalid')
+    return jsonify(response)
+
+
+@api.route('/publications/<int:pid>/giveok', methods=['PATCH'])
 @requires_auth('giveokto:publication')
 def giveok2publication(payload, pid):
     pub = Publication.query.get(pid)
     if pub is None:
         abort(404)
-    pub.actualize_status()
     if pub.status == 'exported':
         raise WorkflowError('Publication is already exported', 409)
     elif pub.status == 'published':
@@ -362,12 +1442,120 @@ def giveok2publication(payload, pid):
     return jsonify(response)
 
 
+@api.route('/events', methods=['GET'])
+@requires_auth('get:publications')
+def get_events(payload):
+    return stream_events()
+
+
+@api.route('/publications/<int:pid>/events', methods=['GET'])
+@requires_auth('get:publication')
+def get_events_of_publication(payload, pid):
+    if Publication.get_version(pid) is None:
+        abort(404)
+    return stream_events(pid)
+
+
+@api.route('/publications/<int:pid>/history', methods=['GET'])
+@requires_auth('get:publication')
+def get_history_of_publication(payload, pid):
+    ### the transitions and feedback changes, paginated by entry id ###
+    after = get_int_arg('after', 0)
+    limit = min(get_int_arg('limit', 1) or PAGE_SIZE, MAX_PAGE_SIZE)
+    pub = db.session.query(Publication.id, Publication.created).filter(
+        Publication.id == pid).first()
+    if pub is None:
+        abort(404)
+    entries = HistoryEntry.of_publication(pub, after, limit + 1)
+    has_next = len(entries) > limit
+    entries = entries[:limit]
+    response = {
+        'success': True,
+        'history': [e.format() for e in entries],
+        'next': entries[-1].id if has_next else None
+    }
+    return jsonify(response)
+
+
+###
+# CLI commands
+###
+
+
+@click.command('backfill-status')
+@with_appcontext
+def backfill_status():
+    """
+    Recomputes the stored status and open feedback counter
+    of all publications from their feedbacks
+    """
+    changed = Publication.backfill_status()
+    click.echo('Updated status of {} publication(s)'.format(changed))
+
+
+@click.command('prune-history')
+@click.option('--days', type=int, default=HISTORY_RETENTION_DAYS,
+              show_default=True, help='age of the oldest entries to keep')
+@click.option('--vacuum', is_flag=True,
+              help='give the freed space back to the file system (SQLite)')
+@with_appcontext
+def prune_history(days, vacuum):
+    """
+    Deletes the history entries older than the retention period
+    """
+    deleted = HistoryEntry.prune(datetime.now() - timedelta(days=days))
+    click.echo('Deleted {} history entries'.format(deleted))
+    if vacuum and db.engine.dialect.name == 'sqlite':
+        with db.engine.connect() as connection:
+            connection.execute(text('VACUUM'))
+        click.echo('Vacuumed database')
+
+
+@click.command('create-db')
+@with_appcontext
+def create_db():
+    """
+    Creates the tables of a new database
+    and marks it as up to date with the migrations
+    """
+    db.create_all()
+    stamp(directory=migrations_dir)
+    click.echo('Created database schema')
+
+
+@click.command('check-schema')
+@with_appcontext
+def check_schema():
+    """
+    Fails, if the database is not at the latest migration
+    """
+    current, head = get_schema_versions()
+    if current != head:
+        raise click.ClickException(
+            'Database schema is at revision {}, expected {}. '
+            'Run flask db upgrade.'.format(current, head))
+    click.echo('Database schema is at revision {}'.format(current))
+
+
+def get_schema_versions():
+    ###
+    # returns the migration revision of the database
+    # and the latest revision in the migrations directory
+    ###
+    with db.engine.connect() as connection:
+        current = MigrationContext.configure(
+            connection).get_current_revision()
+    script = ScriptDirectory.from_config(
+        migrate.get_config(directory=migrations_dir))
+    return current, script.get_current_head()
+
+
 ###
 # Error Handling
 ###
 
 
-@app.errorhandler(404)
+@api.app_errorhandler(404)
 def not_found_404(error):
     """
     Errorhandler for 404 (ressource not found) error
@@ -379,7 +1567,7 @@ def not_found_404(error):
     return response
 
 
-@app.errorhandler(405)
+@api.app_errorhandler(405)
 def not_allowed_405(error):
     """
     Errorhandler for 405 (method not allowed) error
@@ -390,7 +1578,7 @@ def not_allowed_405(error):
     return response
 
 
-@app.errorhandler(409)
+@api.app_errorhandler(409)
 def conflict_409(error):
     """
     Errorhandler for 405 (method not allowed) error
@@ -399,11 +1587,11 @@ def conflict_409(error):
                         'error': 409,
                         'message':
                             'conflict: feedback does not belong to publication'
-                        }, 409)
+                        }), 409
     return response
 
 
-@app.errorhandler(422)
+@api.app_errorhandler(422)
 def not_proccessable_422(error):
     """
     Errorhandler for 422 (request not proccessable) error
@@ -415,7 +1603,7 @@ def not_proccessable_422(error):
     return response
 
 
-@app.errorhandler(400)
+@api.app_errorhandler(400)
 def bad_request_400(error):
     """
     Errorhandler for 400 (bad request) error,
@@ -427,7 +1615,7 @@ def bad_request_400(error):
     return response
 
 
-@app.errorhandler(500)
+@api.app_errorhandler(500)
 def internal_server_error_500(error):
     response = jsonify({'success': False,
                         'error': 500,
@@ -435,7 +1623,19 @@ def internal_server_error_500(error):
     return response
 
 
-@app.errorhandler(PublicationValidationError)
+@api.app_errorhandler(501)
+def not_implemented_501(error):
+    """
+    Errorhandler for 501 (not implemented) error,
+    i.e. search on databases other than SQLite
+    """
+    response = jsonify({'success': False,
+                        'error': 501,
+                        'message': 'not implemented for this database'}), 501
+    return response
+
+
+@api.app_errorhandler(PublicationValidationError)
 def publication_error(error):
     ###
     # Error handler for publication validation errors
@@ -448,7 +1648,7 @@ def publication_error(error):
                     }), error.status_code
 
 
-@app.errorhandler(WorkflowError)
+@api.app_errorhandler(WorkflowError)
 def workflow_error(error):
     ###
     # Error handler for publication validation errors
@@ -461,7 +1661,7 @@ def workflow_error(error):
                     }), error.status_code
 
 
-@app.errorhandler(AuthError)
+@api.app_errorhandler(AuthError)
 def auth_error(error):
     ###
     # Error handler for authentication errors
@@ -473,3 +1673,34 @@ def auth_error(error):
                     "error": error.status_code,
                     "message": error.error["description"]
                     }), error.status_code
+
+
+###
+# Application factory
+###
+
+
+def create_app(config=None):
+    ###
+    # creates and configures the application without touching the database
+    # @INPUTS
+    #    config: optional mapping of configuration values,
+    #            i.e. SQLALCHEMY_DATABASE_URI
+    ###
+    app = Flask(__name__)
+    ### requests taking longer are logged, unset disables the log ###
+    slow_request_seconds = os.environ.get('SLOW_REQUEST_SECONDS', '')
+    app.config['SLOW_REQUEST_SECONDS'] = (
+        float(slow_request_seconds) if slow_request_seconds != '' else None)
+    if config is not None:
+        app.config.from_mapping(config)
+    setup_db(app, app.config.get('SQLALCHEMY_DATABASE_URI', database_path))
+    migrate.init_app(app, db, directory=migrations_dir)
+    app.register_blueprint(api)
+    for command in (backfill_status, prune_history, create_db,
+                    check_schema):
+        app.cli.add_command(command)
+    return app
+
+
+app = create_app()
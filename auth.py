@@ -2,15 +2,103 @@ from os import environ
 import jwt
 from collections.abc import Iterable
 from models.errors import AuthError
+from metrics import record_auth_time
+from cache import LRUCache
 from flask import request
 from functools import wraps
 import random
 import string
 import hashlib
-import datetime
+import time
 
 
 JWT_SECRET = environ.get('JWT_SECRET', 'vkeojrkewmfdeoiwrjkewmfew')
+JWT_CACHE_SIZE = int(environ.get('JWT_CACHE_SIZE', 1024))
+# lifetime in seconds of access tokens and of refresh tokens
+JWT_EXPIRY = int(environ.get('JWT_EXPIRY', 2 * 24 * 3600))
+JWT_REFRESH_EXPIRY = int(environ.get('JWT_REFRESH_EXPIRY', 30 * 24 * 3600))
+# an issued token is handed out again while it lives at least this long
+JWT_REUSE_MIN_LIFETIME = int(environ.get('JWT_REUSE_MIN_LIFETIME',
+                                         JWT_EXPIRY // 2))
+
+# permissions granted by each role
+ROLE_PERMISSIONS = {
+    'Author': frozenset([
+        'complete:feedback',
+        'get:publication',
+        'get:feedback',
+        'giveokto:publication'
+    ]),
+    'Curator': frozenset([
+        'get:feedback',
+        'patch:feedback',
+        'post:feedback',
+        'delete:feedback',
+        'get:publication'
+    ]),
+    'Admin': frozenset([
+        'get:publications',
+        'get:publication',
+        'publish:publication',
+        'export:publication',
+        'post:publication',
+        'delete:publication',
+        'add:user',
+        'get:roles',
+        'get:authcache',
+        'get:jobs',
+        'get:stats',
+        'get:metrics',
+        'get:changes'
+    ])
+}
+
+
+class TokenCache(LRUCache):
+    ###
+    # bounded LRU cache of verified tokens
+    # maps the digest of a token to its payload and permissions,
+    # entries are dropped when the token expires
+    ###
+    @staticmethod
+    def key(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def expired(self, entry):
+        return entry[2] < time.time()
+
+    def get(self, token):
+        ###
+        # returns (payload, permissions) of a cached token
+        # or None, if the token is not cached or expired
+        ###
+        entry = super().get(self.key(token))
+        if entry is None:
+            return None
+        return entry[0], entry[1]
+
+    def put(self, token, payload, permissions):
+        super().put(self.key(token), (payload, permissions, payload['exp']))
+
+
+token_cache = TokenCache(JWT_CACHE_SIZE)
+
+
+class IssuedTokenCache(LRUCache):
+    ###
+    # bounded LRU cache of the tokens issued per identifier,
+    # a token is handed out again as long as it lives at least
+    # min_lifetime seconds, so GET /roles/<pid>/token needs no lookup
+    ###
+    def __init__(self, maxsize, min_lifetime):
+        super().__init__(maxsize)
+        self.min_lifetime = min_lifetime
+
+    def expired(self, issued):
+        return issued['expires'] - time.time() < self.min_lifetime
+
+
+issued_tokens = IssuedTokenCache(JWT_CACHE_SIZE, JWT_REUSE_MIN_LIFETIME)
 
 
 def get_hash(identifier):
@@ -54,6 +142,35 @@ def check_permissions(permission, payload):
     # raises an Auth Error, if no permissions are included in the payload
     # or the requested permission is not in the payload permissions array
     ###
+    check_permission(permission, get_permissions(payload))
+    return True
+
+
+def check_permission(permission, permissions):
+    ###
+    # raises an Auth Error, if permission is not in the granted permissions
+    ###
+    if permission not in permissions:
+        raise AuthError(
+            {'code': 'permission_not_granted',
+             'description':
+             'required permission {} is not granted'.format(permission)},
+            403
+        )
+
+
+def get_permissions(payload):
+    ###
+    # validates expiration date and roles of a decoded jwt payload
+    # returns the frozenset of permissions granted by the roles
+    ###
+    if payload.get('type') == 'refresh':
+        raise AuthError(
+            {'code': 'refresh_token',
+             'description': 'refresh tokens only renew access tokens'},
+            401
+         )
+
     expire = payload.get('exp', None)
     if expire is None:
         raise AuthError(
@@ -62,7 +179,7 @@ def check_permissions(permission, payload):
             400
          )
 
-    if expire < datetime.datetime.utcnow().timestamp():
+    if expire < time.time():
         raise AuthError(
             {'code': 'token expired',
              'description': 'JWT Token is expired'},
@@ -82,48 +199,64 @@ def check_permissions(permission, payload):
              'description': 'roles are not a list'},
             400
         )
-    permissions = set_permissions_by_role(roles)
-    if permission not in permissions:
-        raise AuthError(
-            {'code': 'permission_not_granted',
-             'description':
-             'required permission {} is not granted'.format(permission)},
-            403
-        )
-    return True
+    return set_permissions_by_role(roles)
 
 
 def set_permissions_by_role(roles):
-    permissions = []
-    if 'Author' in roles:
-        permissions.append('complete:feedback')
-        permissions.append('get:publication')
-        permissions.append('get:feedback')
-        permissions.append('giveokto:publication')
-    if 'Curator' in roles:
-        permissions.append('get:feedback')
-        permissions.append('patch:feedback')
-        permissions.append('post:feedback')
-        permissions.append('delete:feedback')
-        permissions.append('get:publication')
-    if 'Admin' in roles:
-        permissions.append('get:publications')
-        permissions.append('get:publication')
-        permissions.append('publish:publication')
-        permissions.append('export:publication')
-        permissions.append('post:publication')
-        permissions.append('delete:publication')
-        permissions.append('add:user')
-    return permissions
-
-
-def encode_jwt(payload):
-    exp_time = datetime.datetime.utcnow() + datetime.timedelta(days=2)
-    payload['exp'] = exp_time
+    ### returns the union of the permissions granted by the roles ###
+    if isinstance(roles, str):
+        roles = [roles]
+    roles = set(role for role in roles if isinstance(role, str))
+    return frozenset().union(
+        *[ROLE_PERMISSIONS[role] for role in roles & ROLE_PERMISSIONS.keys()])
+
+
+def encode_jwt(payload, expires_in=None):
+    ###
+    # signs the payload, which expires after expires_in seconds
+    # (default: JWT_EXPIRY)
+    ###
+    if expires_in is None:
+        expires_in = JWT_EXPIRY
+    payload['exp'] = int(time.time()) + expires_in
     token = jwt.encode(payload, JWT_SECRET, algorithm='HS256').decode('utf-8')
     return token
 
 
+def issue_tokens(claims):
+    ###
+    # signs an access token and a longer living refresh token,
+    # which renews the access token without looking up the person
+    # returns the tokens and the expiry time of the access token
+    ###
+    access = dict(claims)
+    token = encode_jwt(access)
+    refresh_token = encode_jwt(dict(claims, type='refresh'),
+                               JWT_REFRESH_EXPIRY)
+    return {
+        'token': token,
+        'expires': access['exp'],
+        'refreshToken': refresh_token
+    }
+
+
+def refresh_access_token(refresh_token):
+    ###
+    # verifies a refresh token and signs a new access token
+    # with the claims it carries
+    ###
+    payload = decode_jwt(refresh_token)
+    if payload.pop('type', None) != 'refresh':
+        raise AuthError(
+            {'code': 'no_refresh_token',
+             'description': 'token is not a refresh token'},
+            401
+        )
+    del payload['exp']
+    token = encode_jwt(payload)
+    return {'token': token, 'expires': payload['exp']}
+
+
 def randomString(stringLength=6):
     return ''.join(
         [random.choice(string.ascii_letters) for n in range(stringLength)]
@@ -149,13 +282,31 @@ def decode_jwt(token):
     return payload
 
 
+def verify_token(token):
+    ###
+    # returns the verified payload and the permissions of a token,
+    # decoding and validating the token only if it is not cached yet
+    ###
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached
+    payload = decode_jwt(token)
+    permissions = get_permissions(payload)
+    token_cache.put(token, payload, permissions)
+    return payload, permissions
+
+
 def requires_auth(permission=''):
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            token = get_token_auth_header()
-            payload = decode_jwt(token)
-            check_permissions(permission, payload)
+            start = time.perf_counter()
+            try:
+                token = get_token_auth_header()
+                payload, permissions = verify_token(token)
+                check_permission(permission, permissions)
+            finally:
+                record_auth_time(time.perf_counter() - start)
 
             return f(payload, *args, **kwargs)
 
@@ -0,0 +1,340 @@
+###
+# Load benchmark of the workflow API
+#
+# Seeds a fresh SQLite database with publications, feedbacks and curators,
+# then drives the API through the Flask test client with a reproducible
+# mix of requests: listing publications and feedbacks, polling single
+# publications with If-None-Match, adding and completing feedbacks,
+# publishing and exporting. Reports the throughput and the p50/p95/p99
+# latencies per operation and writes them as JSON, including the git
+# commit, so runs of different commits can be compared.
+#
+# From the root directory of the repository, run
+#    python benchmarks/api_load.py [--publications 1000] [--requests 5000]
+#        [--output results.json] [--compare baseline.json]
+###
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_dir)
+
+from app import create_app  # noqa: E402
+from auth import encode_jwt, get_hash, randomString  # noqa: E402
+from models.db import db  # noqa: E402
+from models.publication import Publication  # noqa: E402
+from models.feedback import Feedback  # noqa: E402
+from models.role import Role  # noqa: E402
+
+# operations of the request mix and their default weights
+MIX = (
+    ('list', 20),
+    ('list_feedbacks', 15),
+    ('poll', 30),
+    ('add_feedback', 10),
+    ('complete', 10),
+    ('publish', 5),
+    ('export', 5)
+)
+PERCENTILES = (50, 95, 99)
+
+
+def seed(app, publications, feedbacks, curators, rng):
+    ###
+    # fills the database, publications are spread over the workflow:
+    # with open feedbacks, finished, published and exported
+    ###
+    with app.app_context():
+        db.create_all()
+        roles = []
+        for n in range(curators):
+            role = Role('Curator {}'.format(n),
+                        'curator{}@publicationWorkflow.de'.format(n))
+            role.identifier = get_hash(randomString(20))
+            role.add_roles(['Curator'])
+            roles.append(role)
+        db.session.add_all(roles)
+        db.session.flush()
+
+        pubs = []
+        for n in range(publications):
+            pub = Publication(doi='doi:10.5072/bench-{}'.format(n),
+                              invocId='bench-{}'.format(n),
+                              databaseId=n,
+                              displayName='Benchmark dataset {}'.format(n))
+            state = rng.random()
+            if state < 0.5:
+                for i in range(feedbacks):
+                    fb = Feedback(None, 'Feedback {} on dataset {}'.format(
+                        i, n), rng.choice(roles).id)
+                    fb.done = rng.random() < 0.5
+                    pub.feedbacks.append(fb)
+                pub.openFeedbacks = len([f for f in pub.feedbacks
+                                         if not f.done])
+            elif state < 0.7:
+                pub.published = datetime.now()
+            elif state < 0.8:
+                pub.published = pub.exported = datetime.now()
+            pub.refresh_status()
+            pubs.append(pub)
+        db.session.add_all(pubs)
+        db.session.commit()
+        return [role.id for role in roles]
+
+
+class Workload:
+    ###
+    # state of the request mix: the publications and feedbacks, that
+    # can still be completed, published and exported, the random choices
+    # come from the generator of the calling thread
+    ###
+    def __init__(self, app, role_ids):
+        self.lock = threading.Lock()
+        self.etags = {}
+        with app.app_context():
+            rows = db.session.query(Publication.id, Publication.status).all()
+            self.pids = [pid for pid, status in rows]
+            ### new feedbacks only go to publications under review ###
+            self.reviewed = [pid for pid, status in rows
+                             if status == 'feedbacks to do']
+            self.finished = [pid for pid, status in rows
+                             if status == 'finished']
+            self.published = [pid for pid, status in rows
+                              if status == 'published']
+            self.open = db.session.query(
+                Feedback.id, Feedback.publication_id).filter(
+                Feedback.done.is_(False)).all()
+        self.headers = {
+            'Admin': bearer({'roles': ['Admin'], 'name': 'Admin', 'id': 1}),
+            'Author': bearer({'roles': ['Author'], 'name': 'Author',
+                              'id': 2})
+        }
+        self.curators = [bearer({'roles': ['Curator'], 'name': 'Curator',
+                                 'id': rid}) for rid in role_ids]
+
+    def pop(self, items, rng):
+        with self.lock:
+            if len(items) == 0:
+                return None
+            return items.pop(rng.randrange(len(items)))
+
+    def request(self, client, operation, rng):
+        ###
+        # performs one operation, returns the name it is reported under
+        # and the response, operations without candidates fall back to poll
+        ###
+        pid = rng.choice(self.pids)
+        if operation == 'list':
+            return operation, client.get(
+                '/publications?limit=50&after={}'.format(pid),
+                headers=self.headers['Admin'])
+        if operation == 'list_feedbacks':
+            return operation, client.get(
+                '/publications/{}/feedbacks'.format(pid),
+                headers=self.headers['Author'])
+        if operation == 'add_feedback' and len(self.reviewed) > 0:
+            pid = rng.choice(self.reviewed)
+            response = client.post(
+                '/publications/{}/feedbacks'.format(pid),
+                json={'text': 'Please check the license.'},
+                headers=rng.choice(self.curators))
+            if response.status_code == 200:
+                with self.lock:
+                    self.open.append((response.json['created'], pid))
+            return operation, response
+        if operation == 'complete':
+            feedback = self.pop(self.open, rng)
+            if feedback is not None:
+                return operation, client.patch(
+                    '/publications/{}/feedbacks/{}/done'.format(
+                        feedback[1], feedback[0]),
+                    json={'done': True}, headers=self.headers['Author'])
+        if operation == 'publish':
+            finished = self.pop(self.finished, rng)
+            if finished is not None:
+                response = client.patch(
+                    '/publications/{}/publish'.format(finished),
+                    headers=self.headers['Admin'])
+                if response.status_code == 200:
+                    with self.lock:
+                        self.published.append(finished)
+                return operation, response
+        if operation == 'export':
+            published = self.pop(self.published, rng)
+            if published is not None:
+                return operation, client.patch(
+                    '/publications/{}/export'.format(published),
+                    headers=self.headers['Admin'])
+        headers = dict(self.headers['Author'])
+        etag = self.etags.get(pid)
+        if etag is not None:
+            headers['If-None-Match'] = etag
+        response = client.get('/publications/{}'.format(pid),
+                              headers=headers)
+        if response.headers.get('ETag') is not None:
+            self.etags[pid] = response.headers['ETag']
+        return 'poll', response
+
+
+def bearer(payload):
+    return {'Authorization': 'bearer {}'.format(encode_jwt(payload))}
+
+
+def percentile(ordered, p):
+    ### nearest rank percentile of a sorted list ###
+    index = max(0, int(round(p / 100.0 * len(ordered) + 0.5)) - 1)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def run(app, workload, operations, threads, seed):
+    ###
+    # performs the operations with the given number of client threads
+    # and returns the latencies and error counts per operation,
+    # every thread draws from its own generator seeded with seed + index
+    ###
+    latencies = {}
+    errors = {}
+    lock = threading.Lock()
+    chunks = [operations[i::threads] for i in range(threads)]
+
+    def work(chunk, rng):
+        client = app.test_client()
+        for operation in chunk:
+            start = time.perf_counter()
+            name, response = workload.request(client, operation, rng)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.setdefault(name, []).append(elapsed)
+                if response.status_code >= 400:
+                    errors[name] = errors.get(name, 0) + 1
+
+    workers = [threading.Thread(target=work,
+                                args=(chunk, random.Random(seed + index)))
+               for index, chunk in enumerate(chunks)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies, errors, time.perf_counter() - start
+
+
+def summarize(latencies, errors, seconds):
+    endpoints = {}
+    for name, values in sorted(latencies.items()):
+        ordered = sorted(values)
+        result = {
+            'requests': len(values),
+            'errors': errors.get(name, 0),
+            'throughput': round(len(values) / seconds, 1),
+            'mean_ms': round(sum(values) / len(values) * 1000, 3)
+        }
+        for p in PERCENTILES:
+            result['p{}_ms'.format(p)] = round(
+                percentile(ordered, p) * 1000, 3)
+        endpoints[name] = result
+    total = sum(len(values) for values in latencies.values())
+    return {
+        'requests': total,
+        'seconds': round(seconds, 3),
+        'throughput': round(total / seconds, 1)
+    }, endpoints
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=root_dir,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results):
+    print('{} requests in {}s, {} requests/s'.format(
+        results['total']['requests'], results['total']['seconds'],
+        results['total']['throughput']))
+    print('{:16} {:>8} {:>7} {:>9} {:>9} {:>9} {:>9}'.format(
+        'operation', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms',
+        'p99 ms'))
+    for name, r in results['endpoints'].items():
+        print('{:16} {:>8} {:>7} {:>9} {:>9} {:>9} {:>9}'.format(
+            name, r['requests'], r['errors'], r['throughput'],
+            r['p50_ms'], r['p95_ms'], r['p99_ms']))
+
+
+def print_comparison(results, baseline):
+    ### prints the change of throughput and latencies to a baseline run ###
+    print('compared to {} ({})'.format(baseline.get('commit'),
+                                       baseline.get('created')))
+    print('{:16} {:>9} {:>9} {:>9} {:>9}'.format(
+        'operation', 'req/s', 'p50', 'p95', 'p99'))
+    for name, r in results['endpoints'].items():
+        old = baseline['endpoints'].get(name)
+        if old is None:
+            continue
+        changes = [r['throughput'] / old['throughput'] if old['throughput']
+                   else float('nan')]
+        for p in PERCENTILES:
+            key = 'p{}_ms'.format(p)
+            changes.append(r[key] / old[key] if old[key] else float('nan'))
+        print('{:16} {:>8.2f}x {:>8.2f}x {:>8.2f}x {:>8.2f}x'.format(
+            name, *changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='load benchmark of the workflow API')
+    parser.add_argument('--publications', type=int, default=1000)
+    parser.add_argument('--feedbacks', type=int, default=5,
+                        help='feedbacks per publication with feedbacks')
+    parser.add_argument('--curators', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=1,
+                        help='concurrent test clients')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='file to write the JSON results to')
+    parser.add_argument('--compare', help='JSON results of an earlier run')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    directory = tempfile.mkdtemp()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///{}'.format(
+        os.path.join(directory, 'benchmark.db'))})
+    role_ids = seed(app, args.publications, args.feedbacks, args.curators,
+                    rng)
+    workload = Workload(app, role_ids)
+    names = [name for name, weight in MIX]
+    weights = [weight for name, weight in MIX]
+    operations = rng.choices(names, weights, k=args.requests)
+
+    latencies, errors, seconds = run(app, workload, operations,
+                                     args.threads, args.seed)
+    total, endpoints = summarize(latencies, errors, seconds)
+    results = {
+        'commit': git_commit(),
+        'created': datetime.now().isoformat(),
+        'python': sys.version.split()[0],
+        'settings': vars(args),
+        'total': total,
+        'endpoints': endpoints
+    }
+    print_results(results)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            print_comparison(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
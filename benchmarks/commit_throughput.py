@@ -0,0 +1,100 @@
+###
+# Benchmark of the commit throughput of the SQLite engine profile
+#
+# Starts several worker processes, which insert and commit publications
+# into a fresh SQLite database concurrently, once with the SQLite defaults
+# and once with the tuned profile of models/db.py (WAL, synchronous=NORMAL,
+# busy_timeout, mmap_size, cache_size).
+#
+# From the root directory of the repository, run
+#    python benchmarks/commit_throughput.py [--workers 4] [--commits 250]
+###
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_dir)
+
+from flask import Flask  # noqa: E402
+from models.db import db, setup_db, get_sqlite_pragmas  # noqa: E402
+from models.publication import Publication  # noqa: E402
+from models.role import Role  # noqa: E402,F401
+
+PROFILES = (
+    ('default', {}),
+    ('tuned', get_sqlite_pragmas())
+)
+
+
+def make_app(database_path, pragmas):
+    app = Flask(__name__)
+    setup_db(app, database_path, pragmas)
+    return app
+
+
+def worker(database_path, pragmas, worker_id, commits):
+    ### inserts and commits publications, counts commits and lock errors ###
+    app = make_app(database_path, pragmas)
+    done = 0
+    locked = 0
+    with app.app_context():
+        for n in range(commits):
+            pub = Publication(doi='doi:10.0/bench',
+                              invocId='{}-{}'.format(worker_id, n),
+                              databaseId=n,
+                              displayName='benchmark publication')
+            try:
+                pub.insert()
+                done += 1
+            except Exception:
+                db.session.rollback()
+                locked += 1
+    return done, locked
+
+
+def create_schema(database_path, pragmas):
+    app = make_app(database_path, pragmas)
+    with app.app_context():
+        db.create_all()
+
+
+def run(name, pragmas, workers, commits):
+    directory = tempfile.mkdtemp()
+    database_path = 'sqlite:///{}'.format(
+        os.path.join(directory, 'benchmark.db'))
+    process = multiprocessing.Process(target=create_schema,
+                                      args=(database_path, pragmas))
+    process.start()
+    process.join()
+
+    with multiprocessing.Pool(workers) as pool:
+        start = time.perf_counter()
+        counts = pool.starmap(
+            worker,
+            [(database_path, pragmas, i, commits) for i in range(workers)])
+        elapsed = time.perf_counter() - start
+
+    done = sum(c[0] for c in counts)
+    locked = sum(c[1] for c in counts)
+    print('{:8} {:>8} commits {:>8.0f} commits/s {:>6} failed'.format(
+        name, done, done / elapsed, locked))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='commit throughput of the SQLite engine profiles')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--commits', type=int, default=250,
+                        help='commits per worker')
+    args = parser.parse_args()
+    print('{} workers, {} commits each'.format(args.workers, args.commits))
+    for name, pragmas in PROFILES:
+        run(name, pragmas, args.workers, args.commits)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+from os import environ
+import threading
+from collections import OrderedDict
+
+
+RESPONSE_CACHE_SIZE = int(environ.get('RESPONSE_CACHE_SIZE', 1024))
+
+
+class LRUCache:
+    ###
+    # bounded, thread safe LRU cache, counting its hits and misses
+    # subclasses drop entries that became invalid by overriding expired
+    ###
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def expired(self, value):
+        return False
+
+    def get(self, key):
+        ### returns the cached value or None ###
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None and self.expired(value):
+                del self.entries[key]
+                value = None
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self.entries),
+                'maxsize': self.maxsize
+            }
+
+
+# serialized response bodies keyed by their ETag, which contains the
+# version of the publication, so a write makes the old entries
+# unreachable and they age out
+response_cache = LRUCache(RESPONSE_CACHE_SIZE)
@@ -0,0 +1,22 @@
+###
+# gunicorn settings, start the API with
+#    gunicorn app:app
+# With SCHEMA_CHECK=1, the master process checks once at startup that the
+# database is at the latest migration, before any worker is started.
+###
+import os
+
+
+def on_starting(server):
+    if os.environ.get('SCHEMA_CHECK', '') in ('', '0'):
+        return
+    from app import app, get_schema_versions
+    from models.db import db
+    with app.app_context():
+        current, head = get_schema_versions()
+        # workers must not inherit connections of the master
+        db.engine.dispose()
+    if current != head:
+        raise SystemExit(
+            'Database schema is at revision {}, expected {}. '
+            'Run flask db upgrade.'.format(current, head))
@@ -0,0 +1,101 @@
+from os import environ
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from datetime import datetime
+import threading
+import uuid
+
+
+# number of threads running jobs and number of jobs kept for GET /jobs/<id>
+JOB_WORKERS = int(environ.get('JOB_WORKERS', 2))
+JOB_HISTORY_SIZE = int(environ.get('JOB_HISTORY_SIZE', 100))
+
+
+class Job:
+    ###
+    # background job working through a list of items,
+    # collects one result per item and reports its progress
+    ###
+    def __init__(self, job_type, total):
+        self.id = uuid.uuid4().hex
+        self.type = job_type
+        self.status = 'queued'
+        self.total = total
+        self.results = []
+        self.message = None
+        self.created = datetime.now()
+        self.started = None
+        self.finished = None
+        self.lock = threading.Lock()
+
+    def add_results(self, results):
+        with self.lock:
+            self.results.extend(results)
+
+    def format(self):
+        with self.lock:
+            succeeded = len([r for r in self.results if r['success']])
+            response = {
+                'id': self.id,
+                'type': self.type,
+                'status': self.status,
+                'total': self.total,
+                'processed': len(self.results),
+                'succeeded': succeeded,
+                'failed': len(self.results) - succeeded,
+                'created': self.created.isoformat(),
+                'results': list(self.results)
+            }
+            if self.started is not None:
+                response['started'] = self.started.isoformat()
+            if self.finished is not None:
+                response['finished'] = self.finished.isoformat()
+            if self.message is not None:
+                response['message'] = self.message
+            return response
+
+
+class JobQueue:
+    ###
+    # runs jobs on a local thread pool and keeps the last jobs,
+    # jobs are only known to the process that runs them
+    ###
+    def __init__(self, workers, history_size):
+        self.workers = workers
+        self.history_size = history_size
+        self.executor = None
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, job, function, *args):
+        ###
+        # enqueues the job, function is called with the job and args
+        # in a worker thread, it adds the results to the job
+        ###
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(self.workers)
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.history_size:
+                self.jobs.popitem(last=False)
+        self.executor.submit(self.run, job, function, *args)
+        return job
+
+    @staticmethod
+    def run(job, function, *args):
+        job.status = 'running'
+        job.started = datetime.now()
+        try:
+            function(job, *args)
+            job.status = 'finished'
+        except Exception as e:
+            job.status = 'failed'
+            job.message = str(e)
+        job.finished = datetime.now()
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+
+job_queue = JobQueue(JOB_WORKERS, JOB_HISTORY_SIZE)
@@ -0,0 +1,185 @@
+from flask import g, request, has_request_context, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import threading
+import time
+
+
+# upper bounds of the histogram buckets
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    ### cumulative histogram in the style of Prometheus ###
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Metrics:
+    ###
+    # per endpoint metrics of the handled requests:
+    # number of requests per status, latency, SQL statements, SQL time
+    # and time spent in requires_auth
+    ###
+    histograms = (
+        ('request_duration_seconds', SECONDS_BUCKETS,
+         'Time to handle a request'),
+        ('request_sql_statements', STATEMENT_BUCKETS,
+         'SQL statements executed per request'),
+        ('request_sql_seconds', SECONDS_BUCKETS,
+         'Time spent executing SQL per request'),
+        ('request_auth_seconds', SECONDS_BUCKETS,
+         'Time spent in requires_auth per request')
+    )
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.requests = {}
+            self.series = {name: {} for name, buckets, description in
+                           self.histograms}
+
+    def observe_request(self, method, endpoint, status, values):
+        ###
+        # records a handled request
+        # @INPUTS
+        #    values: dict of the observed value of every histogram
+        ###
+        labels = (('method', method), ('endpoint', endpoint))
+        with self.lock:
+            key = labels + (('status', str(status)),)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            for name, buckets, description in self.histograms:
+                series = self.series[name]
+                if labels not in series:
+                    series[labels] = Histogram(buckets)
+                series[labels].observe(values[name])
+
+    def render(self, gauges=()):
+        ###
+        # returns the metrics in the Prometheus text exposition format
+        # @INPUTS
+        #    gauges: (name, type, description, value) of other components
+        ###
+        lines = []
+        name = '{}_requests_total'.format(self.prefix)
+        with self.lock:
+            lines.append('# HELP {} Handled requests'.format(name))
+            lines.append('# TYPE {} counter'.format(name))
+            for labels, value in sorted(self.requests.items()):
+                lines.append('{}{{{}}} {}'.format(
+                    name, format_labels(labels), value))
+            for short_name, buckets, description in self.histograms:
+                name = '{}_{}'.format(self.prefix, short_name)
+                lines.append('# HELP {} {}'.format(name, description))
+                lines.append('# TYPE {} histogram'.format(name))
+                for labels, histogram in sorted(
+                        self.series[short_name].items()):
+                    lines.extend(render_histogram(name, labels, histogram))
+        for short_name, metric_type, description, value in gauges:
+            name = '{}_{}'.format(self.prefix, short_name)
+            lines.append('# HELP {} {}'.format(name, description))
+            lines.append('# TYPE {} {}'.format(name, metric_type))
+            lines.append('{} {}'.format(name, format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    return ','.join('{}="{}"'.format(
+        key, value.replace('\\', '\\\\').replace('"', '\\"'))
+        for key, value in labels)
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_histogram(name, labels, histogram):
+    lines = []
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        lines.append('{}_bucket{{{}}} {}'.format(
+            name, format_labels(labels + (('le', format_value(bound)),)),
+            count))
+    lines.append('{}_bucket{{{}}} {}'.format(
+        name, format_labels(labels + (('le', '+Inf'),)), histogram.count))
+    lines.append('{}_sum{{{}}} {}'.format(
+        name, format_labels(labels), format_value(histogram.sum)))
+    lines.append('{}_count{{{}}} {}'.format(
+        name, format_labels(labels), histogram.count))
+    return lines
+
+
+metrics = Metrics('pubworkflow')
+
+
+def start_request():
+    g.metrics_start = time.perf_counter()
+    g.metrics_sql_statements = 0
+    g.metrics_sql_seconds = 0.0
+    g.metrics_auth_seconds = 0.0
+
+
+def finish_request(response):
+    ###
+    # records the metrics of the request and logs it, if it took longer
+    # than the configured SLOW_REQUEST_SECONDS
+    ###
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return response
+    duration = time.perf_counter() - start
+    ### the rule, not the path, keeps the number of series bounded ###
+    endpoint = (request.url_rule.rule if request.url_rule is not None
+                else 'unmatched')
+    metrics.observe_request(request.method, endpoint, response.status_code, {
+        'request_duration_seconds': duration,
+        'request_sql_statements': g.metrics_sql_statements,
+        'request_sql_seconds': g.metrics_sql_seconds,
+        'request_auth_seconds': g.metrics_auth_seconds
+    })
+    threshold = current_app.config.get('SLOW_REQUEST_SECONDS')
+    if threshold is not None and duration >= threshold:
+        current_app.logger.warning(
+            'slow request %s %s: %.3fs, %d SQL statements in %.3fs, '
+            'auth %.3fs', request.method, request.full_path, duration,
+            g.metrics_sql_statements, g.metrics_sql_seconds,
+            g.metrics_auth_seconds)
+    return response
+
+
+def record_auth_time(seconds):
+    if has_request_context() and 'metrics_start' in g:
+        g.metrics_auth_seconds += seconds
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_statement(conn, cursor, statement, parameters, context,
+                    executemany):
+    if context is not None:
+        context.metrics_start = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def finish_statement(conn, cursor, statement, parameters, context,
+                     executemany):
+    ### statements of background jobs don't belong to a request ###
+    if (context is not None and has_request_context() and
+            'metrics_start' in g):
+        g.metrics_sql_statements += 1
+        g.metrics_sql_seconds += time.perf_counter() - context.metrics_start
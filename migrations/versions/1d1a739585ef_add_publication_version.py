@@ -0,0 +1,27 @@
+"""add publication version
+
+Revision ID: 1d1a739585ef
+Revises: cf5b95ba438d
+Create Date: 2026-10-18 07:11:39.791401
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1d1a739585ef'
+down_revision = 'cf5b95ba438d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('publication',
+                  sa.Column('version', sa.Integer(), nullable=False,
+                            server_default='1'))
+
+
+def downgrade():
+    with op.batch_alter_table('publication') as batch_op:
+        batch_op.drop_column('version')
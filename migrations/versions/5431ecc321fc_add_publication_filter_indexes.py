@@ -0,0 +1,38 @@
+"""add indexes on publication filter columns
+
+Revision ID: 5431ecc321fc
+Revises: 
+Create Date: 2026-10-18 06:54:13.142048
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5431ecc321fc'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_publication_status'), 'publication',
+                    ['status'], unique=False)
+    op.create_index(op.f('ix_publication_databaseid'), 'publication',
+                    ['databaseid'], unique=False)
+    op.create_index(op.f('ix_publication_doi'), 'publication',
+                    ['doi'], unique=False)
+    op.create_index(op.f('ix_publication_published'), 'publication',
+                    ['published'], unique=False)
+    op.create_index(op.f('ix_publication_exported'), 'publication',
+                    ['exported'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_publication_exported'), table_name='publication')
+    op.drop_index(op.f('ix_publication_published'), table_name='publication')
+    op.drop_index(op.f('ix_publication_doi'), table_name='publication')
+    op.drop_index(op.f('ix_publication_databaseid'),
+                  table_name='publication')
+    op.drop_index(op.f('ix_publication_status'), table_name='publication')
@@ -0,0 +1,60 @@
+"""add full text search
+
+Revision ID: 7f69cc44ce2a
+Revises: 1d1a739585ef
+Create Date: 2026-10-18 07:17:58.162672
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7f69cc44ce2a'
+down_revision = '1d1a739585ef'
+branch_labels = None
+depends_on = None
+
+
+# FTS5 indexes of feedback texts and publication names (SQLite only),
+# external content tables kept in sync by triggers
+FTS_TABLES = (
+    ('feedback', 'feedback_fts', 'feedback'),
+    ('publication', 'publication_fts', 'displayname')
+)
+FTS_DDL = (
+    "CREATE VIRTUAL TABLE {fts} USING fts5("
+    "{column}, content='{table}', content_rowid='id', "
+    "tokenize='porter unicode61')",
+    "CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} BEGIN "
+    "INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); "
+    "END",
+    "CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, {column}) "
+    "VALUES ('delete', old.id, old.{column}); "
+    "END",
+    "CREATE TRIGGER {fts}_update AFTER UPDATE OF {column} ON {table} BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, {column}) "
+    "VALUES ('delete', old.id, old.{column}); "
+    "INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); "
+    "END"
+)
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for table, fts, column in FTS_TABLES:
+        for ddl in FTS_DDL:
+            op.execute(ddl.format(fts=fts, table=table, column=column))
+        # index the existing rows
+        op.execute("INSERT INTO {0}({0}) VALUES ('rebuild')".format(fts))
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for table, fts, column in FTS_TABLES:
+        for trigger in ('insert', 'delete', 'update'):
+            op.execute('DROP TRIGGER {}_{}'.format(fts, trigger))
+        op.execute('DROP TABLE {}'.format(fts))
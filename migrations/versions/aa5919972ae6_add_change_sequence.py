@@ -0,0 +1,59 @@
+"""add change sequence
+
+Revision ID: aa5919972ae6
+Revises: b95bfe307482
+Create Date: 2026-10-18 07:30:35.196785
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'aa5919972ae6'
+down_revision = 'b95bfe307482'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'change_sequence',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('value', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table(
+        'tombstone',
+        sa.Column('seq', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('entity', sa.String(length=20), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.Column('publication_id', sa.Integer(), nullable=True),
+        sa.Column('deleted', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('seq')
+    )
+    op.add_column('publication',
+                  sa.Column('changeseq', sa.Integer(), nullable=True))
+    op.add_column('feedback',
+                  sa.Column('changeseq', sa.Integer(), nullable=True))
+    # the existing rows are numbered once, publications first
+    op.execute('UPDATE publication SET changeseq = id')
+    op.execute('UPDATE feedback SET changeseq = id + '
+               '(SELECT COALESCE(MAX(id), 0) FROM publication)')
+    op.execute('INSERT INTO change_sequence (id, value) SELECT 1, '
+               '(SELECT COALESCE(MAX(id), 0) FROM publication) + '
+               '(SELECT COALESCE(MAX(id), 0) FROM feedback)')
+    op.create_index(op.f('ix_publication_changeseq'), 'publication',
+                    ['changeseq'], unique=False)
+    op.create_index(op.f('ix_feedback_changeseq'), 'feedback', ['changeseq'],
+                    unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_feedback_changeseq'), table_name='feedback')
+    op.drop_index(op.f('ix_publication_changeseq'), table_name='publication')
+    # no batch mode: recreating the tables would drop the search triggers
+    op.drop_column('feedback', 'changeseq')
+    op.drop_column('publication', 'changeseq')
+    op.drop_table('tombstone')
+    op.drop_table('change_sequence')
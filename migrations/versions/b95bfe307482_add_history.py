@@ -0,0 +1,51 @@
+"""add history
+
+Revision ID: b95bfe307482
+Revises: fb9d14e8f849
+Create Date: 2026-10-18 07:28:01.906669
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b95bfe307482'
+down_revision = 'fb9d14e8f849'
+branch_labels = None
+depends_on = None
+
+
+# the timestamps the publications already have become their first entries
+BACKFILL = (
+    ('publication.ok', 'okauthor', None),
+    ('publication.published', 'published', 'published'),
+    ('publication.exported', 'exported', 'exported')
+)
+
+
+def upgrade():
+    op.create_table(
+        'history',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('publication_id', sa.Integer(), nullable=False),
+        sa.Column('event', sa.String(length=50), nullable=False),
+        sa.Column('status', sa.String(length=120), nullable=True),
+        sa.Column('created', sa.DateTime(), nullable=False),
+        sa.Column('data', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_history_publication_id_created', 'history',
+                    ['publication_id', 'created'], unique=False)
+    for event, column, status in BACKFILL:
+        op.execute(sa.text(
+            "INSERT INTO history (publication_id, event, status, created) "
+            "SELECT id, :event, :status, {column} FROM publication "
+            "WHERE {column} IS NOT NULL ORDER BY {column}".format(
+                column=column)
+        ).bindparams(event=event, status=status))
+
+
+def downgrade():
+    op.drop_index('ix_history_publication_id_created', table_name='history')
+    op.drop_table('history')
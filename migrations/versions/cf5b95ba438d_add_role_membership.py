@@ -0,0 +1,79 @@
+"""move roles into role_membership table
+
+Revision ID: cf5b95ba438d
+Revises: ea8411e35f09
+Create Date: 2026-10-18 07:09:15.614266
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cf5b95ba438d'
+down_revision = 'ea8411e35f09'
+branch_labels = None
+depends_on = None
+
+
+role = sa.table('role',
+                sa.column('id', sa.Integer),
+                sa.column('roles', sa.String))
+role_membership = sa.table('role_membership',
+                           sa.column('role_id', sa.Integer),
+                           sa.column('name', sa.String),
+                           sa.column('position', sa.Integer))
+
+
+def upgrade():
+    op.create_table(
+        'role_membership',
+        sa.Column('role_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('position', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['role_id'], ['role.id'], ),
+        sa.PrimaryKeyConstraint('role_id', 'name')
+    )
+    op.create_index(op.f('ix_role_membership_name'), 'role_membership',
+                    ['name'], unique=False)
+
+    # split the comma separated roles into memberships,
+    # empty names and 'None' were written by earlier versions for no role
+    connection = op.get_bind()
+    memberships = []
+    for role_id, roles in connection.execute(
+            sa.select([role.c.id, role.c.roles])):
+        names = []
+        for name in (roles or '').split(','):
+            if name not in ('', 'None') and name not in names:
+                names.append(name)
+        memberships.extend({'role_id': role_id,
+                            'name': name,
+                            'position': position}
+                           for position, name in enumerate(names))
+    if len(memberships) > 0:
+        op.bulk_insert(role_membership, memberships)
+
+    with op.batch_alter_table('role') as batch_op:
+        batch_op.drop_column('roles')
+
+
+def downgrade():
+    with op.batch_alter_table('role') as batch_op:
+        batch_op.add_column(sa.Column('roles', sa.String(length=120),
+                                      nullable=True))
+
+    connection = op.get_bind()
+    roles = {}
+    for role_id, name in connection.execute(
+            sa.select([role_membership.c.role_id, role_membership.c.name])
+            .order_by(role_membership.c.role_id,
+                      role_membership.c.position)):
+        roles.setdefault(role_id, []).append(name)
+    for role_id, names in roles.items():
+        connection.execute(role.update().where(role.c.id == role_id)
+                           .values(roles=','.join(names)))
+
+    op.drop_index(op.f('ix_role_membership_name'),
+                  table_name='role_membership')
+    op.drop_table('role_membership')
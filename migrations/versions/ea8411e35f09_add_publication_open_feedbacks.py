@@ -0,0 +1,28 @@
+"""add open feedback counter to publication
+
+Revision ID: ea8411e35f09
+Revises: 5431ecc321fc
+Create Date: 2026-10-18 06:55:44.113390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ea8411e35f09'
+down_revision = '5431ecc321fc'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # run `flask backfill-status` afterwards to fill in the counter
+    op.add_column('publication',
+                  sa.Column('openfeedbacks', sa.Integer(), nullable=False,
+                            server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('publication') as batch_op:
+        batch_op.drop_column('openfeedbacks')
@@ -0,0 +1,138 @@
+"""never reuse the ids of deleted publications and feedbacks
+
+Revision ID: f9f8457d0c90
+Revises: aa5919972ae6
+Create Date: 2026-10-18 09:12:41.503318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f9f8457d0c90'
+down_revision = 'aa5919972ae6'
+branch_labels = None
+depends_on = None
+
+
+def publication_columns():
+    return [
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('doi', sa.String(length=100), nullable=True),
+        sa.Column('preinvocid', sa.String(length=200), nullable=True),
+        sa.Column('postinvocid', sa.String(length=200), nullable=True),
+        sa.Column('databaseid', sa.Integer(), nullable=False),
+        sa.Column('displayname', sa.String(), nullable=True),
+        sa.Column('status', sa.String(length=120), nullable=True),
+        sa.Column('created', sa.DateTime(), nullable=True),
+        sa.Column('okauthor', sa.DateTime(), nullable=True),
+        sa.Column('published', sa.DateTime(), nullable=True),
+        sa.Column('exported', sa.DateTime(), nullable=True),
+        sa.Column('openfeedbacks', sa.Integer(), server_default='0',
+                  nullable=False),
+        sa.Column('version', sa.Integer(), server_default='1',
+                  nullable=False),
+        sa.Column('changeseq', sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('preinvocid'),
+        sa.UniqueConstraint('postinvocid')
+    ]
+
+
+def feedback_columns():
+    return [
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('author_id', sa.Integer(), nullable=True),
+        sa.Column('publication_id', sa.Integer(), nullable=True),
+        sa.Column('feedback', sa.Text(), nullable=False),
+        sa.Column('done', sa.Boolean(create_constraint=True),
+                  nullable=True),
+        sa.Column('changeseq', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['author_id'], ['role.id']),
+        sa.ForeignKeyConstraint(['publication_id'], ['publication.id']),
+        sa.PrimaryKeyConstraint('id')
+    ]
+
+
+# rebuilt tables: their columns, indexed columns and searched column
+TABLES = (
+    ('publication', publication_columns,
+     ('doi', 'databaseid', 'status', 'published', 'exported', 'changeseq'),
+     'displayname'),
+    ('feedback', feedback_columns, ('author_id', 'changeseq'), 'feedback')
+)
+FTS_TRIGGERS = (
+    "CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} BEGIN "
+    "INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); "
+    "END",
+    "CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, {column}) "
+    "VALUES ('delete', old.id, old.{column}); "
+    "END",
+    "CREATE TRIGGER {fts}_update AFTER UPDATE OF {column} ON {table} BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, {column}) "
+    "VALUES ('delete', old.id, old.{column}); "
+    "INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); "
+    "END"
+)
+
+# largest id of a deleted row, that is still referenced by the history
+# or the change feed, it must not be handed out again either
+DELETED_IDS = {
+    'publication': (
+        "SELECT COALESCE(MAX(publication_id), 0) FROM history",
+        "SELECT COALESCE(MAX(entity_id), 0) FROM tombstone "
+        "WHERE entity = 'publication'"),
+    'feedback': (
+        "SELECT COALESCE(MAX(json_extract(data, '$.feedbackId')), 0) "
+        "FROM history",
+        "SELECT COALESCE(MAX(entity_id), 0) FROM tombstone "
+        "WHERE entity = 'feedback'")
+}
+
+
+def rebuild_tables(autoincrement):
+    ###
+    # SQLite can't change the AUTOINCREMENT of an existing table, each
+    # table is copied into a new one, which keeps the ids, its indexes
+    # and the search triggers are created again
+    # no batch mode: it wouldn't recreate the triggers
+    ###
+    for table, columns, indexes, searched in TABLES:
+        new_table = '{}_new'.format(table)
+        new_columns = columns()
+        op.create_table(new_table, *new_columns,
+                        sqlite_autoincrement=autoincrement)
+        names = ', '.join(column.name for column in new_columns
+                          if isinstance(column, sa.Column))
+        op.execute('INSERT INTO {0} ({2}) SELECT {2} FROM {1}'.format(
+            new_table, table, names))
+        op.drop_table(table)
+        op.rename_table(new_table, table)
+        for column in indexes:
+            op.create_index(op.f('ix_{}_{}'.format(table, column)),
+                            table, [column], unique=False)
+        for ddl in FTS_TRIGGERS:
+            op.execute(ddl.format(fts='{}_fts'.format(table), table=table,
+                                  column=searched))
+
+
+def upgrade():
+    # other databases don't hand out the ids of deleted rows again
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    rebuild_tables(True)
+    for table, queries in DELETED_IDS.items():
+        op.execute("DELETE FROM sqlite_sequence WHERE name = '{}'".format(
+            table))
+        op.execute(
+            "INSERT INTO sqlite_sequence (name, seq) SELECT '{}', MAX("
+            "(SELECT COALESCE(MAX(id), 0) FROM {}), ({}), ({}))".format(
+                table, table, *queries))
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    rebuild_tables(False)
@@ -0,0 +1,32 @@
+"""add publication created and feedback author index
+
+Revision ID: fb9d14e8f849
+Revises: 7f69cc44ce2a
+Create Date: 2026-10-18 07:19:02.778885
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'fb9d14e8f849'
+down_revision = '7f69cc44ce2a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # publications created before this revision have no creation time
+    # and are left out of the durations of GET /stats
+    op.add_column('publication',
+                  sa.Column('created', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_feedback_author_id'), 'feedback', ['author_id'],
+                    unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_feedback_author_id'), table_name='feedback')
+    # no batch mode: recreating the table would drop the search triggers,
+    # SQLite supports DROP COLUMN since 3.35
+    op.drop_column('publication', 'created')
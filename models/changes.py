@@ -0,0 +1,141 @@
+from models.db import db
+from models.publication import Publication
+from models.feedback import Feedback
+from models.role import Role
+from sqlalchemy import event, DDL, select
+from sqlalchemy.orm import joinedload
+from datetime import datetime
+
+# single row counter of the change sequence, the UPDATE reserving numbers
+# locks it until the commit, so the numbers become visible in order
+change_sequence = db.Table(
+    'change_sequence',
+    db.Column('id', db.Integer, primary_key=True),
+    db.Column('value', db.Integer, nullable=False)
+)
+event.listen(change_sequence, 'after_create', DDL(
+    'INSERT INTO change_sequence (id, value) VALUES (1, 0)'))
+
+# entities, whose writes are numbered, and their type in the change feed
+SEQUENCED = ((Publication, 'publication'), (Feedback, 'feedback'))
+
+
+class Tombstone(db.Model):
+    ###
+    # marks a deleted publication or feedback in the change feed,
+    # a deleted publication also removes its feedbacks
+    ###
+    __tablename__ = 'tombstone'
+
+    seq = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    entity = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    publication_id = db.Column(db.Integer)
+    deleted = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return '<Tombstone {} of {} {}'.format(
+            self.seq,
+            self.entity,
+            self.entity_id)
+
+    def __init__(self, seq, entity, entity_id, publication_id=None):
+        self.seq = seq
+        self.entity = entity
+        self.entity_id = entity_id
+        self.publication_id = publication_id
+        self.deleted = datetime.now()
+
+    def format(self):
+        response = {
+            'seq': self.seq,
+            'type': self.entity,
+            'id': self.entity_id,
+            'deleted': True
+        }
+        if self.publication_id is not None:
+            response['publicationId'] = self.publication_id
+        return response
+
+
+def entity_type(instance):
+    for model, name in SEQUENCED:
+        if isinstance(instance, model):
+            return name
+    return None
+
+
+def reserve_sequence(session, count):
+    ### reserves count numbers, returns the last of them ###
+    session.execute(change_sequence.update().values(
+        value=change_sequence.c.value + count))
+    return session.execute(select(change_sequence.c.value)).scalar()
+
+
+@event.listens_for(db.session, 'before_flush')
+def sequence_changes(session, flush_context, instances):
+    ###
+    # gives every inserted or changed publication and feedback the next
+    # number of the change sequence and a tombstone to every deleted one,
+    # with one reservation per flush
+    ###
+    changed = [obj for obj in session.new if entity_type(obj) is not None]
+    changed.extend(obj for obj in session.dirty
+                   if entity_type(obj) is not None and
+                   session.is_modified(obj))
+    deleted = [obj for obj in session.deleted if entity_type(obj) is not None]
+    count = len(changed) + len(deleted)
+    if count == 0:
+        return
+    seq = reserve_sequence(session, count) - count
+    for obj in changed:
+        seq += 1
+        obj.changeSeq = seq
+    for obj in deleted:
+        seq += 1
+        publication_id = (obj.publication_id if isinstance(obj, Feedback)
+                          else None)
+        session.add(Tombstone(seq, entity_type(obj), obj.id, publication_id))
+
+
+def get_changes(since, limit):
+    ###
+    # returns the publications, feedbacks and tombstones changed after
+    # since in the order of the change sequence, at most limit of them,
+    # whether there are more and the cursor to continue from
+    # only numbers up to the counter read first are returned, they belong
+    # to committed transactions, so no later page can miss a change
+    ###
+    last = db.session.execute(select(change_sequence.c.value)).scalar() or 0
+    publications = Publication.query.filter(
+        Publication.changeSeq > since, Publication.changeSeq <= last
+    ).order_by(Publication.changeSeq).limit(limit + 1).all()
+    feedbacks = Feedback.query.options(
+        joinedload(Feedback.author).selectinload(Role.memberships)
+    ).filter(
+        Feedback.changeSeq > since, Feedback.changeSeq <= last
+    ).order_by(Feedback.changeSeq).limit(limit + 1).all()
+    tombstones = Tombstone.query.filter(
+        Tombstone.seq > since, Tombstone.seq <= last
+    ).order_by(Tombstone.seq).limit(limit + 1).all()
+
+    changes = [(p.changeSeq, {'seq': p.changeSeq,
+                              'type': 'publication',
+                              'id': p.id,
+                              'publication': p.format()})
+               for p in publications]
+    changes.extend((f.changeSeq, {'seq': f.changeSeq,
+                                  'type': 'feedback',
+                                  'id': f.id,
+                                  'feedback': f.format(False)})
+                   for f in feedbacks)
+    changes.extend((t.seq, t.format()) for t in tombstones)
+    changes.sort(key=lambda change: change[0])
+
+    more = len(changes) > limit
+    changes = [change for seq, change in changes[:limit]]
+    if more:
+        cursor = changes[-1]['seq']
+    else:
+        cursor = max(last, since)
+    return changes, more, cursor
@@ -1,17 +1,92 @@
 import os
+import sqlite3
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 
 database_filename = "pubworkflow.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
-database_path = "sqlite:///{}".format(os.path.join(project_dir,
-                                                   database_filename))
+bundled_database_path = "sqlite:///{}".format(
+    os.path.join(project_dir, database_filename))
+database_path = os.environ.get('DATABASE_URL', bundled_database_path)
+
+# SQLite pragmas applied to every new connection and their defaults,
+# each can be changed with the environment variable SQLITE_<NAME>,
+# an empty value keeps the SQLite default
+# the journal mode is stored in the database file, the bundled database
+# keeps its own unless SQLITE_JOURNAL_MODE is set
+SQLITE_PRAGMA_DEFAULTS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', '5000'),
+    ('mmap_size', str(256 * 1024 * 1024)),
+    ('cache_size', '-64000')
+)
+
+# pool settings of server databases (i.e. PostgreSQL)
+# and the environment variables they are read from
+POOL_SETTINGS = (
+    ('pool_size', 'DATABASE_POOL_SIZE'),
+    ('max_overflow', 'DATABASE_MAX_OVERFLOW'),
+    ('pool_timeout', 'DATABASE_POOL_TIMEOUT'),
+    ('pool_recycle', 'DATABASE_POOL_RECYCLE')
+)
 
 db = SQLAlchemy()
 
 
-def setup_db(app, database_path=database_path):
+def get_sqlite_pragmas(database_path=None):
+    ### reads the SQLite tuning profile of a database from the environment ###
+    pragmas = {}
+    for name, default in SQLITE_PRAGMA_DEFAULTS:
+        if name == 'journal_mode' and database_path == bundled_database_path:
+            default = ''
+        value = os.environ.get('SQLITE_{}'.format(name.upper()), default)
+        if value != '':
+            pragmas[name] = value
+    return pragmas
+
+
+def get_engine_options(database_path):
+    ###
+    # returns the engine options for the database,
+    # pool settings are only used for server databases
+    ###
+    if database_path.startswith('sqlite'):
+        return {}
+    options = {'pool_pre_ping': True}
+    for option, variable in POOL_SETTINGS:
+        value = os.environ.get(variable)
+        if value is not None and value != '':
+            options[option] = int(value)
+    return options
+
+
+def apply_sqlite_pragmas(engine, pragmas):
+    ### applies the SQLite tuning profile to every new connection of engine ###
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
+        cursor.close()
+
+
+def setup_db(app, database_path=database_path, pragmas=None):
+    # SQLAlchemy only accepts the postgresql:// scheme
+    if database_path.startswith('postgres://'):
+        database_path = database_path.replace('postgres://',
+                                              'postgresql://', 1)
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = get_engine_options(
+        database_path)
     db.app = app
     db.init_app(app)
-    db.create_all()
+    ### every app gets its own engine and applies its own pragmas ###
+    if database_path.startswith('sqlite'):
+        apply_sqlite_pragmas(
+            db.get_engine(app),
+            get_sqlite_pragmas(database_path) if pragmas is None
+            else pragmas)
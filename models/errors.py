@@ -16,6 +16,15 @@ class FeedbackValidationError(Exception):
         self.status_code = status_code
 
 
+class RoleValidationError(Exception):
+    ###
+    #  class for role validation errors
+    # ###
+    def __init__(self, error, status_code):
+        self.error = error
+        self.status_code = status_code
+
+
 class WorkflowError(Exception):
     ###
     #  class for feedback validation errors
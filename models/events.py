@@ -0,0 +1,122 @@
+from os import environ
+from models.db import db
+from models.history import record_history
+from sqlalchemy import event
+from collections import deque
+import queue
+import threading
+
+
+# number of past events kept for clients resuming with Last-Event-ID
+EVENTS_HISTORY_SIZE = int(environ.get('EVENTS_HISTORY_SIZE', 1000))
+# number of undelivered events per client before it is disconnected
+EVENTS_QUEUE_SIZE = int(environ.get('EVENTS_QUEUE_SIZE', 1000))
+
+
+class Subscriber:
+    ###
+    # queue of events for one connected client,
+    # optionally restricted to the events of one publication
+    ###
+    def __init__(self, publication_id, maxsize):
+        self.publication_id = publication_id
+        self.queue = queue.Queue(maxsize)
+        self.overflowed = False
+
+    def wants(self, event):
+        return (self.publication_id is None or
+                self.publication_id == event['publicationId'])
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            ### the client has to reconnect and resume with Last-Event-ID ###
+            self.overflowed = True
+
+    def get(self, timeout):
+        ### returns the next event or None after timeout seconds ###
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBroker:
+    ###
+    # in-process broadcast of workflow events to the connected clients
+    # every event gets an increasing id, the last events are kept,
+    # so a client can resume after a reconnect
+    ###
+    def __init__(self, history_size, queue_size):
+        self.queue_size = queue_size
+        self.history = deque(maxlen=history_size)
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.last_id = 0
+
+    def subscribe(self, publication_id=None, last_event_id=None):
+        ###
+        # registers a client, the events after last_event_id that are still
+        # in the history are queued right away
+        ###
+        subscriber = Subscriber(publication_id, self.queue_size)
+        with self.lock:
+            if last_event_id is not None:
+                for event in self.history:
+                    if event['id'] > last_event_id and subscriber.wants(event):
+                        subscriber.put(event)
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, name, data):
+        with self.lock:
+            self.last_id += 1
+            event = dict(data, id=self.last_id, event=name)
+            self.history.append(event)
+            for subscriber in self.subscribers:
+                if subscriber.wants(event):
+                    subscriber.put(event)
+        return event
+
+    def stats(self):
+        with self.lock:
+            return {
+                'subscribers': len(self.subscribers),
+                'lastEventId': self.last_id
+            }
+
+
+event_broker = EventBroker(EVENTS_HISTORY_SIZE, EVENTS_QUEUE_SIZE)
+
+
+def record_event(name, publication, details=None, **data):
+    ###
+    # remembers an event of the publication in the current session,
+    # it is broadcast after the commit and dropped on a rollback,
+    # its history entry is written in the same transaction
+    # @INPUTS
+    #    name: name of the event, e.g. publication.published
+    #    publication: the changed publication, its status is sent along
+    #    details: further fields only kept in the history, e.g. text
+    #    data: further JSON fields of the event, e.g. feedbackId
+    ###
+    record_history(publication, name, dict(data, **(details or {})))
+    data['publicationId'] = publication.id
+    data['status'] = publication.status
+    db.session.info.setdefault('events', []).append((name, data))
+
+
+@event.listens_for(db.session, 'after_commit')
+def broadcast_events(session):
+    for name, data in session.info.pop('events', []):
+        event_broker.publish(name, data)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def drop_events(session):
+    session.info.pop('events', None)
@@ -1,13 +1,20 @@
 from models.db import db
+from models.events import record_event
+from sqlalchemy import inspect
 # from models.role import Role
 
 
 class Feedback(db.Model):
+    # ids of deleted feedbacks are never handed out again
+    __table_args__ = {'sqlite_autoincrement': True}
+
     id = db.Column(db.Integer, primary_key=True)
-    author_id = db.Column(db.Integer, db.ForeignKey('role.id'))
+    author_id = db.Column(db.Integer, db.ForeignKey('role.id'), index=True)
     publication_id = db.Column(db.Integer, db.ForeignKey('publication.id'))
     feedback = db.Column(db.Text, nullable=False)
     done = db.Column(db.Boolean, default=False)
+    # position of the last write in the change feed (GET /changes)
+    changeSeq = db.Column('changeseq', db.Integer, index=True)
 
     def __repr__(self):
         return '<Feedback to publication {} from author {}: {}'.format(
@@ -18,27 +25,67 @@ class Feedback(db.Model):
     def __init__(self, publication_id, feedback, author_id=None):
         self.publication_id = publication_id
         self.feedback = feedback
+        self.done = False
         if author_id is not None:
             self.author_id = author_id
 
-    def format(self):
-        response = {
-            'id': self.id,
-            'publication': self.publication.format(),
-            'text': self.feedback,
-            'done': self.done
-        }
+    def format(self, embed_publication=True):
+        ###
+        # returns the JSON representation of the feedback
+        # @INPUTS
+        #    embed_publication: if False, the publication is only referenced
+        #                       by its id (publicationId)
+        ###
+        response = {'id': self.id}
+        if embed_publication:
+            response['publication'] = self.publication.format()
+        else:
+            response['publicationId'] = self.publication_id
+        response['text'] = self.feedback
+        response['done'] = self.done
         if self.author is not None:
             response["author"] = self.author.format()
         return response
 
     def insert(self):
         db.session.add(self)
+        db.session.flush()
+        if not self.done:
+            self.publication.change_open_feedbacks(1)
+        self.publication.touch()
+        record_event('feedback.created', self.publication,
+                     details={'text': self.feedback},
+                     feedbackId=self.id, done=self.done)
         db.session.commit()
 
     def update(self):
+        if self.publication is not None:
+            self.publication.touch()
+            if inspect(self).attrs.feedback.history.has_changes():
+                record_event('feedback.changed', self.publication,
+                             details={'text': self.feedback},
+                             feedbackId=self.id, done=self.done)
         db.session.commit()
 
     def delete(self):
+        if self.publication is not None:
+            if not self.done:
+                self.publication.change_open_feedbacks(-1)
+            self.publication.touch()
+            record_event('feedback.deleted', self.publication,
+                         feedbackId=self.id)
         db.session.delete(self)
         db.session.commit()
+
+    def set_done(self, done):
+        ###
+        # marks the feedback as done or open again
+        # and keeps the open feedback counter of the publication up to date
+        ###
+        changed = bool(done) != bool(self.done)
+        self.done = done
+        if changed and self.publication is not None:
+            self.publication.change_open_feedbacks(-1 if done else 1)
+            record_event('feedback.done' if done else 'feedback.reopened',
+                         self.publication, feedbackId=self.id,
+                         done=bool(done))
@@ -0,0 +1,96 @@
+from models.db import db
+from sqlalchemy import event
+from datetime import datetime
+import json
+
+
+class HistoryEntry(db.Model):
+    ###
+    # append-only log of the workflow transitions and feedback changes,
+    # entries outlive their publication until they are pruned
+    ###
+    __tablename__ = 'history'
+    __table_args__ = (
+        db.Index('ix_history_publication_id_created',
+                 'publication_id', 'created'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    publication_id = db.Column(db.Integer, nullable=False)
+    event = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(120))
+    created = db.Column(db.DateTime, nullable=False)
+    data = db.Column(db.Text)
+
+    def __repr__(self):
+        return '<HistoryEntry {} of publication {}'.format(
+            self.event,
+            self.publication_id)
+
+    def format(self):
+        response = {
+            'id': self.id,
+            'event': self.event,
+            'status': self.status,
+            'created': self.created.isoformat()
+        }
+        if self.data is not None:
+            response.update(json.loads(self.data))
+        return response
+
+    @classmethod
+    def of_publication(cls, publication, after=None, limit=100):
+        ###
+        # returns the entries of the publication in the order they were
+        # written, the id of the last entry of a page is the next after
+        ###
+        query = cls.query.filter(cls.publication_id == publication.id)
+        if after is not None:
+            query = query.filter(cls.id > after)
+        return query.order_by(cls.id).limit(limit).all()
+
+    @classmethod
+    def prune(cls, before, batch_size=10000):
+        ###
+        # deletes the entries written before the given time in batches,
+        # each in its own short transaction, returns the number deleted
+        # the oldest entries come first in the primary key, so every
+        # batch only reads the rows it deletes
+        ###
+        deleted = 0
+        while True:
+            ids = [row.id for row in db.session.query(cls.id).filter(
+                cls.created < before).order_by(cls.id).limit(batch_size)]
+            if len(ids) == 0:
+                return deleted
+            cls.query.filter(cls.id.in_(ids)).delete(
+                synchronize_session=False)
+            db.session.commit()
+            deleted += len(ids)
+
+
+def record_history(publication, name, data):
+    ###
+    # remembers a history entry of the publication in the current session,
+    # the entries of a transaction are written with one statement
+    # right before its commit
+    ###
+    db.session.info.setdefault('history', []).append({
+        'publication_id': publication.id,
+        'event': name,
+        'status': publication.status,
+        'created': datetime.now(),
+        'data': json.dumps(data) if data else None
+    })
+
+
+@event.listens_for(db.session, 'before_commit')
+def write_history(session):
+    rows = session.info.pop('history', None)
+    if rows:
+        session.execute(HistoryEntry.__table__.insert(), rows)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def drop_history(session):
+    session.info.pop('history', None)
@@ -0,0 +1,23 @@
+from models.db import db
+
+
+class RoleMembership(db.Model):
+    ###
+    # membership of a person in a role (i.e. Curator),
+    # position keeps the order in which the roles were added
+    ###
+    __tablename__ = 'role_membership'
+
+    role_id = db.Column(db.Integer, db.ForeignKey('role.id'),
+                        primary_key=True)
+    name = db.Column(db.String(50), primary_key=True, index=True)
+    position = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return '<RoleMembership of person {} in {}'.format(
+            self.role_id,
+            self.name)
+
+    def __init__(self, name, position=0):
+        self.name = name
+        self.position = position
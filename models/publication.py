@@ -1,21 +1,38 @@
 from models.db import db
 from models.feedback import Feedback
+from models.events import record_event
+from models.errors import WorkflowError
+from sqlalchemy import event, inspect, func, case
 from datetime import datetime
 
 
 class Publication(db.Model):
     __tablename__ = 'publication'
+    # ids of deleted publications are never handed out again,
+    # so neither ETags nor history entries of one match another
+    __table_args__ = {'sqlite_autoincrement': True}
 
     id = db.Column('id', db.Integer, primary_key=True)
-    doi = db.Column('doi', db.String(100))
+    doi = db.Column('doi', db.String(100), index=True)
     preInvocId = db.Column('preinvocid', db.String(200), unique=True)
     postInvocId = db.Column('postinvocid', db.String(200), unique=True)
-    databaseId = db.Column('databaseid', db.Integer, nullable=False)
+    databaseId = db.Column('databaseid', db.Integer, nullable=False,
+                           index=True)
     displayName = db.Column('displayname', db.String)
-    status = db.Column('status', db.String(120), default='started')
+    status = db.Column('status', db.String(120), default='started',
+                       index=True)
+    created = db.Column('created', db.DateTime)
     okAuthor = db.Column('okauthor', db.DateTime)
-    published = db.Column('published', db.DateTime)
-    exported = db.Column('exported', db.DateTime)
+    published = db.Column('published', db.DateTime, index=True)
+    exported = db.Column('exported', db.DateTime, index=True)
+    openFeedbacks = db.Column('openfeedbacks', db.Integer, nullable=False,
+                              default=0, server_default='0')
+    # bumped on every write to the publication or one of its feedbacks,
+    # the ETags of the publication and feedback reads are derived from it
+    version = db.Column('version', db.Integer, nullable=False,
+                        default=1, server_default='1')
+    # position of the last write in the change feed (GET /changes)
+    changeSeq = db.Column('changeseq', db.Integer, index=True)
     feedbacks = db.relationship('Feedback', backref='publication', lazy=True)
 
     def __repr__(self):
@@ -35,29 +52,58 @@ class Publication(db.Model):
         self.preInvocId = invocId
         self.displayName = displayName
         self.status = status
+        self.openFeedbacks = 0
+        self.created = datetime.now()
+        self.version = 1
 
-    def format(self):
-        self.actualize_status()
-        response = {
-            'id': self.id,
-            'invocationId': self.preInvocId,
-            'doi': self.doi,
-            'displayName': self.displayName,
-            'status': self.status
-            }
-        if self.okAuthor is not None:
-            response["okAuthor"] = self.okAuthor.strftime('%d.%m.%Y')
-        if self.published is not None:
-            response["published"] = self.published.strftime('%d.%m.%Y')
-        if self.exported is not None:
-            response["exported"] = self.exported.strftime('%d.%m.%Y')
+    # JSON keys of the representation and the attributes they are read from
+    json_fields = {
+        'id': 'id',
+        'invocationId': 'preInvocId',
+        'postInvocationId': 'postInvocId',
+        'doi': 'doi',
+        'displayName': 'displayName',
+        'status': 'status',
+        'okAuthor': 'okAuthor',
+        'published': 'published',
+        'exported': 'exported'
+    }
+    date_fields = ('okAuthor', 'published', 'exported')
+
+    def format(self, fields=None):
+        ###
+        # returns the JSON representation of the publication
+        # @INPUTS
+        #    fields: optional collection of JSON keys to restrict the
+        #            representation to (default: all keys)
+        ###
+        response = {}
+        for key, attribute in self.json_fields.items():
+            if fields is not None and key not in fields:
+                continue
+            value = getattr(self, attribute)
+            if key in self.date_fields:
+                if value is None:
+                    continue
+                value = value.strftime('%d.%m.%Y')
+            response[key] = value
         return response
 
+    @classmethod
+    def load_attributes(cls, fields):
+        ###
+        # returns the attributes that have to be loaded from the database
+        # to serialize the given JSON keys
+        ###
+        return [getattr(cls, cls.json_fields[key]) for key in fields]
+
     def insert(self):
+        self.refresh_status()
         db.session.add(self)
         db.session.commit()
 
     def update(self):
+        self.touch()
         db.session.commit()
 
     def delete(self):
@@ -65,27 +111,220 @@ class Publication(db.Model):
         db.session.commit()
 
     def publish(self):
-        self.published = datetime.now()
+        self.set_published()
         db.session.commit()
 
     def export(self):
-        self.exported = datetime.now()
+        self.set_exported()
         db.session.commit()
 
+    def check_publishable(self):
+        ### raises a WorkflowError, if the publication can't be published ###
+        if self.status == 'exported':
+            raise WorkflowError('Publication is already exported', 409)
+        elif self.status == 'published':
+            raise WorkflowError('Publication is already published', 409)
+        elif self.status == 'feedbacks to do':
+            raise WorkflowError(
+                'There are feedbacks to do before publication', 409)
+        elif self.status != 'finished':
+            raise WorkflowError(
+                'Publication is in unknown status: {}'.format(self.status),
+                409
+            )
+
+    @classmethod
+    def with_invocation_id(cls, invoc_id):
+        ###
+        # returns a query of the publication with the invocation id of its
+        # workflow or of the resumed workflow, both are unique and indexed
+        ###
+        return cls.query.filter(db.or_(cls.preInvocId == invoc_id,
+                                       cls.postInvocId == invoc_id))
+
+    def check_exportable(self):
+        ### raises a WorkflowError, if the publication can't be exported ###
+        if self.status != 'published':
+            raise WorkflowError('Only published publication can be exported',
+                                409)
+
+    def check_resumable(self, post_invoc_id):
+        ###
+        # raises a WorkflowError, if the workflow can't resume with the
+        # invocation id, returns False if it has resumed with it already
+        ###
+        if self.postInvocId == post_invoc_id and self.published is not None:
+            return False
+        if self.postInvocId is not None:
+            raise WorkflowError(
+                'Publication has resumed with another invocationId', 409)
+        self.check_publishable()
+        return True
+
+    def set_resumed(self, post_invoc_id):
+        ###
+        # records the invocation id of the resumed workflow and stamps
+        # the publication as published without committing
+        ###
+        self.postInvocId = post_invoc_id
+        self.set_published()
+
+    def resume(self, post_invoc_id):
+        self.set_resumed(post_invoc_id)
+        db.session.commit()
+
+    def set_published(self):
+        ### stamps the publication as published without committing ###
+        self.published = datetime.now()
+        self.refresh_status()
+        self.touch()
+        record_event('publication.published', self)
+
+    def set_exported(self):
+        ### stamps the publication as exported without committing ###
+        self.exported = datetime.now()
+        self.refresh_status()
+        self.touch()
+        record_event('publication.exported', self)
+
     def registerOk(self):
         self.okAuthor = datetime.now()
+        self.touch()
+        record_event('publication.ok', self)
         db.session.commit()
 
-    def actualize_status(self):
+    def touch(self):
+        ###
+        # bumps the version once per transaction, which invalidates the
+        # cached representations, the increment is done in SQL,
+        # so concurrent writers can't end up with the same version
+        ###
+        touched = db.session.info.setdefault('touched', set())
+        if self in touched:
+            return
+        touched.add(self)
+        if inspect(self).persistent:
+            self.version = Publication.version + 1
+        else:
+            self.version = (self.version or 0) + 1
+
+    @classmethod
+    def get_version(cls, pid):
+        ###
+        # returns the version of the publication with a single primary key
+        # lookup, None if there is no such publication
+        ###
+        return db.session.query(cls.version).filter(cls.id == pid).scalar()
+
+    def change_open_feedbacks(self, delta):
+        ###
+        # adjusts the stored counter of open feedbacks by delta
+        # and derives the status from it, without loading any feedback
+        # the counter is incremented in the UPDATE itself and read back,
+        # so concurrent changes of the feedbacks don't get lost
+        ###
+        if not inspect(self).persistent:
+            self.openFeedbacks = (self.openFeedbacks or 0) + delta
+            self.refresh_status()
+            return
+        cls = type(self)
+        counter = func.coalesce(cls.openFeedbacks, 0) + delta
+        self.touch()
+        self.openFeedbacks = counter
+        self.status = case([(cls.exported.isnot(None), 'exported'),
+                            (cls.published.isnot(None), 'published'),
+                            (counter != 0, 'feedbacks to do')],
+                           else_='finished')
+        db.session.flush()
+        db.session.refresh(self, ['openFeedbacks', 'status', 'version'])
+
+    def add_feedbacks(self, texts, author_id=None):
+        ###
+        # adds a feedback for each text without committing,
+        # the counter and the status are updated once
+        ###
+        feedbacks = [Feedback(self.id, text, author_id) for text in texts]
+        db.session.add_all(feedbacks)
+        db.session.flush()
+        self.change_open_feedbacks(len(feedbacks))
+        self.touch()
+        for fb in feedbacks:
+            record_event('feedback.created', self,
+                         details={'text': fb.feedback},
+                         feedbackId=fb.id, done=False)
+        return feedbacks
+
+    def set_feedbacks_done(self, changes):
+        ###
+        # marks feedbacks as done or open again without committing,
+        # the counter and the status are updated once
+        # @INPUTS
+        #    changes: list of (feedback, done) pairs
+        ###
+        changed = []
+        delta = 0
+        for fb, done in changes:
+            if bool(done) != bool(fb.done):
+                delta += -1 if done else 1
+                changed.append(fb)
+            fb.done = done
+        self.change_open_feedbacks(delta)
+        self.touch()
+        for fb in changed:
+            record_event('feedback.done' if fb.done else 'feedback.reopened',
+                         self, feedbackId=fb.id, done=bool(fb.done))
+        return changed
+
+    def delete_feedbacks(self, feedbacks):
+        ###
+        # deletes feedbacks without committing,
+        # the counter and the status are updated once
+        ###
+        self.change_open_feedbacks(-len([f for f in feedbacks if not f.done]))
+        self.touch()
+        for fb in feedbacks:
+            record_event('feedback.deleted', self, feedbackId=fb.id)
+            db.session.delete(fb)
+
+    def refresh_status(self):
+        ### derives the status from timestamps and open feedback counter ###
         if self.exported is not None:
             self.status = 'exported'
         elif self.published is not None:
             self.status = 'published'
+        elif self.openFeedbacks:
+            self.status = 'feedbacks to do'
         else:
-            done = True
-            for f in self.feedbacks:
-                done = done and f.done
-            if done:
-                self.status = 'finished'
-            else:
-                self.status = 'feedbacks to do'
+            self.status = 'finished'
+
+    def actualize_status(self):
+        ###
+        # recomputes the open feedback counter and the status
+        # from all feedbacks of the publication
+        ###
+        self.openFeedbacks = len([f for f in self.feedbacks if not f.done])
+        self.refresh_status()
+
+    @classmethod
+    def backfill_status(cls):
+        ###
+        # recomputes the stored status and open feedback counter of all
+        # publications, returns the number of publications that changed
+        ###
+        changed = 0
+        publications = cls.query.options(
+            db.selectinload(cls.feedbacks)).all()
+        for pub in publications:
+            before = (pub.status, pub.openFeedbacks)
+            pub.actualize_status()
+            if (pub.status, pub.openFeedbacks) != before:
+                pub.touch()
+                changed += 1
+        db.session.commit()
+        return changed
+
+
+@event.listens_for(db.session, 'after_commit')
+@event.listens_for(db.session, 'after_rollback')
+def forget_touched(session):
+    session.info.pop('touched', None)
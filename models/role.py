@@ -1,5 +1,6 @@
 # Imports #
 from models.db import db
+from models.membership import RoleMembership
 
 
 class Role(db.Model):
@@ -7,7 +8,10 @@ class Role(db.Model):
     identifier = db.Column(db.String(50), unique=True, nullable=False)
     name = db.Column(db.String(120))
     email = db.Column(db.String(120))
-    roles = db.Column(db.String(120))
+    memberships = db.relationship('RoleMembership',
+                                  order_by='RoleMembership.position',
+                                  cascade='all, delete-orphan',
+                                  lazy=True)
     feedbacks = db.relationship('Feedback', backref='author', lazy=True)
 
     def __repr__(self):
@@ -22,6 +26,7 @@ class Role(db.Model):
 
     def format(self):
         return {
+            'id': self.id,
             'name': self.name,
             'roles': self.get_roles()
         }
@@ -38,13 +43,28 @@ class Role(db.Model):
         db.session.commit()
 
     def get_roles(self):
-        return self.roles.split(',')
+        return [m.name for m in self.memberships]
 
     def add_role(self, role):
-        if self.roles is None:
-            roles = []
-        else:
-            roles = self.roles.split(',')
-        roles.append(role)
-        self.roles = ','.join(roles)
+        self.add_roles([role])
         self.update()
+
+    def add_roles(self, roles):
+        ###
+        # adds roles to the person without committing,
+        # so a new person and its roles can be stored in one transaction
+        ###
+        current = set(self.get_roles())
+        position = len(self.memberships)
+        for role in roles:
+            if role in current:
+                continue
+            current.add(role)
+            self.memberships.append(RoleMembership(role, position))
+            position += 1
+
+    @classmethod
+    def with_role(cls, role):
+        ### returns a query of all persons with the role (indexed lookup) ###
+        return cls.query.join(cls.memberships).filter(
+            RoleMembership.name == role)
@@ -0,0 +1,132 @@
+from models.db import db
+from models.feedback import Feedback
+from models.publication import Publication
+from sqlalchemy import event, text, DDL
+import html
+
+# SQLite FTS5 indexes of the feedback texts and the publication names,
+# external content tables kept in sync with their tables by triggers,
+# the porter stemmer lets 'license' also find 'licenses' and 'licensed'
+FTS_TABLES = {
+    'feedback': ('feedback_fts', 'feedback'),
+    'publication': ('publication_fts', 'displayname')
+}
+FTS_DDL = (
+    "CREATE VIRTUAL TABLE {fts} USING fts5("
+    "{column}, content='{table}', content_rowid='id', "
+    "tokenize='porter unicode61')",
+    "CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} BEGIN "
+    "INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); "
+    "END",
+    "CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, {column}) "
+    "VALUES ('delete', old.id, old.{column}); "
+    "END",
+    "CREATE TRIGGER {fts}_update AFTER UPDATE OF {column} ON {table} BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, {column}) "
+    "VALUES ('delete', old.id, old.{column}); "
+    "INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); "
+    "END"
+)
+
+# markers around the matched terms in the snippets, FTS5 inserts
+# control characters, which are replaced after the text is HTML escaped
+SNIPPET_START = '<mark>'
+SNIPPET_END = '</mark>'
+SNIPPET_TOKENS = 12
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+
+FEEDBACK_SEARCH = """
+    SELECT f.id, f.publication_id, f.done, p.status,
+           snippet(feedback_fts, 0, :start, :end, '...', :tokens) AS snippet,
+           bm25(feedback_fts) AS rank
+    FROM feedback_fts
+    JOIN feedback f ON f.id = feedback_fts.rowid
+    JOIN publication p ON p.id = f.publication_id
+    WHERE feedback_fts MATCH :q {filters}
+    ORDER BY rank
+    LIMIT :limit
+"""
+PUBLICATION_SEARCH = """
+    SELECT p.id, p.displayname, p.status,
+           snippet(publication_fts, 0, :start, :end, '...', :tokens)
+               AS snippet,
+           bm25(publication_fts) AS rank
+    FROM publication_fts
+    JOIN publication p ON p.id = publication_fts.rowid
+    WHERE publication_fts MATCH :q {filters}
+    ORDER BY rank
+    LIMIT :limit
+"""
+
+
+def fts_statements(table):
+    fts, column = FTS_TABLES[table]
+    return [ddl.format(fts=fts, table=table, column=column)
+            for ddl in FTS_DDL]
+
+
+### create_all creates the indexes together with the tables ###
+for model in (Feedback, Publication):
+    for statement in fts_statements(model.__tablename__):
+        event.listen(model.__table__, 'after_create',
+                     DDL(statement).execute_if(dialect='sqlite'))
+
+
+def search_available():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def search_feedbacks(q, done=None, status=None, limit=20):
+    ###
+    # returns the feedbacks matching the FTS5 query q, best matches first
+    # @INPUTS
+    #    done: only open (False) or done (True) feedbacks
+    #    status: only feedbacks of publications with this status
+    ###
+    filters = ''
+    params = {'q': q, 'limit': limit}
+    if done is not None:
+        filters += ' AND f.done = :done'
+        params['done'] = done
+    if status is not None:
+        filters += ' AND p.status = :status'
+        params['status'] = status
+    rows = run_search(FEEDBACK_SEARCH.format(filters=filters), params)
+    return [{'id': row.id,
+             'publicationId': row.publication_id,
+             'done': bool(row.done),
+             'status': row.status,
+             'snippet': format_snippet(row.snippet),
+             'rank': row.rank} for row in rows]
+
+
+def search_publications(q, status=None, limit=20):
+    ### returns the publications whose name matches q, best matches first ###
+    filters = ''
+    params = {'q': q, 'limit': limit}
+    if status is not None:
+        filters += ' AND p.status = :status'
+        params['status'] = status
+    rows = run_search(PUBLICATION_SEARCH.format(filters=filters), params)
+    return [{'id': row.id,
+             'displayName': row.displayname,
+             'status': row.status,
+             'snippet': format_snippet(row.snippet),
+             'rank': row.rank} for row in rows]
+
+
+def format_snippet(snippet):
+    ### returns the HTML escaped snippet with the matched terms in marks ###
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(
+        MATCH_START, SNIPPET_START).replace(MATCH_END, SNIPPET_END)
+
+
+def run_search(statement, params):
+    params.update({'start': MATCH_START,
+                   'end': MATCH_END,
+                   'tokens': SNIPPET_TOKENS})
+    return db.session.execute(text(statement), params).fetchall()
@@ -0,0 +1,84 @@
+from models.db import db
+from models.publication import Publication
+from models.feedback import Feedback
+from models.role import Role
+from sqlalchemy import func, case
+
+# workflow steps, whose median time since the creation is reported
+WORKFLOW_STEPS = (
+    ('okAuthor', Publication.okAuthor),
+    ('published', Publication.published),
+    ('exported', Publication.exported)
+)
+
+
+def seconds_between(start, end):
+    ### difference of two timestamp columns in seconds ###
+    if db.engine.dialect.name == 'sqlite':
+        return (func.julianday(end) - func.julianday(start)) * 86400
+    return func.extract('epoch', end - start)
+
+
+def median(expression):
+    ###
+    # returns the median of the non-null values of expression,
+    # computed by the database in one query
+    ###
+    ordered = db.session.query(
+        expression.label('value'),
+        func.row_number().over(order_by=expression).label('position'),
+        func.count().over().label('total')
+    ).filter(expression.isnot(None)).subquery()
+    ### the middle row, or the two middle rows of an even number ###
+    return db.session.query(func.avg(ordered.c.value)).filter(
+        ordered.c.position.in_([(ordered.c.total + 1) / 2,
+                                (ordered.c.total + 2) / 2])
+    ).scalar()
+
+
+def get_stats():
+    ###
+    # returns the dashboard statistics, all computed with SQL aggregates:
+    # publications per status, open and done feedbacks, median seconds
+    # from the creation to the workflow steps and feedbacks per author
+    ###
+    by_status = dict(db.session.query(
+        Publication.status, func.count(Publication.id)
+    ).group_by(Publication.status).all())
+
+    done_counts = dict(db.session.query(
+        Feedback.done, func.count(Feedback.id)
+    ).group_by(Feedback.done).all())
+    done = done_counts.get(True, 0)
+    total = sum(done_counts.values())
+
+    durations = {}
+    for name, column in WORKFLOW_STEPS:
+        value = median(seconds_between(Publication.created, column))
+        durations[name] = None if value is None else round(float(value), 1)
+
+    done_sum = func.sum(case([(Feedback.done.is_(True), 1)], else_=0))
+    curators = db.session.query(
+        Feedback.author_id, Role.name, func.count(Feedback.id), done_sum
+    ).outerjoin(Role, Role.id == Feedback.author_id).group_by(
+        Feedback.author_id, Role.name
+    ).order_by(func.count(Feedback.id).desc(), Feedback.author_id).all()
+
+    return {
+        'publications': {
+            'total': sum(by_status.values()),
+            'byStatus': by_status
+        },
+        'feedbacks': {
+            'total': total,
+            'open': total - done,
+            'done': done
+        },
+        'medianSeconds': durations,
+        'curators': [{'id': author_id,
+                      'name': name,
+                      'feedbacks': count,
+                      'open': count - (done or 0),
+                      'done': done or 0}
+                     for author_id, name, count, done in curators]
+    }
@@ -0,0 +1,144 @@
+from os import environ
+from flask import current_app, jsonify, Response
+from models.db import db
+from models.publication import Publication
+from models.membership import RoleMembership
+from cache import LRUCache
+import json
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# JSON library encoding the list bodies: json (default) or orjson,
+# and number of cached publication fragments
+JSON_ENCODER = environ.get('JSON_ENCODER', 'json')
+FRAGMENT_CACHE_SIZE = int(environ.get('FRAGMENT_CACHE_SIZE', 10000))
+
+# characters json.dumps escapes with ensure_ascii, but orjson doesn't
+UNESCAPED = re.compile('[^\x20-\x7e]')
+
+
+def json_dumps(value):
+    ### the output of jsonify: sorted keys, no spaces, ASCII only ###
+    return json.dumps(value, sort_keys=True, separators=(',', ':'))
+
+
+def orjson_dumps(value):
+    ###
+    # orjson writes non ASCII characters and DEL unescaped,
+    # such values are left to json_dumps to stay byte identical
+    ###
+    text = orjson.dumps(value, option=orjson.OPT_SORT_KEYS).decode()
+    if UNESCAPED.search(text) is not None:
+        return json_dumps(value)
+    return text
+
+
+def get_encoder(name):
+    ### returns the dumps function of the JSON library name ###
+    if name == 'json':
+        return json_dumps
+    if name == 'orjson':
+        if orjson is None:
+            raise ValueError('orjson is not installed')
+        return orjson_dumps
+    raise ValueError('Unknown JSON encoder: {}'.format(name))
+
+
+dumps = get_encoder(JSON_ENCODER)
+
+
+def format_date(value):
+    ### same as value.strftime('%d.%m.%Y') ###
+    return '{:02d}.{:02d}.{}'.format(value.day, value.month, value.year)
+
+
+# serialized JSON objects of single publications, keyed by id, version
+# and the serialized keys, a write bumps the version like for the ETags
+fragment_cache = LRUCache(FRAGMENT_CACHE_SIZE)
+
+
+class PublicationSerializer:
+    ###
+    # serializes rows of a column query into the JSON objects of
+    # Publication.format, without building Publication instances
+    # @INPUTS
+    #    fields: optional collection of JSON keys (default: all keys)
+    ###
+    def __init__(self, fields=None):
+        self.keys = tuple(key for key in Publication.json_fields
+                          if fields is None or key in fields)
+        self.dates = frozenset(key for key in self.keys
+                               if key in Publication.date_fields)
+
+    def columns(self):
+        ### id and version identify the fragment, the keys follow ###
+        return [Publication.id, Publication.version
+                ] + Publication.load_attributes(self.keys)
+
+    def to_dict(self, row):
+        response = {}
+        for key, value in zip(self.keys, row[2:]):
+            if key in self.dates:
+                if value is None:
+                    continue
+                value = format_date(value)
+            response[key] = value
+        return response
+
+    def fragment(self, row):
+        ### returns the cached or freshly serialized JSON object of row ###
+        key = (row[0], row[1], self.keys)
+        text = fragment_cache.get(key)
+        if text is None:
+            text = dumps(self.to_dict(row))
+            fragment_cache.put(key, text)
+        return text
+
+    def array(self, rows):
+        return '[{}]'.format(','.join(self.fragment(row) for row in rows))
+
+
+def serialize_roles(rows):
+    ###
+    # returns the JSON array of Role.format of the (id, name) rows,
+    # their roles are read with one column query
+    ###
+    names = {}
+    if len(rows) > 0:
+        memberships = db.session.query(
+            RoleMembership.role_id, RoleMembership.name
+        ).filter(RoleMembership.role_id.in_([row[0] for row in rows])
+                 ).order_by(RoleMembership.role_id, RoleMembership.position)
+        for role_id, name in memberships:
+            names.setdefault(role_id, []).append(name)
+    return dumps([{'id': role_id, 'name': name,
+                   'roles': names.get(role_id, [])}
+                  for role_id, name in rows])
+
+
+def json_response(response, raw=None):
+    ###
+    # returns the JSON response of jsonify(response) byte for byte
+    # @INPUTS
+    #    raw: dict of keys and their values serialized already,
+    #         written into the body unchanged
+    ###
+    raw = raw or {}
+    config = current_app.config
+    if (current_app.debug or config['JSONIFY_PRETTYPRINT_REGULAR'] or
+            not config['JSON_SORT_KEYS'] or not config['JSON_AS_ASCII']):
+        ### other formats than the compact default are left to jsonify ###
+        for key, text in raw.items():
+            response[key] = json.loads(text)
+        return jsonify(response)
+    members = []
+    for key in sorted(set(response) | set(raw)):
+        text = raw[key] if key in raw else dumps(response[key])
+        members.append('{}:{}'.format(json_dumps(key), text))
+    return Response('{{{}}}\n'.format(','.join(members)),
+                    mimetype=config['JSONIFY_MIMETYPE'])
@@ -1,9 +1,38 @@
 import unittest
 import os
+import json
 import sys
+import time
+import sqlite3
+import shutil
+import tempfile
+import atexit
 sys.path.append('..')
-from app import app
-from auth import randomString, encode_jwt, decode_jwt
+
+# the tests write to a copy of the bundled database in a temporary
+# directory, so running them leaves models/pubworkflow.db unchanged
+if 'DATABASE_URL' not in os.environ:
+    test_dir = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, test_dir, True)
+    shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'models', 'pubworkflow.db'), test_dir)
+    os.environ['DATABASE_URL'] = 'sqlite:///{}'.format(
+        os.path.join(test_dir, 'pubworkflow.db'))
+from app import (app, create_app, MAX_PAGE_SIZE, MAX_RESOLVE_SIZE,
+                 MAX_RESUME_SIZE)
+from flask import jsonify
+from auth import (randomString, encode_jwt, decode_jwt, TokenCache,
+                  IssuedTokenCache, issued_tokens)
+from metrics import metrics
+import serializers
+from models.db import (db, get_engine_options, get_sqlite_pragmas,
+                       bundled_database_path)
+from models.publication import Publication
+from models.role import Role
+from models.history import HistoryEntry
+from datetime import datetime
+from models.events import EventBroker, event_broker, record_event
+from sqlalchemy import event, text
 
 
 class Test_Pubworkflow(unittest.TestCase):
@@ -81,6 +110,31 @@ class Test_Pubworkflow(unittest.TestCase):
             self.assertEqual(response.status_code, code)
             self.assertEqual(data.get('error'), code)
 
+    def count_queries(self, method, url, **kwargs):
+        ###
+        # performs a request with the test client
+        # and counts the SQL statements issued while handling it
+        ###
+        response, statements = self.record_statements(method, url, **kwargs)
+        return response, len(statements)
+
+    def record_statements(self, method, url, **kwargs):
+        ###
+        # performs a request with the test client
+        # and returns the SQL statements issued while handling it
+        ###
+        statements = []
+
+        def count_statement(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+        try:
+            response = getattr(self.client(), method)(url, **kwargs)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statement)
+        return response, statements
+
     def get_existing_pid(self):
         response = self.client().get(
             '/publications',
@@ -124,6 +178,143 @@ class Test_Pubworkflow(unittest.TestCase):
         self.assertEqual(payload["name"], new_user["name"])
         self.assertEqual(payload["email"], new_user["email"])
 
+    def test_token_reuse_and_refresh(self):
+        response = self.client().post(
+            '/roles',
+            json={'name': 'script', 'email': 'script@test.de',
+                  'roles': ['Curator']},
+            headers=self.make_header('Admin'))
+        identifier = response.json.get('identifier')
+        url = '/roles/{}/token'.format(identifier)
+
+        issued_tokens.clear()
+        response, count = self.count_queries('get', url)
+        self.check_success(response)
+        token = response.json['token']
+        self.assertEqual(response.json['expires'], decode_jwt(token)['exp'])
+        self.assertGreater(count, 0)
+        # the issued token is reused without a database lookup #
+        response, count = self.count_queries('get', url)
+        self.assertEqual(response.json['token'], token)
+        self.assertEqual(count, 0)
+
+        # a refresh token renews the access token without a lookup #
+        refresh_token = response.json['refreshToken']
+        response, count = self.count_queries(
+            'post', '/auth/refresh', json={'refreshToken': refresh_token})
+        self.check_success(response)
+        self.assertEqual(count, 0)
+        payload = decode_jwt(response.json['token'])
+        self.assertEqual(payload['roles'], ['Curator'])
+        self.assertEqual(payload['name'], 'script')
+        self.assertNotIn('type', payload)
+        response = self.client().get(
+            '/publications/{}/feedbacks'.format(self.get_existing_pid()),
+            headers={'Authorization': 'bearer {}'.format(
+                response.json['token'])})
+        self.check_success(response)
+
+        # refresh and access tokens can't be swapped #
+        response = self.client().get(
+            '/publications', headers={'Authorization': 'bearer {}'.format(
+                refresh_token)})
+        self.check_error(response, 401)
+        response = self.client().post('/auth/refresh',
+                                      json={'refreshToken': token})
+        self.check_error(response, 401)
+        for body in ({}, [1], 'x'):
+            response = self.client().post('/auth/refresh', json=body)
+            self.check_error(response, 400)
+
+    def test_issued_token_cache(self):
+        cache = IssuedTokenCache(maxsize=1, min_lifetime=60)
+        cache.put('a', {'token': 'old', 'expires': time.time() + 30})
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', {'token': 'a', 'expires': time.time() + 120})
+        cache.put('b', {'token': 'b', 'expires': time.time() + 120})
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b')['token'], 'b')
+
+        token = encode_jwt({'roles': ['Author']}, 60)
+        self.assertAlmostEqual(decode_jwt(token)['exp'], time.time() + 60,
+                               delta=2)
+
+    def test_create_user_in_one_transaction(self):
+        new_user = {
+            'name': 'testuser',
+            'email': 'testuser@test.de',
+            'roles': ['Author', 'Curator', 'Admin']
+        }
+        response, statements = self.record_statements(
+            'post', '/roles', json=new_user,
+            headers=self.make_header('Admin'))
+        self.check_success(response)
+        self.assertEqual(response.json['person']['roles'], new_user['roles'])
+        # the person and all memberships are inserted, no UPDATE per role #
+        writes = [st.split()[0].upper() for st in statements
+                  if st.split()[0].upper() in ('INSERT', 'UPDATE')]
+        self.assertEqual(writes, ['INSERT', 'INSERT'])
+
+    def test_create_users_bulk(self):
+        team = [{'name': 'reviewer {}'.format(i),
+                 'email': 'reviewer{}@test.de'.format(i),
+                 'roles': ['Curator']} for i in range(5)]
+        team.append({'email': 'nameless@test.de'})
+        response = self.client().post('/roles/bulk',
+                                      json=team,
+                                      headers=self.make_header('Admin'))
+        self.check_success(response)
+        self.assertEqual(response.json['created'], 5)
+        self.assertEqual(response.json['failed'], 1)
+        results = response.json['results']
+        self.assertEqual(results[5]['error'], 400)
+
+        # every identifier yields a token with the roles #
+        for result in results[:5]:
+            self.assertEqual(result['person']['id'], result['created'])
+            self.assertEqual(result['person']['roles'], ['Curator'])
+            response = self.client().get(
+                '/roles/{}/token'.format(result['identifier']))
+            self.check_success(response)
+            payload = decode_jwt(response.json['token'])
+            self.assertEqual(payload['id'], result['created'])
+            self.assertEqual(payload['roles'], ['Curator'])
+
+        response = self.client().post('/roles/bulk',
+                                      json=team,
+                                      headers=self.make_header('Curator'))
+        self.check_error(response, 403)
+
+    def test_get_users_by_role(self):
+        response = self.client().post(
+            '/roles',
+            json={'name': 'curator', 'roles': ['Curator', 'Curator']},
+            headers=self.make_header('Admin'))
+        self.check_success(response)
+        person = response.json['person']
+        self.assertEqual(person['roles'], ['Curator'])
+
+        response, count = self.count_queries(
+            'get', '/roles?role=Curator',
+            headers=self.make_header('Admin'))
+        self.check_success(response)
+        persons = response.json['persons']
+        self.assertIn(person['id'], [p['id'] for p in persons])
+        for p in persons:
+            self.assertIn('Curator', p['roles'])
+        # persons and their memberships #
+        self.assertEqual(count, 2)
+
+        response = self.client().get('/roles?role=Curator&limit=1',
+                                     headers=self.make_header('Admin'))
+        self.check_success(response)
+        self.assertEqual(len(response.json['persons']), 1)
+        self.assertIn('next', response.json)
+
+        response = self.client().get('/roles?role=Curator',
+                                     headers=self.make_header('Curator'))
+        self.check_error(response, 403)
+
     def test_getPublications(self):
         response = self.client().get(
             '/publications',
@@ -131,6 +322,78 @@ class Test_Pubworkflow(unittest.TestCase):
         )
         self.check_success(response)
 
+    def test_paginate_publications(self):
+        response = self.client().get(
+            '/publications?limit=2',
+            headers=self.make_header('Admin'))
+        self.check_success(response)
+        first_page = response.json.get('publications')
+        self.assertLessEqual(len(first_page), 2)
+        next_id = response.json.get('next')
+        self.assertIsNotNone(next_id)
+        self.assertEqual(next_id, first_page[-1]['id'])
+
+        # next page starts after the cursor #
+        response = self.client().get(
+            '/publications?limit=2&after={}'.format(next_id),
+            headers=self.make_header('Admin'))
+        self.check_success(response)
+        for pub in response.json.get('publications'):
+            self.assertGreater(pub['id'], next_id)
+
+        # malformed cursor, expecting 400 #
+        response = self.client().get(
+            '/publications?after=abc',
+            headers=self.make_header('Admin'))
+        self.check_error(response, 400)
+
+    def test_filter_publications(self):
+        response = self.client().post('/publications',
+                                      json=self.newPublication,
+                                      headers=self.make_header('Admin'))
+        pid = response.json.get('created')
+
+        response = self.client().get(
+            '/publications?status=finished&databaseId=254&doi={}'.format(
+                self.newPublication['datasetGlobalId']),
+            headers=self.make_header('Admin'))
+        self.check_success(response)
+        pubs = response.json.get('publications')
+        self.assertIn(pid, [p['id'] for p in pubs])
+        for pub in pubs:
+            self.assertEqual(pub['status'], 'finished')
+            self.assertEqual(pub['doi'],
+                             self.newPublication['datasetGlobalId'])
+
+        # not published yet #
+        response = self.client().get(
+            '/publications?publishedFrom=2000-01-01',
+            headers=self.make_header('Admin'))
+        self.check_success(response)
+        self.assertNotIn(pid,
+                         [p['id'] for p in response.json['publications']])
+
+        response = self.client().get(
+            '/publications?exportedTo=32.13.2020',
+            headers=self.make_header('Admin'))
+        self.check_error(response, 400)
+
+        self.client().delete('/publications/{}'.format(pid),
+                             headers=self.make_header('Admin'))
+
+    def test_publication_fields(self):
+        response = self.client().get(
+            '/publications?limit=5&fields=doi,status',
+            headers=self.make_header('Admin'))
+        self.check_success(response)
+        for pub in response.json.get('publications'):
+            self.assertEqual(set(pub.keys()), {'id', 'doi', 'status'})
+
+        response = self.client().get(
+            '/publications?fields=secret',
+            headers=self.make_header('Admin'))
+        self.check_error(response, 400)
+
     def test_get_non_existing_path(self):
         response = self.client().get(
             '/publicatoins',
@@ -172,6 +435,235 @@ class Test_Pubworkflow(unittest.TestCase):
         self.check_success(response)
         self.assertEqual(response.json.get('deleted'), pubId)
 
+    def test_bulk_import_publications(self):
+        existing = self.client().post('/publications',
+                                      json=self.newPublication,
+                                      headers=self.make_header('Admin'))
+        existing_pid = existing.json.get('created')
+        duplicate = randomString(12)
+        items = [
+            {'datasetId': 300 + i,
+             'invocationId': randomString(12),
+             'datasetDisplayName': 'bulk imported dataset {}'.format(i),
+             'datasetGlobalId': 'doi:10.76764/darus-9{}'.format(i)}
+            for i in range(3)]
+        items.append({'datasetId': 303,
+                      'invocationId': duplicate,
+                      'datasetDisplayName': 'first of two',
+                      'datasetGlobalId': 'doi:10.76764/darus-903'})
+        items.append({'datasetId': 304,
+                      'invocationId': duplicate,
+                      'datasetDisplayName': 'second of two',
+                      'datasetGlobalId': 'doi:10.76764/darus-904'})
+        items.append({'datasetId': 305, 'invocationId': randomString(12)})
+        items.append(dict(self.newPublication))
+
+        response = self.client().post('/publications/bulk',
+                                      json=items,
+                                      headers=self.make_header('Admin'))
+        self.check_success(response)
+        results = response.json.get('results')
+        self.assertEqual(len(results), len(items))
+        self.assertEqual(response.json.get('created'), 4)
+        self.assertEqual(response.json.get('failed'), 3)
+        self.assertEqual([r['index'] for r in results],
+                         list(range(len(items))))
+        for result in results[:4]:
+            self.assertTrue(result['success'])
+        self.assertEqual(results[4]['error'], 409)
+        self.assertEqual(
+            results[5]['message'],
+            'The following fields are missing: '
+            'datasetDisplayName, datasetGlobalId')
+        self.assertEqual(results[6]['error'], 409)
+
+        # NDJSON body #
+        body = '\n'.join([
+            json.dumps({'datasetId': 306,
+                        'invocationId': randomString(12),
+                        'datasetDisplayName': 'from NDJSON',
+                        'datasetGlobalId': 'doi:10.76764/darus-906'}),
+            'not json',
+            json.dumps({'datasetId': 307,
+                        'invocationId': 307,
+                        'datasetDisplayName': 'numeric invocationId',
+                        'datasetGlobalId': 'doi:10.76764/darus-907'})])
+        response = self.client().post(
+            '/publications/bulk',
+            data=body,
+            content_type='application/x-ndjson',
+            headers=self.make_header('Admin'))
+        self.check_success(response)
+        ndjson_results = response.json.get('results')
+        self.assertTrue(ndjson_results[0]['success'])
+        self.assertEqual(ndjson_results[1]['error'], 400)
+        self.assertEqual(ndjson_results[2]['error'], 400)
+        self.assertEqual(ndjson_results[2]['message'],
+                         'invocationId is not a string')
+
+        response = self.client().get(
+            '/publications/{}'.format(ndjson_results[0]['created']),
+            headers=self.make_header('Admin'))
+        self.assertEqual(response.json['publication']['status'], 'finished')
+
+        for result in results[:4] + ndjson_results[:1]:
+            self.client().delete(
+                '/publications/{}'.format(result['created']),
+                headers=self.make_header('Admin'))
+        self.client().delete('/publications/{}'.format(existing_pid),
+                             headers=self.make_header('Admin'))
+
+        response = self.client().post('/publications/bulk',
+                                      json={'no': 'array'},
+                                      headers=self.make_header('Admin'))
+        self.check_error(response, 400)
+
+    def test_export_publications(self):
+        response = self.client().post('/publications',
+                                      json=self.newPublication,
+                                      headers=self.make_header('Admin'))
+        pid = response.json.get('created')
+        response = self.client().post(
+            '/publications/{}/feedbacks'.format(pid),
+            json={'text': 'Please add a license, too.'},
+            headers=self.make_header('Curator'))
+        fid = response.json.get('created')
+
+        response = self.client().get(
+            '/publications/export.ndjson?status=feedbacks to do',
+            headers=self.make_header('Admin'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        pubs = [json.loads(line) for line in response.data.splitlines()]
+        self.assertIn(pid, [p['id'] for p in pubs])
+        for pub in pubs:
+            self.assertEqual(pub['status'], 'feedbacks to do')
+
+        response = self.client().get(
+            '/publications/export.csv?fields=doi,status',
+            headers=self.make_header('Admin'))
+        self.assertEqual(response.status_code, 200)
+        lines = response.data.decode().splitlines()
+        self.assertEqual(lines[0], 'id,doi,status')
+        self.assertIn('{},{},feedbacks to do'.format(
+            pid, self.newPublication['datasetGlobalId']), lines)
+
+        response = self.client().get(
+            '/feedbacks/export.ndjson?done=false&status=feedbacks to do',
+            headers=self.make_header('Admin'))
+        self.assertEqual(response.status_code, 200)
+        feedbacks = [json.loads(line)
+                     for line in response.data.splitlines()]
+        self.assertIn(fid, [f['id'] for f in feedbacks])
+        for fb in feedbacks:
+            self.assertFalse(fb['done'])
+
+        response = self.client().get(
+            '/feedbacks/export.csv?done=true',
+            headers=self.make_header('Admin'))
+        self.assertEqual(response.data.decode().splitlines()[0],
+                         'id,publicationId,text,done,author')
+        self.assertNotIn('Please add a license, too.',
+                         response.data.decode())
+
+        response = self.client().get(
+            '/publications/export.xml',
+            headers=self.make_header('Admin'))
+        self.check_error(response, 404)
+        response = self.client().get(
+            '/publications/export.csv',
+            headers=self.make_header('Curator'))
+        self.check_error(response, 403)
+
+        self.client().delete(
+            '/publications/{}/feedbacks/{}'.format(pid, fid),
+            headers=self.make_header('Curator'))
+        self.client().delete('/publications/{}'.format(pid),
+                             headers=self.make_header('Admin'))
+
+    def wait_for_job(self, job):
+        ### polls the job until it is done ###
+        url = '/jobs/{}'.format(job['id'])
+        for i in range(100):
+            response = self.client().get(url,
+                                         headers=self.make_header('Admin'))
+            self.check_success(response)
+            job = response.json['job']
+            if job['status'] in ('finished', 'failed'):
+                return job
+            time.sleep(0.05)
+        self.fail('job {} did not finish'.format(job['id']))
+
+    def test_batch_publish_and_export(self):
+        pids = []
+        for i in range(3):
+            publication = dict(self.newPublication,
+                               invocationId=randomString(12))
+            response = self.client().post('/publications',
+                                          json=publication,
+                                          headers=self.make_header('Admin'))
+            pids.append(response.json.get('created'))
+        response = self.client().post(
+            '/publications/{}/feedbacks'.format(pids[2]),
+            headers=self.make_header('Curator'),
+            json={'text': 'Please add a license.'})
+        fid = response.json['created']
+
+        response = self.client().post(
+            '/publications/publish',
+            json=pids + [999999, pids[0]],
+            headers=self.make_header('Admin'))
+        self.assertEqual(response.status_code, 202)
+        job = response.json['job']
+        self.assertTrue(response.headers['Location'].endswith(
+            '/jobs/{}'.format(job['id'])))
+        self.assertEqual(job['type'], 'publish')
+        self.assertEqual(job['total'], 4)
+        job = self.wait_for_job(job)
+        self.assertEqual(job['status'], 'finished')
+        self.assertEqual((job['processed'], job['succeeded'], job['failed']),
+                         (4, 2, 2))
+        results = job['results']
+        self.assertEqual([r['id'] for r in results], pids + [999999])
+        self.assertEqual(results[0]['publication']['status'], 'published')
+        self.assertEqual(results[2]['error'], 409)
+        self.assertEqual(results[2]['message'],
+                         'There are feedbacks to do before publication')
+        self.assertEqual(results[3]['error'], 404)
+
+        response = self.client().post(
+            '/publications/export', json=[pids[0], pids[2]],
+            headers=self.make_header('Admin'))
+        job = self.wait_for_job(response.json['job'])
+        self.assertTrue(job['results'][0]['success'])
+        self.assertEqual(job['results'][1]['message'],
+                         'Only published publication can be exported')
+        response = self.client().get('/publications/{}'.format(pids[0]),
+                                     headers=self.make_header('Admin'))
+        self.assertEqual(response.json['publication']['status'], 'exported')
+
+        response = self.client().post(
+            '/publications/publish', json={'ids': pids},
+            headers=self.make_header('Admin'))
+        self.check_error(response, 400)
+        response = self.client().post(
+            '/publications/export', json=pids,
+            headers=self.make_header('Curator'))
+        self.check_error(response, 403)
+        response = self.client().get('/jobs/{}'.format(job['id']),
+                                     headers=self.make_header('Curator'))
+        self.check_error(response, 403)
+        response = self.client().get('/jobs/unknown',
+                                     headers=self.make_header('Admin'))
+        self.check_error(response, 404)
+
+        self.client().delete(
+            '/publications/{}/feedbacks/{}'.format(pids[2], fid),
+            headers=self.make_header('Curator'))
+        for pid in pids:
+            self.client().delete('/publications/{}'.format(pid),
+                                 headers=self.make_header('Admin'))
+
     def test_get_unexistingPublication(self):
         response = self.client().get(
             '/publications/999',
@@ -199,6 +691,13 @@ class Test_Pubworkflow(unittest.TestCase):
                              'The following field is missing: {}'.format(key))
             self.newPublication[key] = oldval
 
+    def test_create_publication_with_numeric_invocation_id(self):
+        response = self.client().post(
+            '/publications',
+            headers=self.make_header('Admin'),
+            json=dict(self.newPublication, invocationId=308))
+        self.check_error(response, 400, 'invocationId is not a string')
+
     def test_create_change_delete_feedback(self):
         # Find publication to add feedback #
         p_id = self.get_existing_pid()
@@ -259,6 +758,16 @@ class Test_Pubworkflow(unittest.TestCase):
         feedback = response.json.get('feedback')
         self.assertTrue(feedback["done"])
 
+        # done has to be a boolean #
+        for url, role in (('/publications/{}/feedbacks/{}/done', 'Author'),
+                          ('/publications/{}/feedbacks/{}', 'Curator')):
+            response = self.client().patch(
+                url.format(p_id, fid),
+                headers=self.make_header(role),
+                json={'done': 'yes'}
+            )
+            self.check_error(response, 400)
+
         # try to change feedback without information, expecting 400 #
         response = self.client().patch(
             '/publications/{}/feedbacks/{}'.format(p_id, fid),
@@ -275,6 +784,879 @@ class Test_Pubworkflow(unittest.TestCase):
         self.check_success(response)
         self.assertEqual(response.json.get('deleted'), fid)
 
+    def test_feedback_list_embed(self):
+        p_id = self.get_existing_pid()
+        response = self.client().post(
+            '/publications/{}/feedbacks'.format(p_id),
+            headers=self.make_header('Curator'),
+            json={'text': 'Please add a license.'})
+        fid = response.json['created']
+
+        # compact representation: publication only once at the top #
+        response = self.client().get(
+            '/publications/{}/feedbacks'.format(p_id),
+            headers=self.make_header('Author'))
+        self.check_success(response)
+        self.assertEqual(response.json['publication']['id'], p_id)
+        for fb in response.json.get('feedbacks'):
+            self.assertNotIn('publication', fb)
+            self.assertEqual(fb['publicationId'], p_id)
+
+        # nested representation on request #
+        response = self.client().get(
+            '/publications/{}/feedbacks?embed=publication'.format(p_id),
+            headers=self.make_header('Author'))
+        self.check_success(response)
+        for fb in response.json.get('feedbacks'):
+            self.assertNotIn('publicationId', fb)
+            self.assertEqual(fb['publication']['id'], p_id)
+
+        response = self.client().get(
+            '/publications/{}/feedbacks?embed=author'.format(p_id),
+            headers=self.make_header('Author'))
+        self.check_error(response, 400)
+
+        self.client().delete(
+            '/publications/{}/feedbacks/{}'.format(p_id, fid),
+            headers=self.make_header('Curator'))
+
+    def test_version_increment(self):
+        pid = self.get_existing_pid()
+        with self.app.app_context():
+            pub = Publication.query.get(pid)
+            version = pub.version
+            # another writer commits a bump after the row was loaded #
+            with db.engine.begin() as connection:
+                connection.execute(
+                    text('UPDATE publication SET version = version + 1 '
+                         'WHERE id = :id'), {'id': pid})
+            pub.touch()
+            pub.touch()
+            db.session.commit()
+            # both bumps count, the second touch in one transaction not #
+            self.assertEqual(Publication.get_version(pid), version + 2)
+
+    def test_open_feedbacks_increment(self):
+        response = self.client().post('/publications',
+                                      json=self.newPublication,
+                                      headers=self.make_header('Admin'))
+        pid = response.json.get('created')
+        with self.app.app_context():
+            pub = Publication.query.get(pid)
+            # another writer adds a feedback after the row was loaded #
+            with db.engine.begin() as connection:
+                connection.execute(
+                    text('UPDATE publication SET openFeedbacks = '
+                         'openFeedbacks + 1 WHERE id = :id'), {'id': pid})
+            pub.change_open_feedbacks(1)
+            db.session.commit()
+            # both feedbacks are counted #
+            self.assertEqual(pub.openFeedbacks, 2)
+            self.assertEqual(pub.status, 'feedbacks to do')
+            pub.change_open_feedbacks(-2)
+            db.session.commit()
+            self.assertEqual(pub.status, 'finished')
+        self.client().delete('/publications/{}'.format(pid),
+                             headers=self.make_header('Admin'))
+
+    def test_conditional_get(self):
+        response = self.client().post('/publications',
+                                      json=self.newPublication,
+                                      headers=self.make_header('Admin'))
+        pid = response.json.get('created')
+        url = '/publications/{}'.format(pid)
+        response = self.client().post(
+            '{}/feedbacks'.format(url),
+            headers=self.make_header('Curator'),
+            json={'text': 'Please add a license.'})
+        fid = response.json['created']
+        urls = [url,
+                '{}/feedbacks'.format(url),
+                '{}/feedbacks?embed=publication'.format(url),
+                '{}/feedbacks/{}'.format(url, fid)]
+
+        etags = []
+        for u in urls:
+            response = self.client().get(u, headers=self.make_header('Author'))
+            self.check_success(response)
+            etag = response.headers['ETag']
+            self.assertTrue(etag.startswith('"'))
+            self.assertNotIn(etag, etags)
+            etags.append(etag)
+
+            # a repeated poll costs one lookup of the version #
+            headers = self.make_header('Author')
+            headers['If-None-Match'] = etag
+            response, count = self.count_queries('get', u, headers=headers)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.headers['ETag'], etag)
+            self.assertEqual(response.get_data(), b'')
+            self.assertEqual(count, 1)
+
+        # any write to the publication or its feedbacks changes the ETags #
+        self.client().patch('{}/feedbacks/{}'.format(url, fid),
+                            headers=self.make_header('Curator'),
+                            json={'text': 'Please add a license file.'})
+        for u, etag in zip(urls, etags):
+            headers = self.make_header('Author')
+            headers['If-None-Match'] = etag
+            response = self.client().get(u, headers=headers)
+            self.check_success(response)
+            self.assertNotEqual(response.headers['ETag'], etag)
+        response = self.client().get('{}/feedbacks/{}'.format(url, fid),
+                                     headers=self.make_header('Author'))
+        self.assertEqual(response.json['feedback']['text'],
+                         'Please add a license file.')
+
+        self.client().delete('{}/feedbacks/{}'.format(url, fid),
+                             headers=self.make_header('Curator'))
+        response = self.client().get(url, headers=self.make_header('Author'))
+        self.assertNotEqual(response.headers['ETag'], etags[0])
+        self.client().delete(url, headers=self.make_header('Admin'))
+        response = self.client().get(url, headers=self.make_header('Author'))
+        self.check_error(response, 404)
+
+    def test_serialized_lists(self):
+        publication = dict(self.newPublication)
+        publication['datasetDisplayName'] = 'Messdaten \u00fcber Str\u00f6mung'
+        response = self.client().post('/publications', json=publication,
+                                      headers=self.make_header('Admin'))
+        pid = response.json.get('created')
+
+        def expected(fields=None):
+            with app.test_request_context():
+                publications = Publication.query.order_by(
+                    Publication.id).limit(MAX_PAGE_SIZE + 1).all()
+                response = {'success': True,
+                            'publications': [p.format(fields) for p in
+                                             publications[:MAX_PAGE_SIZE]],
+                            'next': None}
+                if len(publications) > MAX_PAGE_SIZE:
+                    response['next'] = publications[MAX_PAGE_SIZE - 1].id
+                return jsonify(response).get_data()
+
+        # the same bytes as the formatted publications, cached or not #
+        url = '/publications?limit={}'.format(MAX_PAGE_SIZE)
+        for fields in (None, ['id', 'status', 'displayName', 'okAuthor']):
+            u = url if fields is None else '{}&fields={}'.format(
+                url, ','.join(fields))
+            for attempt in range(2):
+                response = self.client().get(
+                    u, headers=self.make_header('Admin'))
+                self.check_success(response)
+                self.assertEqual(response.get_data(), expected(fields))
+        self.assertIn(b'Messdaten \\u00fcber', response.get_data())
+
+        # a write bumps the version and the fragment is serialized anew #
+        self.client().post('/publications/{}/feedbacks'.format(pid),
+                           headers=self.make_header('Curator'),
+                           json={'text': 'Please add a license.'})
+        response = self.client().get(url, headers=self.make_header('Admin'))
+        self.assertEqual(response.get_data(), expected())
+        listed = [p for p in response.json['publications'] if p['id'] == pid]
+        self.assertEqual(listed[0]['status'], 'feedbacks to do')
+
+        with app.test_request_context():
+            persons = Role.query.order_by(Role.id).all()
+            roles = jsonify({'success': True,
+                             'persons': [p.format() for p in persons]})
+        response = self.client().get('/roles',
+                                     headers=self.make_header('Admin'))
+        self.check_success(response)
+        self.assertEqual(response.get_data(), roles.get_data())
+        self.client().delete('/publications/{}'.format(pid),
+                             headers=self.make_header('Admin'))
+
+    def test_history(self):
+        response = self.client().post('/publications',
+                                      json=self.newPublication,
+                                      headers=self.make_header('Admin'))
+        pid = response.json.get('created')
+        url = '/publications/{}'.format(pid)
+        response = self.client().post(
+            '{}/feedbacks'.format(url), headers=self.make_header('Curator'),
+            json={'text': 'Please add a license.'})
+        fid = response.json['created']
+        self.client().patch('{}/feedbacks/{}'.format(url, fid),
+                            headers=self.make_header('Curator'),
+                            json={'text': 'Please add a license file.'})
+        self.client().patch('{}/feedbacks/{}/done'.format(url, fid),
+                            headers=self.make_header('Author'),
+                            json={'done': True})
+        self.client().patch('{}/giveok'.format(url),
+                            headers=self.make_header('Author'))
+        self.client().patch('{}/publish'.format(url),
+                            headers=self.make_header('Admin'))
+        # a rejected transition leaves no entry #
+        response = self.client().patch('{}/publish'.format(url),
+                                       headers=self.make_header('Admin'))
+        self.check_error(response, 409)
+        self.client().patch('{}/export'.format(url),
+                            headers=self.make_header('Admin'))
+
+        # pages of two entries, linked by next #
+        entries = []
+        after = None
+        while True:
+            page = '{}/history?limit=2'.format(url)
+            if after is not None:
+                page += '&after={}'.format(after)
+            response = self.client().get(page,
+                                         headers=self.make_header('Author'))
+            self.check_success(response)
+            self.assertLessEqual(len(response.json['history']), 2)
+            entries.extend(response.json['history'])
+            after = response.json['next']
+            if after is None:
+                break
+        self.assertEqual([e['event'] for e in entries], [
+            'feedback.created', 'feedback.changed', 'feedback.done',
+            'publication.ok', 'publication.published',
+            'publication.exported'])
+        self.assertEqual(entries[0]['text'], 'Please add a license.')
+        self.assertEqual(entries[1]['text'], 'Please add a license file.')
+        self.assertEqual(entries[2]['feedbackId'], fid)
+        self.assertEqual(entries[2]['status'], 'finished')
+        self.assertEqual(entries[-1]['status'], 'exported')
+        self.assertEqual(entries, sorted(entries, key=lambda e: e['id']))
+
+        # entries older than the retention period are pruned #
+        with self.app.app_context():
+            HistoryEntry.query.filter(
+                HistoryEntry.publication_id == pid).update(
+                {'created': datetime(2000, 1, 1)})
+            db.session.commit()
+        result = self.app.test_cli_runner().invoke(
+            args=['prune-history', '--days', '3650'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Deleted', result.output)
+        with self.app.app_context():
+            self.assertEqual(HistoryEntry.query.filter(
+                HistoryEntry.publication_id == pid).count(), 0)
+            self.assertEqual(HistoryEntry.query.filter(
+                HistoryEntry.created < datetime(2000, 1, 2)).count(), 0)
+
+        # a new publication gets a new id and an empty history #
+        self.client().post('{}/feedbacks'.format(url),
+                           headers=self.make_header('Curator'),
+                           json={'text': 'Please add a license.'})
+        self.client().delete(url, headers=self.make_header('Admin'))
+        response = self.client().post(
+            '/publications', headers=self.make_header('Admin'),
+            json=dict(self.newPublication, invocationId=randomString(12)))
+        new_pid = response.json.get('created')
+        self.assertGreater(new_pid, pid)
+        response = self.client().get(
+            '/publications/{}/history'.format(new_pid),
+            headers=self.make_header('Author'))
+        self.check_success(response)
+        self.assertEqual(response.json['history'], [])
+        self.assertIsNone(response.json['next'])
+        self.client().delete('/publications/{}'.format(new_pid),
+                             headers=self.make_header('Admin'))
+        response = self.client().get('{}/history'.format(url),
+                                     headers=self.make_header('Author'))
+        self.check_error(response, 404)
+
+    def read_changes(self, since, limit=MAX_PAGE_SIZE):
+        ### follows the change feed from since to its end ###
+        changes = []
+        while True:
+            response = self.client().get(
+                '/changes?since={}&limit={}'.format(since, limit),
+                headers=self.make_header('Admin'))
+            self.check_success(response)
+            self.assertLessEqual(len(response.json['changes']), limit)
+            changes.extend(response.json['changes'])
+            since = response.json['next']
+            if not response.json['more']:
+                return changes, since
+
+    def test_changes(self):
+        changes, cursor = self.read_changes(0)
+        self.assertEqual([c['seq'] for c in changes],
+                         sorted(c['seq'] for c in changes))
+
+        response = self.client().post('/publications',
+                                      json=self.newPublication,
+                                      headers=self.make_header('Admin'))
+        pid = response.json.get('created')
+        url = '/publications/{}/feedbacks'.format(pid)
+        fids = []
+        for text in ('Please add a license.', 'Please add a README.'):
+            response = self.client().post(
+                url, headers=self.make_header('Curator'),
+                json={'text': text})
+            fids.append(response.json['created'])
+        self.client().patch('{}/{}/done'.format(url, fids[1]),
+                            headers=self.make_header('Author'),
+                            json={'done': True})
+        self.client().delete('{}/{}'.format(url, fids[0]),
+                             headers=self.make_header('Curator'))
+
+        # only the last state of every entity, in the order of the writes #
+        changes, next_cursor = self.read_changes(cursor)
+        self.assertGreater(next_cursor, cursor)
+        self.assertEqual([(c['type'], c['id']) for c in changes],
+                         [('feedback', fids[1]), ('publication', pid),
+                          ('feedback', fids[0])])
+        self.assertEqual(changes[1]['publication']['status'], 'finished')
+        self.assertTrue(changes[0]['feedback']['done'])
+        self.assertEqual(changes[0]['feedback']['publicationId'], pid)
+        self.assertEqual(changes[2], {'seq': changes[2]['seq'],
+                                      'type': 'feedback', 'id': fids[0],
+                                      'deleted': True,
+                                      'publicationId': pid})
+        self.assertEqual(self.read_changes(cursor, limit=1),
+                         (changes, next_cursor))
+
+        # nothing changed since the cursor #
+        self.assertEqual(self.read_changes(next_cursor), ([], next_cursor))
+
+        self.client().delete('/publications/{}'.format(pid),
+                             headers=self.make_header('Admin'))
+        changes, cursor = self.read_changes(next_cursor)
+        self.assertEqual([(c['type'], c['id'], c['deleted'])
+                          for c in changes], [('publication', pid, True)])
+
+        response = self.client().get('/changes',
+                                     headers=self.make_header('Author'))
+        self.check_error(response, 403)
+        response = self.client().get('/changes?since=x',
+                                     headers=self.make_header('Admin'))
+        self.check_error(response, 400)
+
+    def test_lookup_by_invocation_and_doi(self):
+        doi = 'doi:10.5072/FK2/{}'.format(randomString(6))
+        pids = []
+        invocation_ids = []
+        for i in range(2):
+            invocation_ids.append(randomString(12))
+            response = self.client().post(
+                '/publications', headers=self.make_header('Admin'),
+                json=dict(self.newPublication, datasetGlobalId=doi,
+                          invocationId=invocation_ids[i]))
+            pids.append(response.json.get('created'))
+
+        # one indexed lookup, shares the ETag of GET /publications/<id> #
+        response, count = self.count_queries(
+            'get', '/publications/by-invocation/{}'.format(
+                invocation_ids[1]), headers=self.make_header('Author'))
+        self.check_success(response)
+        self.assertEqual(response.json['publication']['id'], pids[1])
+        self.assertLessEqual(count, 2)
+        direct = self.client().get('/publications/{}'.format(pids[1]),
+                                   headers=self.make_header('Author'))
+        self.assertEqual(response.headers['ETag'], direct.headers['ETag'])
+        response = self.client().get(
+            '/publications/by-invocation/unknown',
+            headers=self.make_header('Author'))
+        self.check_error(response, 404)
+
+        # DOIs contain slashes #
+        response = self.client().get('/publications/by-doi/{}'.format(doi),
+                                     headers=self.make_header('Curator'))
+        self.check_success(response)
+        self.assertEqual([p['id'] for p in response.json['publications']],
+                         pids)
+        self.assertEqual(response.json['publications'][0]['doi'], doi)
+        response = self.client().get(
+            '/publications/by-doi/doi:10.5072/FK2/unknown',
+            headers=self.make_header('Curator'))
+        self.check_error(response, 404)
+
+        response, count = self.count_queries(
+            'post', '/publications/resolve',
+            json={'invocationIds': invocation_ids + ['unknown'],
+                  'dois': [doi, 'doi:10.5072/FK2/unknown']},
+            headers=self.make_header('Author'))
+        self.check_success(response)
+        self.assertEqual(count, 1)
+        resolved = response.json['invocationIds']
+        self.assertEqual([resolved[i]['id'] for i in invocation_ids], pids)
+        self.assertIsNone(resolved['unknown'])
+        self.assertEqual([p['id'] for p in response.json['dois'][doi]], pids)
+        self.assertEqual(response.json['dois']['doi:10.5072/FK2/unknown'], [])
+
+        for body in ({'invocationIds': 'abc'}, {'dois': [1]}, [doi],
+                     {'invocationIds': ['x'] * (MAX_RESOLVE_SIZE + 1)}):
+            response = self.client().post('/publications/resolve', json=body,
+                                          headers=self.make_header('Author'))
+            self.check_error(response, 400)
+        response = self.client().get('/publications/by-doi/{}'.format(doi))
+        self.check_error(response, 401)
+        for pid in pids:
+            self.client().delete('/publications/{}'.format(pid),
+                                 headers=self.make_header('Admin'))
+
+    def test_resume(self):
+        pids = []
+        pre_ids = [randomString(12) for i in range(4)]
+        for pre_id in pre_ids:
+            response = self.client().post(
+                '/publications', headers=self.make_header('Admin'),
+                json=dict(self.newPublication, invocationId=pre_id))
+            pids.append(response.json.get('created'))
+        self.client().post('/publications/{}/feedbacks'.format(pids[3]),
+                           headers=self.make_header('Curator'),
+                           json={'text': 'Please add a license.'})
+        invoc_id = randomString(12)
+        url = '/publications/{}/resume'.format(pids[0])
+
+        # the invocation id of another workflow is rejected #
+        response = self.client().post(url, json={'invocationId': pre_ids[1]},
+                                      headers=self.make_header('Admin'))
+        self.check_error(response, 409)
+        response = self.client().post(url, json={'invocationId': invoc_id},
+                                      headers=self.make_header('Admin'))
+        self.check_success(response)
+        publication = response.json['publication']
+        self.assertEqual(publication['status'], 'published')
+        self.assertEqual(publication['postInvocationId'], invoc_id)
+        # a repeated callback is answered without a change #
+        response = self.client().post(url, json={'invocationId': invoc_id},
+                                      headers=self.make_header('Admin'))
+        self.check_success(response)
+        self.assertEqual(response.json['publication'], publication)
+        response = self.client().post(url, json={'invocationId': 'other'},
+                                      headers=self.make_header('Admin'))
+        self.check_error(response, 409)
+        # the invocation id of the resumed workflow finds the publication #
+        response = self.client().get(
+            '/publications/by-invocation/{}'.format(invoc_id),
+            headers=self.make_header('Author'))
+        self.assertEqual(response.json['publication']['id'], pids[0])
+        response = self.client().get(
+            '/publications/{}/history'.format(pids[0]),
+            headers=self.make_header('Author'))
+        self.assertEqual([e['event'] for e in response.json['history']],
+                         ['publication.published'])
+
+        for body in ({}, {'invocationId': ''}, {'invocationId': 5}):
+            response = self.client().post(url, json=body,
+                                          headers=self.make_header('Admin'))
+            self.check_error(response, 400)
+        response = self.client().post(
+            '/publications/999999/resume', json={'invocationId': 'x'},
+            headers=self.make_header('Admin'))
+        self.check_error(response, 404)
+        response = self.client().post(url, json={'invocationId': invoc_id},
+                                      headers=self.make_header('Author'))
+        self.check_error(response, 403)
+
+        # the batch form reports every item #
+        invoc_ids = [randomString(12) for i in range(2)]
+        items = [{'id': pids[1], 'invocationId': invoc_ids[0]},
+                 {'id': pids[2], 'invocationId': invoc_ids[0]},
+                 {'id': pids[2], 'invocationId': pre_ids[3]},
+                 {'id': pids[2], 'invocationId': invoc_ids[1]},
+                 {'id': pids[3], 'invocationId': randomString(12)},
+                 {'id': 999999, 'invocationId': randomString(12)},
+                 {'id': pids[0], 'invocationId': invoc_id}]
+        response = self.client().post('/publications/resume', json=items,
+                                      headers=self.make_header('Admin'))
+        self.check_success(response)
+        results = response.json['results']
+        self.assertEqual((response.json['resumed'], response.json['failed']),
+                         (3, 4))
+        self.assertEqual([r.get('error') for r in results],
+                         [None, 409, 409, None, 409, 404, None])
+        self.assertEqual(results[1]['message'],
+                         'invocationId is already used')
+        self.assertEqual(results[2]['message'],
+                         'invocationId is already used')
+        self.assertEqual(results[4]['message'],
+                         'There are feedbacks to do before publication')
+        for pid, invoc in ((pids[1], invoc_ids[0]), (pids[2], invoc_ids[1])):
+            response = self.client().get('/publications/{}'.format(pid),
+                                         headers=self.make_header('Author'))
+            self.assertEqual(response.json['publication']['status'],
+                             'published')
+            self.assertEqual(
+                response.json['publication']['postInvocationId'], invoc)
+
+        for body in ([], [{'id': pids[1]}], {'id': pids[1]},
+                     [{'id': 'x', 'invocationId': 'y'}],
+                     [{'id': 1, 'invocationId': 'y'}] *
+                     (MAX_RESUME_SIZE + 1)):
+            response = self.client().post('/publications/resume', json=body,
+                                          headers=self.make_header('Admin'))
+            self.check_error(response, 400)
+        for pid in pids:
+            self.client().delete('/publications/{}'.format(pid),
+                                 headers=self.make_header('Admin'))
+
+    def test_resume_conflict(self):
+        pids = []
+        for i in range(2):
+            response = self.client().post(
+                '/publications', headers=self.make_header('Admin'),
+                json=dict(self.newPublication,
+                          invocationId=randomString(12)))
+            pids.append(response.json.get('created'))
+        invoc_id = randomString(12)
+        used = []
+
+        def use_invocation_id(session, flush_context, instances):
+            # another publication takes the id after the check #
+            if not used:
+                used.append(pids[1])
+                session.execute(
+                    text('UPDATE publication SET postInvocId = :invoc_id '
+                         'WHERE id = :id'), {'invoc_id': invoc_id,
+                                             'id': pids[1]})
+
+        event.listen(db.session, 'before_flush', use_invocation_id)
+        try:
+            response = self.client().post(
+                '/publications/{}/resume'.format(pids[0]),
+                json={'invocationId': invoc_id},
+                headers=self.make_header('Admin'))
+        finally:
+            event.remove(db.session, 'before_flush', use_invocation_id)
+        self.check_error(response, 409)
+        # the failed transaction is rolled back #
+        response = self.client().get('/publications/{}'.format(pids[0]),
+                                     headers=self.make_header('Author'))
+        self.assertIsNone(response.json['publication']['postInvocationId'])
+        self.assertNotEqual(response.json['publication']['status'],
+                            'published')
+        for pid in pids:
+            self.client().delete('/publications/{}'.format(pid),
+                                 headers=self.make_header('Admin'))
+
+    def test_json_encoders(self):
+        value = {'b': [1, None, True], 'a': 'caf\u00e9 \x7f\n"/\\'}
+        self.assertEqual(serializers.json_dumps(value),
+                         json.dumps(value, sort_keys=True,
+                                    separators=(',', ':')))
+        if serializers.orjson is not None:
+            dumps = serializers.get_encoder('orjson')
+            self.assertEqual(dumps(value), serializers.json_dumps(value))
+            self.assertEqual(dumps({'a': 'b/c'}), '{"a":"b/c"}')
+        with self.assertRaises(ValueError):
+            serializers.get_encoder('simplejson')
+
+    def read_events(self, stream, count):
+        ### reads the next count events of a server-sent event stream ###
+        events = []
+        while len(events) < count:
+            chunk = next(stream).decode()
+            if chunk.startswith('id: '):
+                events.append(json.loads(chunk.split('data: ', 1)[1]))
+        return events
+
+    def test_event_stream(self):
+        response = self.client().post('/publications',
+                                      json=self.newPublication,
+                                      headers=self.make_header('Admin'))
+        pid = response.json.get('created')
+        url = '/publications/{}'.format(pid)
+        other_pid = self.get_existing_pid()
+
+        response = self.client().get('{}/events'.format(url),
+                                     headers=self.make_header('Author'),
+                                     buffered=False)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        stream = iter(response.response)
+        self.assertEqual(next(stream), b'retry: 3000\n\n')
+
+        # events of other publications are not streamed #
+        other_fid = self.client().post(
+            '/publications/{}/feedbacks'.format(other_pid),
+            headers=self.make_header('Curator'),
+            json={'text': 'Please add a license.'}).json['created']
+        fid = self.client().post(
+            '{}/feedbacks'.format(url),
+            headers=self.make_header('Curator'),
+            json={'text': 'Please add a license.'}).json['created']
+        self.client().patch('{}/feedbacks/{}/done'.format(url, fid),
+                            headers=self.make_header('Author'),
+                            json={'done': True})
+        self.client().patch('{}/giveok'.format(url),
+                            headers=self.make_header('Author'))
+        self.client().patch('{}/publish'.format(url),
+                            headers=self.make_header('Admin'))
+        events = self.read_events(stream, 4)
+        response.close()
+        self.assertEqual([e['event'] for e in events],
+                         ['feedback.created', 'feedback.done',
+                          'publication.ok', 'publication.published'])
+        self.assertEqual(events[0]['feedbackId'], fid)
+        self.assertEqual(events[0]['status'], 'feedbacks to do')
+        self.assertEqual(events[1]['status'], 'finished')
+        self.assertEqual(events[3]['status'], 'published')
+        self.assertTrue(all(e['publicationId'] == pid for e in events))
+        self.assertEqual(event_broker.stats()['subscribers'], 0)
+
+        # a reconnecting client gets the events it has missed #
+        headers = self.make_header('Admin')
+        headers['Last-Event-ID'] = str(events[1]['id'])
+        response = self.client().get('/events', headers=headers,
+                                     buffered=False)
+        stream = iter(response.response)
+        next(stream)
+        self.assertEqual(self.read_events(stream, 2), events[2:])
+        response.close()
+
+        response = self.client().get('/events',
+                                     headers=self.make_header('Author'))
+        self.check_error(response, 403)
+        response = self.client().get('/publications/999999/events',
+                                     headers=self.make_header('Author'))
+        self.check_error(response, 404)
+        self.client().delete('/publications/{}/feedbacks/{}'.format(
+            other_pid, other_fid), headers=self.make_header('Curator'))
+        self.client().delete('{}/feedbacks/{}'.format(url, fid),
+                             headers=self.make_header('Curator'))
+        self.client().delete(url, headers=self.make_header('Admin'))
+
+    def test_event_broker(self):
+        broker = EventBroker(history_size=2, queue_size=1)
+        subscriber = broker.subscribe(publication_id=1)
+        broker.publish('publication.ok', {'publicationId': 2})
+        self.assertIsNone(subscriber.get(0))
+        broker.publish('publication.ok', {'publicationId': 1})
+        self.assertEqual(subscriber.get(0)['id'], 2)
+        # a client that does not keep up is marked for disconnection #
+        broker.publish('publication.published', {'publicationId': 1})
+        broker.publish('publication.exported', {'publicationId': 1})
+        self.assertTrue(subscriber.overflowed)
+        # only the last events are kept for resuming #
+        resumed = broker.subscribe(last_event_id=0)
+        self.assertEqual(resumed.get(0)['event'], 'publication.published')
+
+        # events of a rolled back transaction are not broadcast #
+        last_id = event_broker.stats()['lastEventId']
+        with self.app.app_context():
+            pub = db.session.query(Publication).first()
+            record_event('publication.ok', pub)
+            db.session.rollback()
+            db.session.commit()
+        self.assertEqual(event_broker.stats()['lastEventId'], last_id)
+
+    def test_feedback_batches(self):
+        response = self.client().post('/publications',
+                                      json=self.newPublication,
+                                      headers=self.make_header('Admin'))
+        pid = response.json.get('created')
+        url = '/publications/{}/feedbacks/batch'.format(pid)
+        other_pid = self.get_existing_pid()
+
+        texts = [{'text': 'item {}'.format(i)} for i in range(6)]
+        response, statements = self.record_statements(
+            'post', url, json=texts, headers=self.make_header('Curator'))
+        self.check_success(response)
+        fids = response.json['created']
+        self.assertEqual(len(fids), 6)
+        self.assertEqual(response.json['publication']['status'],
+                         'feedbacks to do')
+        self.assertEqual([f['text'] for f in response.json['feedbacks']],
+                         [t['text'] for t in texts])
+        # one update of the publication for all feedbacks #
+        self.assertEqual(len([s for s in statements
+                              if s.startswith('UPDATE publication')]), 1)
+
+        counts = []
+        for done_fids in (fids[:2], fids[2:]):
+            response, count = self.count_queries(
+                'patch', url,
+                json=[{'id': fid, 'done': True} for fid in done_fids],
+                headers=self.make_header('Author'))
+            self.check_success(response)
+            self.assertEqual(response.json['changed'], done_fids)
+            self.assertTrue(all(f['done']
+                                for f in response.json['feedbacks']))
+            counts.append(count)
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(response.json['publication']['status'], 'finished')
+
+        # nothing is changed, if one feedback is not valid #
+        other_fid = self.client().post(
+            '/publications/{}/feedbacks'.format(other_pid),
+            headers=self.make_header('Curator'),
+            json={'text': 'Please add a license.'}).json['created']
+        response = self.client().patch(
+            url, json=[{'id': fids[0], 'done': False},
+                       {'id': other_fid, 'done': True}],
+            headers=self.make_header('Author'))
+        self.check_error(response, 409)
+        response = self.client().delete(
+            url, json=[fids[0], 999999], headers=self.make_header('Curator'))
+        self.check_error(response, 404)
+        response = self.client().post(
+            url, json=[{'text': ''}], headers=self.make_header('Curator'))
+        self.check_error(response, 400)
+        for item in ({'id': fids[0]}, {'id': fids[0], 'done': 'yes'}):
+            response = self.client().patch(
+                url, json=[item], headers=self.make_header('Author'))
+            self.check_error(response, 400)
+        response = self.client().delete(
+            url, json=fids, headers=self.make_header('Author'))
+        self.check_error(response, 403)
+        response = self.client().get(
+            '/publications/{}/feedbacks'.format(pid),
+            headers=self.make_header('Author'))
+        self.assertEqual(len(response.json['feedbacks']), 6)
+        self.assertEqual(response.json['publication']['status'], 'finished')
+
+        response = self.client().patch(
+            url, json=[{'id': fids[0], 'done': False}],
+            headers=self.make_header('Author'))
+        self.assertEqual(response.json['publication']['status'],
+                         'feedbacks to do')
+        response = self.client().delete(
+            url, json=fids, headers=self.make_header('Curator'))
+        self.check_success(response)
+        self.assertEqual(response.json['deleted'], fids)
+        self.assertEqual(response.json['publication']['status'], 'finished')
+        response = self.client().get(
+            '/publications/{}/feedbacks'.format(pid),
+            headers=self.make_header('Author'))
+        self.assertEqual(response.json['feedbacks'], [])
+
+        self.client().delete(
+            '/publications/{}/feedbacks/{}'.format(other_pid, other_fid),
+            headers=self.make_header('Curator'))
+        self.client().delete('/publications/{}'.format(pid),
+                             headers=self.make_header('Admin'))
+
+    def test_search(self):
+        publication = dict(self.newPublication,
+                           datasetDisplayName='Quokka population survey')
+        response = self.client().post('/publications',
+                                      json=publication,
+                                      headers=self.make_header('Admin'))
+        pid = response.json.get('created')
+        url = '/publications/{}/feedbacks'.format(pid)
+        texts = ['Please add a quokka license to the dataset.',
+                 'The quokka licenses of the files differ.',
+                 'Quokka counts are missing <script>alert(1)</script>']
+        fids = self.client().post(
+            '{}/batch'.format(url), json=[{'text': t} for t in texts],
+            headers=self.make_header('Curator')).json['created']
+        self.client().patch('{}/{}/done'.format(url, fids[1]),
+                            json={'done': True},
+                            headers=self.make_header('Author'))
+
+        response, statements = self.record_statements(
+            'get', '/search?q=quokka%20license',
+            headers=self.make_header('Curator'))
+        self.check_success(response)
+        self.assertFalse(any('LIKE' in s for s in statements))
+        feedbacks = response.json['feedbacks']
+        # both forms of license match, ranked by relevance #
+        self.assertEqual(sorted(f['id'] for f in feedbacks), fids[:2])
+        self.assertLessEqual(feedbacks[0]['rank'], feedbacks[1]['rank'])
+        self.assertIn('<mark>license</mark>',
+                      [f for f in feedbacks if f['id'] == fids[0]][0]
+                      ['snippet'])
+        self.assertEqual(feedbacks[0]['publicationId'], pid)
+        self.assertEqual(response.json['publications'], [])
+
+        response = self.client().get('/search?q=quokka&done=false',
+                                     headers=self.make_header('Curator'))
+        self.assertEqual(sorted(f['id'] for f in response.json['feedbacks']),
+                         [fids[0], fids[2]])
+        # the text around the marks is HTML escaped #
+        self.assertEqual(
+            [f for f in response.json['feedbacks'] if f['id'] == fids[2]][0]
+            ['snippet'],
+            '<mark>Quokka</mark> counts are missing '
+            '&lt;script&gt;alert(1)&lt;/script&gt;')
+        self.assertEqual(response.json['publications'][0]['id'], pid)
+        self.assertEqual(response.json['publications'][0]['snippet'],
+                         '<mark>Quokka</mark> population survey')
+        response = self.client().get(
+            '/search?q=quokka&status=published&type=feedbacks',
+            headers=self.make_header('Curator'))
+        self.assertEqual(response.json['feedbacks'], [])
+        self.assertNotIn('publications', response.json)
+
+        # the index follows changes and deletions #
+        self.client().patch('{}/{}'.format(url, fids[2]),
+                            json={'text': 'Wombat counts are missing.'},
+                            headers=self.make_header('Curator'))
+        self.client().delete('{}/batch'.format(url), json=fids[:1],
+                             headers=self.make_header('Curator'))
+        response = self.client().get('/search?q=quokka&type=feedbacks',
+                                     headers=self.make_header('Curator'))
+        self.assertEqual([f['id'] for f in response.json['feedbacks']],
+                         [fids[1]])
+        response = self.client().get('/search?q=wombat&limit=1',
+                                     headers=self.make_header('Curator'))
+        self.assertEqual([f['id'] for f in response.json['feedbacks']],
+                         [fids[2]])
+
+        for query in ('', 'quokka"', 'quokka&type=roles', 'quokka&done=x'):
+            response = self.client().get('/search?q={}'.format(query),
+                                         headers=self.make_header('Curator'))
+            self.check_error(response, 400)
+
+        self.client().delete('{}/batch'.format(url), json=fids[1:],
+                             headers=self.make_header('Curator'))
+        self.client().delete('/publications/{}'.format(pid),
+                             headers=self.make_header('Admin'))
+        response = self.client().get('/search?q=quokka',
+                                     headers=self.make_header('Curator'))
+        self.assertEqual(response.json['publications'], [])
+
+    def test_stats(self):
+        response, count = self.count_queries(
+            'get', '/stats', headers=self.make_header('Admin'))
+        self.check_success(response)
+        before = response.json
+        # a fixed number of aggregate queries #
+        self.assertLessEqual(count, 6)
+
+        response = self.client().post('/publications',
+                                      json=self.newPublication,
+                                      headers=self.make_header('Admin'))
+        pid = response.json.get('created')
+        curator = encode_jwt({'roles': ['Curator'], 'name': 'Curator',
+                              'id': 424242})
+        fids = self.client().post(
+            '/publications/{}/feedbacks/batch'.format(pid),
+            json=[{'text': 'first'}, {'text': 'second'}],
+            headers={'Authorization': 'bearer {}'.format(curator)}
+        ).json['created']
+        self.client().patch(
+            '/publications/{}/feedbacks/batch'.format(pid),
+            json=[{'id': fid, 'done': True} for fid in fids],
+            headers=self.make_header('Author'))
+        self.client().patch('/publications/{}/giveok'.format(pid),
+                            headers=self.make_header('Author'))
+        self.client().patch('/publications/{}/publish'.format(pid),
+                            headers=self.make_header('Admin'))
+
+        response, count = self.count_queries(
+            'get', '/stats', headers=self.make_header('Admin'))
+        self.check_success(response)
+        after = response.json
+        self.assertLessEqual(count, 6)
+        self.assertEqual(after['publications']['total'],
+                         before['publications']['total'] + 1)
+        self.assertEqual(after['publications']['byStatus']['published'],
+                         before['publications']['byStatus'].get(
+                             'published', 0) + 1)
+        self.assertEqual(after['feedbacks']['done'],
+                         before['feedbacks']['done'] + 2)
+        self.assertEqual(after['feedbacks']['open'],
+                         before['feedbacks']['open'])
+        self.assertIn({'id': 424242, 'name': None, 'feedbacks': 2,
+                       'open': 0, 'done': 2}, after['curators'])
+        self.assertGreaterEqual(after['medianSeconds']['okAuthor'], 0)
+        self.assertGreaterEqual(after['medianSeconds']['published'], 0)
+
+        response = self.client().get('/stats',
+                                     headers=self.make_header('Curator'))
+        self.check_error(response, 403)
+        self.client().delete('/publications/{}/feedbacks/batch'.format(pid),
+                             json=fids, headers=self.make_header('Curator'))
+        self.client().delete('/publications/{}'.format(pid),
+                             headers=self.make_header('Admin'))
+
     def test_get_feedbacks_of_non_existing_publication(self):
         response = self.client().get(
             '/publications/999/feedbacks',
@@ -391,6 +1773,242 @@ class Test_Pubworkflow(unittest.TestCase):
         )
         self.check_error(response, 409)
 
+    def test_stored_status(self):
+        response = self.client().post('/publications',
+                                      json=self.newPublication,
+                                      headers=self.make_header('Admin'))
+        pid = response.json.get('created')
+        fids = []
+        for body in ('first thing to do', 'second thing to do'):
+            response = self.client().post(
+                '/publications/{}/feedbacks'.format(pid),
+                json={'text': body},
+                headers=self.make_header('Curator'))
+            fids.append(response.json.get('created'))
+
+        # one open feedback left #
+        self.client().patch(
+            '/publications/{}/feedbacks/{}/done'.format(pid, fids[0]),
+            json={'done': True},
+            headers=self.make_header('Author'))
+        response = self.client().get(
+            '/publications?status=feedbacks to do&databaseId=254',
+            headers=self.make_header('Admin'))
+        self.assertIn(pid, [p['id'] for p in response.json['publications']])
+
+        # deleting the open feedback finishes the publication #
+        self.client().delete(
+            '/publications/{}/feedbacks/{}'.format(pid, fids[1]),
+            headers=self.make_header('Curator'))
+        response = self.client().get(
+            '/publications/{}'.format(pid),
+            headers=self.make_header('Author'))
+        self.assertEqual(response.json['publication']['status'], 'finished')
+
+        # backfill repairs a stored status, which went out of sync #
+        with self.app.app_context():
+            with db.engine.begin() as connection:
+                connection.execute(
+                    text("UPDATE publication SET status = 'feedbacks to do', "
+                         'openFeedbacks = 2 WHERE id = :id'), {'id': pid})
+        result = self.app.test_cli_runner().invoke(args=['backfill-status'])
+        self.assertEqual(result.exit_code, 0)
+        with self.app.app_context():
+            pub = Publication.query.get(pid)
+            self.assertEqual(pub.status, 'finished')
+            self.assertEqual(pub.openFeedbacks, 0)
+
+        self.client().delete(
+            '/publications/{}/feedbacks/{}'.format(pid, fids[0]),
+            headers=self.make_header('Curator'))
+        self.client().delete('/publications/{}'.format(pid),
+                             headers=self.make_header('Admin'))
+
+    def test_query_count_of_feedback_lists(self):
+        response = self.client().post('/publications',
+                                      json=self.newPublication,
+                                      headers=self.make_header('Admin'))
+        pid = response.json.get('created')
+        url = '/publications/{}/feedbacks'.format(pid)
+
+        counts = []
+        fids = []
+        # feedbacks of different curators #
+        for author_id in range(7, 13):
+            curator = encode_jwt({'roles': ['Curator'],
+                                  'name': 'Curator',
+                                  'id': author_id})
+            response = self.client().post(
+                url,
+                json={'text': 'feedback of curator {}'.format(author_id)},
+                headers={'Authorization': 'bearer {}'.format(curator)})
+            fids.append(response.json.get('created'))
+            if len(fids) in (1, 6):
+                response, count = self.count_queries(
+                    'get', url, headers=self.make_header('Author'))
+                self.check_success(response)
+                self.assertEqual(len(response.json['feedbacks']), len(fids))
+                counts.append(count)
+        # the number of queries does not grow with the feedbacks, #
+        # the first one reads the version for the ETag #
+        self.assertEqual(counts[0], counts[1])
+        self.assertLessEqual(counts[1], 3)
+
+        response, count = self.count_queries(
+            'get', '{}/{}'.format(url, fids[0]),
+            headers=self.make_header('Author'))
+        self.check_success(response)
+        self.assertEqual(count, 2)
+
+        response, count = self.count_queries(
+            'get', '/publications?limit=20',
+            headers=self.make_header('Admin'))
+        self.check_success(response)
+        self.assertEqual(count, 1)
+
+        for fid in fids:
+            self.client().delete('{}/{}'.format(url, fid),
+                                 headers=self.make_header('Curator'))
+        self.client().delete('/publications/{}'.format(pid),
+                             headers=self.make_header('Admin'))
+
+    def test_sqlite_profile(self):
+        with self.app.app_context():
+            journal_mode = db.session.execute(
+                'PRAGMA journal_mode').scalar()
+            synchronous = db.session.execute('PRAGMA synchronous').scalar()
+            busy_timeout = db.session.execute(
+                'PRAGMA busy_timeout').scalar()
+        self.assertEqual(journal_mode, 'wal')
+        # 1 = NORMAL #
+        self.assertEqual(synchronous, 1)
+        self.assertEqual(busy_timeout, 5000)
+
+    def test_sqlite_profile_per_app(self):
+        directory = tempfile.mkdtemp()
+        try:
+            paths = [os.path.join(directory, '{}.db'.format(name))
+                     for name in ('first', 'second')]
+            apps = [create_app({'SQLALCHEMY_DATABASE_URI':
+                                'sqlite:///{}'.format(path)})
+                    for path in paths]
+            # the second app doesn't change the pragmas of the first #
+            os.environ['SQLITE_BUSY_TIMEOUT'] = '1234'
+            try:
+                apps.append(create_app({'SQLALCHEMY_DATABASE_URI':
+                                        'sqlite:///{}'.format(paths[1])}))
+            finally:
+                del os.environ['SQLITE_BUSY_TIMEOUT']
+            timeouts = []
+            for factory_app in (apps[0], apps[2]):
+                with factory_app.app_context():
+                    timeouts.append(db.session.execute(
+                        'PRAGMA busy_timeout').scalar())
+                    db.session.remove()
+            self.assertEqual(timeouts, [5000, 1234])
+        finally:
+            db.app = app
+            shutil.rmtree(directory, True)
+        # the bundled database keeps its journal mode by default #
+        self.assertNotIn('journal_mode',
+                         get_sqlite_pragmas(bundled_database_path))
+        os.environ['SQLITE_JOURNAL_MODE'] = 'WAL'
+        try:
+            pragmas = get_sqlite_pragmas(bundled_database_path)
+        finally:
+            del os.environ['SQLITE_JOURNAL_MODE']
+        self.assertEqual(pragmas['journal_mode'], 'WAL')
+
+    def test_engine_options(self):
+        self.assertEqual(get_engine_options('sqlite:///pubworkflow.db'), {})
+        os.environ['DATABASE_POOL_SIZE'] = '20'
+        try:
+            options = get_engine_options('postgresql://localhost/pubs')
+        finally:
+            del os.environ['DATABASE_POOL_SIZE']
+        self.assertEqual(options['pool_size'], 20)
+        self.assertTrue(options['pool_pre_ping'])
+
+    def test_create_app_without_database_io(self):
+        project_dir = os.path.dirname(os.path.abspath(__file__))
+        path = os.path.join(project_dir, 'factory_test.db')
+        if os.path.exists(path):
+            os.remove(path)
+        try:
+            factory_app = create_app(
+                {'SQLALCHEMY_DATABASE_URI': 'sqlite:///{}'.format(path)})
+            self.assertFalse(os.path.exists(path))
+
+            runner = factory_app.test_cli_runner()
+            result = runner.invoke(args=['check-schema'])
+            self.assertNotEqual(result.exit_code, 0)
+            result = runner.invoke(args=['create-db'])
+            self.assertEqual(result.exit_code, 0)
+            result = runner.invoke(args=['check-schema'])
+            self.assertEqual(result.exit_code, 0)
+            # the search indexes are created with the tables #
+            connection = sqlite3.connect(path)
+            names = [row[0] for row in connection.execute(
+                "SELECT name FROM sqlite_master WHERE name LIKE '%fts%'")]
+            connection.close()
+            for name in ('feedback_fts', 'feedback_fts_insert',
+                         'publication_fts', 'publication_fts_update'):
+                self.assertIn(name, names)
+        finally:
+            db.app = self.app
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+    def test_metrics(self):
+        metrics.clear()
+        pid = self.get_existing_pid()
+        for i in range(2):
+            self.client().get('/publications/{}'.format(pid),
+                              headers=self.make_header('Author'))
+        self.client().get('/publications/{}'.format(pid))
+        self.client().get('/unknown')
+
+        response = self.client().get('/metrics',
+                                     headers=self.make_header('Admin'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/plain')
+        lines = response.get_data(as_text=True).splitlines()
+        labels = 'method="GET",endpoint="/publications/<int:pub_id>"'
+        for line in (
+                'pubworkflow_requests_total{{{},status="200"}} 2',
+                'pubworkflow_requests_total{{{},status="401"}} 1',
+                'pubworkflow_request_duration_seconds_count{{{}}} 3',
+                'pubworkflow_request_duration_seconds_bucket'
+                '{{{},le="+Inf"}} 3',
+                'pubworkflow_request_auth_seconds_count{{{}}} 3',
+                'pubworkflow_request_sql_statements_bucket'
+                '{{{},le="0"}} 1'):
+            self.assertIn(line.format(labels), lines)
+        self.assertIn('pubworkflow_requests_total{method="GET",'
+                      'endpoint="unmatched",status="404"} 1', lines)
+        # at least the version lookup of both authorized requests #
+        sql = [line for line in lines if line.startswith(
+            'pubworkflow_request_sql_statements_sum{{{}}}'.format(labels))]
+        self.assertGreaterEqual(float(sql[0].split()[-1]), 2)
+        self.assertIn('# TYPE pubworkflow_token_cache_hits_total counter',
+                      lines)
+
+        response = self.client().get('/metrics',
+                                     headers=self.make_header('Curator'))
+        self.check_error(response, 403)
+
+        # slow requests are logged #
+        self.app.config['SLOW_REQUEST_SECONDS'] = 0
+        try:
+            with self.assertLogs(self.app.logger, 'WARNING') as logs:
+                self.client().get('/publications/{}'.format(pid),
+                                  headers=self.make_header('Author'))
+        finally:
+            self.app.config['SLOW_REQUEST_SECONDS'] = None
+        self.assertIn('slow request GET /publications/{}'.format(pid),
+                      logs.output[0])
+
     def test_no_header(self):
         response = self.client().get('/publications')
         self.check_error(response, 401, 'authorization header is missing')
@@ -422,6 +2040,36 @@ class Test_Pubworkflow(unittest.TestCase):
             403,
             'required permission {} is not granted'.format('get:publications'))
 
+    def test_token_cache(self):
+        headers = self.make_header('Admin')
+        self.client().get('/auth/cache', headers=headers)
+        before = self.client().get('/auth/cache', headers=headers)
+        self.check_success(before)
+        after = self.client().get('/auth/cache', headers=headers)
+        self.assertEqual(after.json['cache']['hits'],
+                         before.json['cache']['hits'] + 1)
+        self.assertEqual(after.json['cache']['misses'],
+                         before.json['cache']['misses'])
+
+        # permissions are checked for cached tokens as well #
+        self.client().get('/publications', headers=self.make_header('Author'))
+        response = self.client().get('/publications',
+                                     headers=self.make_header('Author'))
+        self.check_error(response, 403)
+
+    def test_token_cache_eviction(self):
+        cache = TokenCache(2)
+        payload = {'exp': 1, 'roles': []}
+        cache.put('expired', payload, frozenset())
+        self.assertIsNone(cache.get('expired'))
+
+        payload = decode_jwt(self.admin_token)
+        for token in ('a', 'b', 'c'):
+            cache.put(token, payload, frozenset(['add:user']))
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('c'), (payload, frozenset(['add:user'])))
+        self.assertEqual(cache.stats()['size'], 2)
+
     def test_rights_get_publications(self):
         # check rights of GET /publications #
         response = self.client().get(